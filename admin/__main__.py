@@ -1,31 +1,41 @@
 # admin/__main__.py
-from flask import Flask
-from .payment_gateway import PaymentGateway, PaymentMethod, PaymentStatus
-import logging
-
-__all__ = ['PaymentGateway', 'PaymentMethod', 'PaymentStatus', 'start_admin']
+from .payment_gateway import PaymentGateway, PaymentMethod, PaymentStatus, QR_FORMATS
+from .qr_cache import QRCodeCache
+from .http_client import GatewayClient, GatewayError, CircuitBreaker, CircuitOpenError
+from .stub_gateway import create_stub_app, serve_stub_in_thread, serve_stub_in_process
+from .metrics import (REGISTRY, HTTP_REQUEST_SECONDS, GATEWAY_CALL_SECONDS, PAYMENT_STATUS_TOTAL,
+                      QR_RENDER_SECONDS, STORE_OPERATION_SECONDS, CALLBACK_VERIFY_TOTAL)
+from .signing import CallbackVerifier, ReplayCache, StoreReplayCache, sign_callback
+from .profiler import SamplingProfiler, PROFILER
+from .log import configure_logger
+import os
+
+__all__ = ['PaymentGateway', 'PaymentMethod', 'PaymentStatus', 'QR_FORMATS',
+           'QRCodeCache', 'GatewayClient', 'GatewayError', 'CircuitBreaker',
+           'CircuitOpenError', 'create_stub_app', 'serve_stub_in_thread',
+           'serve_stub_in_process', 'REGISTRY', 'HTTP_REQUEST_SECONDS',
+           'GATEWAY_CALL_SECONDS', 'PAYMENT_STATUS_TOTAL', 'QR_RENDER_SECONDS',
+           'STORE_OPERATION_SECONDS', 'CALLBACK_VERIFY_TOTAL', 'CallbackVerifier',
+           'ReplayCache', 'StoreReplayCache', 'sign_callback', 'SamplingProfiler', 'PROFILER', 'start_admin']
 
 def start_admin():
-    """启动 Admin 服务"""
+    """启动 Admin 服务(本地模拟支付网关)"""
     # 初始化日志
-    logger = logging.getLogger("admin")
-    logger.setLevel(logging.INFO)
-    handler = logging.StreamHandler()
-    formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
-    handler.setFormatter(formatter)
-    logger.addHandler(handler)
+    logger = configure_logger("admin")
 
     logger.info("Starting Admin Service...")
 
-    # 初始化 Flask 应用
-    app = Flask(__name__)
-
-    @app.route("/")
-    def index():
-        return "Admin Service is running!"
+    # 初始化 Flask 应用(模拟网关的行为可通过环境变量调整)
+    app = create_stub_app(
+        api_secret=os.getenv("API_SECRET", "your-secret-key"),
+        latency_ms=float(os.getenv("STUB_LATENCY_MS", "0")),
+        failure_rate=float(os.getenv("STUB_FAILURE_RATE", "0")),
+        callback_url=os.getenv("STUB_CALLBACK_URL", "http://localhost:5000/api/payment_callback")
+    )
 
     # 启动服务
-    app.run(debug=True, host="127.0.0.1", port=5001)
+    # STUB_DEBUG=1 时开启调试模式(自动重载)；默认多线程运行，便于并发压测
+    app.run(debug=os.getenv("STUB_DEBUG", "0") == "1", host="127.0.0.1", port=5001, threaded=True)
 
 
 
@@ -0,0 +1,170 @@
+import asyncio
+import random
+import logging
+from typing import Dict, Optional
+
+from .payment_gateway import PaymentGateway, PaymentMethod
+from .http_client import RETRY_STATUS, CircuitBreaker, GatewayCall
+from .metrics import GATEWAY_CALL_SECONDS, PAYMENT_STATUS_TOTAL
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncGatewayClient:
+    """支付网关异步 HTTP 客户端(基于 httpx.AsyncClient)
+
+    与 GatewayClient 行为一致(共用 GatewayCall 重试循环)：长连接池、连接/读取超时、幂等调用抖动退避重试、熔断。
+    单个事件循环内可同时保持数百个进行中的网关请求。
+    """
+
+    RETRY_STATUS = RETRY_STATUS
+
+    def __init__(self, base_url: str, api_secret: str, pool_size: int = 200,
+                 connect_timeout: float = 2.0, read_timeout: float = 5.0,
+                 max_retries: int = 3, backoff_base: float = 0.1, backoff_max: float = 2.0,
+                 breaker: Optional[CircuitBreaker] = None):
+        try:
+            import httpx
+        except ImportError as e:
+            raise ImportError("AsyncPaymentGateway 的真实模式需要安装 httpx: pip install httpx") from e
+
+        self._transport_errors = httpx.HTTPError
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.breaker = breaker or CircuitBreaker()
+        self.client = httpx.AsyncClient(
+            base_url=base_url.rstrip("/"),
+            headers={"X-Api-Key": api_secret},
+            timeout=httpx.Timeout(read_timeout, connect=connect_timeout),
+            limits=httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size)
+        )
+
+    async def request(self, method: str, path: str, idempotent: bool = False, **kwargs) -> Dict:
+        call = GatewayCall(self.breaker, method, path, self.max_retries + 1 if idempotent else 1, self._backoff)
+        for delay in call:
+            if delay:
+                await asyncio.sleep(delay)
+            with call.attempt():
+                try:
+                    response = await self.client.request(method, path, **kwargs)
+                except self._transport_errors as e:
+                    call.transport_failed(e)
+                else:
+                    if call.completed(response.status_code):
+                        return call.decode(response.json)
+        raise call.error
+
+    def _backoff(self, attempt: int) -> float:
+        """全抖动指数退避"""
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+
+    async def aclose(self) -> None:
+        await self.client.aclose()
+
+
+class AsyncPaymentGateway(PaymentGateway):
+    """异步支付网关
+
+    方法表与 PaymentGateway 相同(payment_methods 分发)，处理函数均为协程；
+    模拟模式复用同步实现的结果，二维码生成与回调验签仍为同步方法。
+    """
+
+    def __init__(self, config: Dict):
+        super().__init__(config)
+        self.payment_methods = {
+            PaymentMethod.QR_CODE: self._process_qr_payment_async,
+            PaymentMethod.DIRECT: self._process_direct_payment_async,
+            PaymentMethod.WECHAT: self._process_wechat_payment_async,
+            PaymentMethod.ALIPAY: self._process_alipay_payment_async
+        }
+        self._async_client: Optional[AsyncGatewayClient] = None
+
+    @property
+    def async_client(self) -> AsyncGatewayClient:
+        """异步客户端(首次使用时在当前事件循环中创建)"""
+        if self._async_client is None:
+            self._async_client = AsyncGatewayClient(
+                self.config.get("gateway_url", ""),
+                self.api_secret,
+                pool_size=self.config.get("async_pool_size", 200),
+                connect_timeout=self.config.get("connect_timeout", 2.0),
+                read_timeout=self.config.get("read_timeout", 5.0),
+                max_retries=self.config.get("max_retries", 3),
+                breaker=CircuitBreaker(
+                    failure_threshold=self.config.get("breaker_threshold", 5),
+                    reset_timeout=self.config.get("breaker_reset_timeout", 30.0)
+                )
+            )
+        return self._async_client
+
+    @GATEWAY_CALL_SECONDS.timed(("async_process_payment",))
+    async def process_payment(self, order_id: str, amount: float,
+                              method: PaymentMethod, **kwargs) -> Dict:
+        """统一支付处理接口(异步)"""
+        logger.info(f"开始处理支付: 订单ID={order_id}, 金额={amount}, 方式={method}")
+
+        if method not in self.payment_methods:
+            error_msg = f"不支持的支付方式: {method}"
+            logger.error(error_msg)
+            raise ValueError(error_msg)
+
+        try:
+            processor = self.payment_methods[method]
+            result = await processor(order_id, amount, **kwargs)
+            if "status" in result:
+                PAYMENT_STATUS_TOTAL.inc((result["status"],))
+            logger.info(f"支付处理成功: 订单ID={order_id}, 结果={result}")
+            return result
+        except Exception as e:
+            logger.error(f"支付处理失败: 订单ID={order_id}, 错误={str(e)}")
+            raise
+
+    async def _remote_payment_async(self, order_id: str, amount: float, method: PaymentMethod) -> Dict:
+        return await self.async_client.request(
+            "POST", "/api/payments", idempotent=True,
+            json={"order_id": order_id, "amount": amount, "method": method.value},
+            headers={"Idempotency-Key": order_id}
+        )
+
+    async def _process_qr_payment_async(self, order_id: str, amount: float) -> Dict:
+        # 二维码渲染为 CPU 密集操作，放到线程中执行避免阻塞事件循环
+        return await asyncio.to_thread(self._process_qr_payment, order_id, amount)
+
+    async def _process_direct_payment_async(self, order_id: str, amount: float) -> Dict:
+        if self.mock_mode:
+            return self._process_direct_payment(order_id, amount)
+        return await self._remote_payment_async(order_id, amount, PaymentMethod.DIRECT)
+
+    async def _process_wechat_payment_async(self, order_id: str, amount: float) -> Dict:
+        if self.mock_mode:
+            return self._process_wechat_payment(order_id, amount)
+        return await self._remote_payment_async(order_id, amount, PaymentMethod.WECHAT)
+
+    async def _process_alipay_payment_async(self, order_id: str, amount: float) -> Dict:
+        if self.mock_mode:
+            return self._process_alipay_payment(order_id, amount)
+        return await self._remote_payment_async(order_id, amount, PaymentMethod.ALIPAY)
+
+    @GATEWAY_CALL_SECONDS.timed(("async_check_payment_status",))
+    async def check_payment_status(self, order_id: str) -> Dict:
+        """检查支付状态(异步)"""
+        if self.mock_mode:
+            return self._mock_payment_status(order_id)
+        return await self.async_client.request("GET", f"/api/payments/{order_id}", idempotent=True)
+
+    @GATEWAY_CALL_SECONDS.timed(("async_refund",))
+    async def refund(self, order_id: str, amount: float) -> Dict:
+        """处理退款(异步)"""
+        if self.mock_mode:
+            return self._mock_refund(order_id, amount)
+        return await self.async_client.request(
+            "POST", "/api/refunds", idempotent=True,
+            json={"order_id": order_id, "amount": amount},
+            headers={"Idempotency-Key": f"refund-{order_id}"}
+        )
+
+    async def aclose(self) -> None:
+        if self._async_client is not None:
+            await self._async_client.aclose()
+            self._async_client = None
@@ -0,0 +1,227 @@
+import random
+import threading
+import time
+import logging
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class GatewayError(Exception):
+    """支付网关调用失败"""
+
+    def __init__(self, message: str, status_code: Optional[int] = None):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+class CircuitOpenError(GatewayError):
+    """熔断器打开，请求被快速拒绝"""
+
+
+class CircuitBreaker:
+    """熔断器
+
+    连续失败 failure_threshold 次后打开，reset_timeout 秒内直接拒绝请求；
+    之后进入半开状态放行一个探测请求，成功则关闭，失败则重新打开。
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self._probing = False
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.OPEN and time.monotonic() - self.opened_at >= self.reset_timeout:
+                self.state = self.HALF_OPEN
+                self._probing = False
+            if self.state == self.HALF_OPEN and not self._probing:
+                self._probing = True
+                return True
+            return False
+
+    def record_success(self) -> None:
+        with self._lock:
+            self.state = self.CLOSED
+            self.failures = 0
+            self._probing = False
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self.failures += 1
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                if self.state != self.OPEN:
+                    logger.warning(f"支付网关熔断器打开: 连续失败{self.failures}次")
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+                self._probing = False
+
+    def release(self) -> None:
+        """放行的请求未记录成功或失败就中止(如被取消、抛出意外异常)时调用，半开状态下允许下一个探测请求"""
+        with self._lock:
+            self._probing = False
+
+
+RETRY_STATUS = (500, 502, 503, 504)
+
+
+class GatewayCall:
+    """一次网关调用的重试、熔断与响应处理(GatewayClient 与 AsyncGatewayClient 共用)
+
+    调用方只负责发送请求与等待退避，同步与异步客户端的重试循环因此保持一致:
+
+        call = GatewayCall(breaker, method, path, attempts, backoff)
+        for delay in call:               # 首次为 0，之后为退避时长
+            sleep(delay)
+            with call.attempt():         # 熔断打开时抛出 CircuitOpenError
+                try:
+                    response = send()
+                except transport_errors as e:
+                    call.transport_failed(e)
+                else:
+                    if call.completed(response.status_code):
+                        return call.decode(response.json)
+        raise call.error
+    """
+
+    def __init__(self, breaker: CircuitBreaker, method: str, path: str, attempts: int,
+                 backoff: Callable[[int], float]):
+        """
+        :param attempts: 最多尝试次数(非幂等调用为1)
+        :param backoff: 第 n 次失败后的退避时长(秒)
+        """
+        self.breaker = breaker
+        self.method = method
+        self.path = path
+        self.attempts = attempts
+        self.backoff = backoff
+        self.error: Optional[GatewayError] = None
+        self.status_code: Optional[int] = None
+        self._recorded = False
+
+    def __iter__(self) -> Iterator[float]:
+        for attempt in range(self.attempts):
+            if attempt == 0:
+                yield 0.0
+                continue
+            delay = self.backoff(attempt - 1)
+            logger.warning(f"支付网关调用重试: {self.method} {self.path}, 第{attempt}次失败, {delay:.2f}秒后重试")
+            yield delay
+
+    @contextmanager
+    def attempt(self) -> Iterator[None]:
+        """一次请求：进入时向熔断器申请放行；未记录成功或失败就退出(异常、取消)时归还半开探测名额"""
+        if not self.breaker.allow():
+            raise CircuitOpenError("支付网关熔断中，请稍后重试")
+        self._recorded = False
+        try:
+            yield
+        finally:
+            if not self._recorded:
+                self.breaker.release()
+
+    def transport_failed(self, error: Exception) -> None:
+        """连接错误、超时等传输层失败，可重试"""
+        self._record(False)
+        self.error = GatewayError(f"支付网关连接失败: {error}")
+
+    def completed(self, status_code: int) -> bool:
+        """处理响应状态码：5xx 记为失败并返回 False(可重试)；4xx 抛出 GatewayError；其余返回 True"""
+        self.status_code = status_code
+        if status_code in RETRY_STATUS:
+            self._record(False)
+            self.error = GatewayError(f"支付网关返回错误: HTTP {status_code}", status_code)
+            return False
+        self._record(True)
+        if status_code >= 400:
+            raise GatewayError(f"支付网关拒绝请求: HTTP {status_code}", status_code)
+        return True
+
+    def decode(self, parse: Callable[[], Dict]) -> Dict:
+        """解析 JSON 响应体，无法解析时抛出 GatewayError"""
+        try:
+            return parse()
+        except ValueError as e:
+            raise GatewayError(f"支付网关响应无法解析: {e}", self.status_code) from e
+
+    def _record(self, success: bool) -> None:
+        self._recorded = True
+        if success:
+            self.breaker.record_success()
+        else:
+            self.breaker.record_failure()
+
+
+class GatewayClient:
+    """支付网关 HTTP 客户端
+
+    - 共享 requests.Session，连接池按 worker 配置，保持长连接
+    - 每次调用独立的连接/读取超时
+    - 幂等调用在连接错误、超时和 5xx 时按抖动指数退避重试(重试循环见 GatewayCall)
+    - 熔断器在网关持续故障时快速失败
+    """
+
+    RETRY_STATUS = RETRY_STATUS
+
+    def __init__(self, base_url: str, api_secret: str, pool_size: int = 20,
+                 connect_timeout: float = 2.0, read_timeout: float = 5.0,
+                 max_retries: int = 3, backoff_base: float = 0.1, backoff_max: float = 2.0,
+                 breaker: Optional[CircuitBreaker] = None):
+        self.base_url = base_url.rstrip("/")
+        self.api_secret = api_secret
+        self.timeout = (connect_timeout, read_timeout)
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.breaker = breaker or CircuitBreaker()
+
+        # requests 在创建客户端时才导入(仅真实模式需要)
+        import requests
+        from requests.adapters import HTTPAdapter
+        self._transport_errors = requests.RequestException
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=0)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.session.headers.update({"X-Api-Key": api_secret})
+
+    def _backoff(self, attempt: int) -> float:
+        """全抖动指数退避"""
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+
+    def request(self, method: str, path: str, idempotent: bool = False,
+                timeout: Optional[tuple] = None, **kwargs) -> Dict:
+        """
+        发送请求并返回 JSON 响应体
+        :param idempotent: 是否允许失败重试
+        :param timeout: (连接超时, 读取超时)，默认使用客户端配置
+        """
+        url = f"{self.base_url}{path}"
+        call = GatewayCall(self.breaker, method, path, self.max_retries + 1 if idempotent else 1, self._backoff)
+        for delay in call:
+            if delay:
+                time.sleep(delay)
+            with call.attempt():
+                try:
+                    response = self.session.request(method, url, timeout=timeout or self.timeout, **kwargs)
+                except self._transport_errors as e:
+                    call.transport_failed(e)
+                else:
+                    if call.completed(response.status_code):
+                        return call.decode(response.json)
+        raise call.error
+
+    def close(self) -> None:
+        self.session.close()
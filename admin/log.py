@@ -0,0 +1,15 @@
+import logging
+
+_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+
+
+def configure_logger(name: str, level: int = logging.INFO) -> logging.Logger:
+    """为 logger 添加控制台输出(幂等：重复导入或重复调用不会重复添加 handler，日志不会重复打印)"""
+    logger = logging.getLogger(name)
+    logger.setLevel(level)
+    if not any(getattr(handler, "_admin_console", False) for handler in logger.handlers):
+        handler = logging.StreamHandler()
+        handler.setFormatter(logging.Formatter(_FORMAT))
+        handler._admin_console = True
+        logger.addHandler(handler)
+    return logger
@@ -1,20 +1,19 @@
 import uuid
 import time
-import requests
-import qrcode
 import io
 import base64
-import logging
-from typing import Dict, Optional
+import importlib
+import threading
+from typing import Dict, Iterable, List, Optional, Tuple
 from enum import Enum
+from .qr_cache import QRCodeCache
+from .http_client import GatewayClient, CircuitBreaker
+from .metrics import GATEWAY_CALL_SECONDS, PAYMENT_STATUS_TOTAL, QR_RENDER_SECONDS, CALLBACK_VERIFY_TOTAL
+from .signing import CallbackVerifier, ReplayCache, VALID
+from .log import configure_logger
 
 # 初始化日志
-logger = logging.getLogger(__name__)
-logger.setLevel(logging.INFO)
-handler = logging.StreamHandler()
-formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
-handler.setFormatter(formatter)
-logger.addHandler(handler)
+logger = configure_logger(__name__)
 
 class PaymentMethod(Enum):
     QR_CODE = "qr_code"
@@ -28,6 +27,44 @@ class PaymentStatus(Enum):
     FAILED = "failed"
     REFUNDED = "refunded"
 
+QR_FORMATS = ("png", "svg", "matrix")
+
+
+def render_qr_code(payment_url: str, fmt: str = "png",
+                   box_size: int = 10, border: int = 4):
+    """渲染二维码(模块级函数，便于在进程池中执行)
+
+    :param fmt: png 返回 data URI，svg 返回 SVG 文本，matrix 返回 0/1 行字符串列表
+    """
+    import qrcode  # 首次渲染时才加载 qrcode/PIL，不拖慢启动
+
+    qr = qrcode.QRCode(
+        version=1,
+        error_correction=qrcode.constants.ERROR_CORRECT_L,
+        box_size=box_size,
+        border=border,
+    )
+    qr.add_data(payment_url)
+    qr.make(fit=True)
+
+    if fmt == "matrix":
+        return ["".join("1" if cell else "0" for cell in row) for row in qr.get_matrix()]
+    if fmt == "svg":
+        from qrcode.image.svg import SvgPathImage
+        img = qr.make_image(image_factory=SvgPathImage)
+        return img.to_string(encoding="unicode")
+
+    img = qr.make_image(fill_color="black", back_color="white")
+    buffer = io.BytesIO()
+    img.save(buffer, format='PNG')
+    img_str = base64.b64encode(buffer.getvalue()).decode()
+    return f"data:image/png;base64,{img_str}"
+
+
+def _render_batch_item(item: Tuple[str, str, int, int]):
+    return render_qr_code(*item)
+
+
 class PaymentGateway:
     def __init__(self, config: Dict):
         """
@@ -43,7 +80,64 @@ class PaymentGateway:
             PaymentMethod.WECHAT: self._process_wechat_payment,
             PaymentMethod.ALIPAY: self._process_alipay_payment
         }
+        self.qr_cache = QRCodeCache(
+            max_size=config.get("qr_cache_size", 1024),
+            ttl=config.get("qr_cache_ttl", 300)
+        )
+        self._client: Optional[GatewayClient] = None
+        self._client_lock = threading.Lock()
+        max_skew = config.get("callback_max_skew", 300.0)
+        self.callback_verifier = CallbackVerifier(
+            self.api_secret,
+            max_skew=max_skew,
+            # 多 worker 部署时由调用方传入共享的重放缓存(StoreReplayCache)，否则使用进程内缓存
+            replay_cache=config.get("replay_cache") or ReplayCache(
+                ttl=2 * max_skew, max_size=config.get("replay_cache_size", 100000))
+        )
+
+    @property
+    def client(self) -> GatewayClient:
+        """真实模式下的网关 HTTP 客户端(首次使用时创建，连接池在线程间共享)"""
+        if self._client is None:
+            with self._client_lock:
+                if self._client is None:
+                    self._client = GatewayClient(
+                        self.config.get("gateway_url", ""),
+                        self.api_secret,
+                        pool_size=self.config.get("http_pool_size", 20),
+                        connect_timeout=self.config.get("connect_timeout", 2.0),
+                        read_timeout=self.config.get("read_timeout", 5.0),
+                        max_retries=self.config.get("max_retries", 3),
+                        breaker=CircuitBreaker(
+                            failure_threshold=self.config.get("breaker_threshold", 5),
+                            reset_timeout=self.config.get("breaker_reset_timeout", 30.0)
+                        )
+                    )
+        return self._client
 
+    def warm_up(self) -> None:
+        """预先加载二维码渲染库，真实模式下同时创建网关 HTTP 客户端(worker 启动后、接收请求前调用)，
+        避免首个请求承担导入耗时"""
+        importlib.import_module("qrcode")
+        if not self.mock_mode:
+            self.client
+
+    def close(self) -> None:
+        """释放网关 HTTP 连接池(worker 退出时调用)"""
+        with self._client_lock:
+            if self._client is not None:
+                self._client.close()
+                self._client = None
+
+    def _remote_payment(self, order_id: str, amount: float, method: PaymentMethod) -> Dict:
+        """调用真实网关下单支付(以订单ID作为幂等键，允许重试)"""
+        return self.client.request(
+            "POST", "/api/payments", idempotent=True,
+            json={"order_id": order_id, "amount": amount, "method": method.value},
+            headers={"Idempotency-Key": order_id}
+        )
+
+    @GATEWAY_CALL_SECONDS.timed(("process_payment",))
     def process_payment(self, order_id: str, amount: float,
                        method: PaymentMethod, **kwargs) -> Dict:
         """
@@ -63,6 +157,8 @@ class PaymentGateway:
         try:
             processor = self.payment_methods[method]
             result = processor(order_id, amount, **kwargs)
+            if "status" in result:
+                PAYMENT_STATUS_TOTAL.inc((result["status"],))
             logger.info(f"支付处理成功: 订单ID={order_id}, 结果={result}")
             return result
         except Exception as e:
@@ -89,72 +185,134 @@ class PaymentGateway:
                 "timestamp": time.time()
             }
         else:
-            # TODO: 实现真实支付接口
-            raise NotImplementedError("真实支付功能暂未实现")
+            return self._remote_payment(order_id, amount, PaymentMethod.DIRECT)
+
+    def _payment_url(self, order_id: str, amount: float) -> str:
+        return f"{self.config.get('gateway_url', '')}/pay?order_id={order_id}&amount={amount}"
+
+    def generate_qr_code(self, order_id: str, amount: float, fmt: str = "png",
+                         box_size: int = 10, border: int = 4) -> Dict:
+        """生成支付二维码(结果按 payment_url 与渲染参数缓存)"""
+        if fmt not in QR_FORMATS:
+            raise ValueError(f"不支持的二维码格式: {fmt}")
+        payment_url = self._payment_url(order_id, amount)
+        key = (payment_url, fmt, box_size, border)
+
+        qr_code = self.qr_cache.get(key)
+        if qr_code is None:
+            with QR_RENDER_SECONDS.time((fmt,)):
+                qr_code = render_qr_code(payment_url, fmt, box_size, border)
+            self.qr_cache.put(key, order_id, qr_code)
 
-    def generate_qr_code(self, order_id: str, amount: float) -> Dict:
-        """生成支付二维码"""
-        payment_url = f"{self.config.get('gateway_url', '')}/pay?order_id={order_id}&amount={amount}"
-        
-        qr = qrcode.QRCode(
-            version=1,
-            error_correction=qrcode.constants.ERROR_CORRECT_L,
-            box_size=10,
-            border=4,
-        )
-        qr.add_data(payment_url)
-        qr.make(fit=True)
-        
-        img = qr.make_image(fill_color="black", back_color="white")
-        buffer = io.BytesIO()
-        img.save(buffer, format='PNG')
-        img_str = base64.b64encode(buffer.getvalue()).decode()
-        
         return {
-            "qr_code": f"data:image/png;base64,{img_str}",
+            "qr_code": qr_code,
+            "format": fmt,
             "payment_url": payment_url,
             "order_id": order_id,
             "amount": amount
         }
 
+    def generate_qr_codes(self, orders: Iterable[Tuple[str, float]], fmt: str = "png",
+                          box_size: int = 10, border: int = 4,
+                          max_workers: Optional[int] = None) -> List[Dict]:
+        """批量预渲染二维码
+
+        未命中缓存的订单在进程池中并行渲染，结果写回缓存。
+        :param orders: (order_id, amount) 序列
+        """
+        if fmt not in QR_FORMATS:
+            raise ValueError(f"不支持的二维码格式: {fmt}")
+        orders = list(orders)
+        results: List[Optional[Dict]] = [None] * len(orders)
+        pending = []
+        for index, (order_id, amount) in enumerate(orders):
+            payment_url = self._payment_url(order_id, amount)
+            key = (payment_url, fmt, box_size, border)
+            qr_code = self.qr_cache.get(key)
+            if qr_code is None:
+                pending.append((index, key))
+            results[index] = {
+                "qr_code": qr_code,
+                "format": fmt,
+                "payment_url": payment_url,
+                "order_id": order_id,
+                "amount": amount
+            }
+
+        if pending:
+            items = [key for _, key in pending]
+            if len(items) == 1 or max_workers == 1:
+                rendered = [_render_batch_item(item) for item in items]
+            else:
+                from concurrent.futures import ProcessPoolExecutor
+                with ProcessPoolExecutor(max_workers=max_workers) as executor:
+                    rendered = list(executor.map(_render_batch_item, items,
+                                                 chunksize=max(1, len(items) // 32)))
+            for (index, key), qr_code in zip(pending, rendered):
+                self.qr_cache.put(key, results[index]["order_id"], qr_code)
+                results[index]["qr_code"] = qr_code
+
+        logger.info(f"批量生成二维码: 总数={len(orders)}, 新渲染={len(pending)}")
+        return results
+
+    def evict_qr_code(self, order_id: str) -> int:
+        """驱逐订单的二维码缓存(订单离开 pending 状态时调用)"""
+        return self.qr_cache.evict_order(order_id)
+
+    def check_callback(self, params: Dict) -> str:
+        """验证支付回调，返回 valid/invalid/expired/replayed(见 admin.signing)"""
+        result = self.callback_verifier.verify(params)
+        CALLBACK_VERIFY_TOTAL.inc((result,))
+        if result != VALID:
+            logger.debug("callback_verify result=%s order_id=%s", result, params.get("order_id"))
+        return result
+
+    def release_callback(self, params: Dict) -> None:
+        """回调处理失败时释放其 nonce，网关重试同一回调时可以重新处理"""
+        self.callback_verifier.release(params)
+
     def verify_callback(self, params: Dict) -> bool:
-        """验证支付回调签名"""
-        signature = params.get("signature")
-        is_valid = signature == self.api_secret
-        if is_valid:
-            logger.info(f"回调验证成功: 订单ID={params.get('order_id')}")
-        else:
-            logger.warning(f"回调验证失败: 订单ID={params.get('order_id')}, 签名={signature}")
-        return is_valid
+        """验证支付回调签名(HMAC-SHA256)，重复投递也视为验证不通过"""
+        return self.check_callback(params) == VALID
+
+    def _mock_payment_status(self, order_id: str) -> Dict:
+        # Mock模式下随机返回支付状态
+        status = PaymentStatus.PAID.value if time.time() % 10 != 0 else PaymentStatus.PENDING.value
+        return {
+            "order_id": order_id,
+            "status": status,
+            "transaction_id": f"txn_{str(uuid.uuid4())[:8]}",
+            "last_checked": time.time()
+        }
 
+    def _mock_refund(self, order_id: str, amount: float) -> Dict:
+        return {
+            "order_id": order_id,
+            "refund_id": f"ref_{str(uuid.uuid4())[:8]}",
+            "amount": amount,
+            "status": PaymentStatus.REFUNDED.value,
+            "timestamp": time.time()
+        }
+
+    @GATEWAY_CALL_SECONDS.timed(("check_payment_status",))
     def check_payment_status(self, order_id: str) -> Dict:
         """检查支付状态"""
         if self.mock_mode:
-            # Mock模式下随机返回支付状态
-            status = PaymentStatus.PAID.value if time.time() % 10 != 0 else PaymentStatus.PENDING.value
-            return {
-                "order_id": order_id,
-                "status": status,
-                "transaction_id": f"txn_{str(uuid.uuid4())[:8]}",
-                "last_checked": time.time()
-            }
+            return self._mock_payment_status(order_id)
         else:
-            # TODO: 实现真实支付状态查询
-            raise NotImplementedError("真实支付状态查询功能暂未实现")
+            return self.client.request("GET", f"/api/payments/{order_id}", idempotent=True)
 
+    @GATEWAY_CALL_SECONDS.timed(("refund",))
     def refund(self, order_id: str, amount: float) -> Dict:
         """处理退款"""
         if self.mock_mode:
-            return {
-                "order_id": order_id,
-                "refund_id": f"ref_{str(uuid.uuid4())[:8]}",
-                "amount": amount,
-                "status": PaymentStatus.REFUNDED.value,
-                "timestamp": time.time()
-            }
+            return self._mock_refund(order_id, amount)
         else:
-            # TODO: 实现真实退款接口
-            raise NotImplementedError("真实退款功能暂未实现")
+            return self.client.request(
+                "POST", "/api/refunds", idempotent=True,
+                json={"order_id": order_id, "amount": amount},
+                headers={"Idempotency-Key": f"refund-{order_id}"}
+            )
 
     def _process_wechat_payment(self, order_id: str, amount: float) -> Dict:
         """处理微信支付"""
@@ -167,8 +325,7 @@ class PaymentGateway:
                 "timestamp": time.time()
             }
         else:
-            # TODO: 实现真实微信支付接口
-            raise NotImplementedError("真实微信支付功能暂未实现")
+            return self._remote_payment(order_id, amount, PaymentMethod.WECHAT)
 
     def _process_alipay_payment(self, order_id: str, amount: float) -> Dict:
         """
@@ -187,7 +344,7 @@ class PaymentGateway:
                 - timestamp: 支付时间戳
                 
         Note:
-            真实实现需要调用支付宝支付API，当前为模拟模式
+            真实模式通过网关 HTTP 客户端调用 /api/payments
         """
         if self.mock_mode:
             return {
@@ -198,5 +355,4 @@ class PaymentGateway:
                 "timestamp": time.time()
             }
         else:
-            # TODO: 实现真实支付宝支付接口
-            raise NotImplementedError("真实支付宝支付功能暂未实现")
\ No newline at end of file
+            return self._remote_payment(order_id, amount, PaymentMethod.ALIPAY)
\ No newline at end of file
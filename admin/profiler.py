@@ -0,0 +1,109 @@
+"""按需开启的采样分析器
+
+开启后后台线程按固定间隔采集正在处理请求的线程调用栈，
+请求耗时超过阈值时把该请求的采样并入汇总，输出 flamegraph.pl / speedscope
+可直接读取的折叠栈格式("frame;frame;frame count")。关闭时请求路径上只有一次布尔判断。
+"""
+import sys
+import threading
+from collections import Counter
+from typing import Dict, List, Optional
+
+
+class SamplingProfiler:
+    def __init__(self, interval: float = 0.005, slow_threshold: float = 0.2, max_stacks: int = 10000):
+        """
+        :param interval: 采样间隔(秒)
+        :param slow_threshold: 慢请求阈值(秒)，只保留慢请求的采样
+        :param max_stacks: 汇总中保留的不同调用栈上限
+        """
+        self.interval = interval
+        self.slow_threshold = slow_threshold
+        self.max_stacks = max_stacks
+        self.enabled = False
+        self.stacks: Counter = Counter()
+        self.slow_requests = 0
+        self._active: Dict[int, List[str]] = {}
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._stopping = threading.Event()
+
+    def start(self, interval: Optional[float] = None, slow_threshold: Optional[float] = None) -> None:
+        if interval is not None:
+            self.interval = interval
+        if slow_threshold is not None:
+            self.slow_threshold = slow_threshold
+        if self.enabled:
+            return
+        self._stopping.clear()
+        self.enabled = True
+        self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self.enabled = False
+        self._stopping.set()
+        if self._thread is not None:
+            self._thread.join(1.0)
+            self._thread = None
+        with self._lock:
+            self._active.clear()
+
+    def reset(self) -> None:
+        with self._lock:
+            self.stacks.clear()
+            self.slow_requests = 0
+
+    def begin_request(self) -> None:
+        if self.enabled:
+            with self._lock:
+                self._active[threading.get_ident()] = []
+
+    def end_request(self, duration: float, label: str) -> None:
+        if not self.enabled:
+            return
+        with self._lock:
+            samples = self._active.pop(threading.get_ident(), None)
+            if not samples or duration < self.slow_threshold:
+                return
+            self.slow_requests += 1
+            for stack in samples:
+                key = f"{label};{stack}"
+                if key in self.stacks or len(self.stacks) < self.max_stacks:
+                    self.stacks[key] += 1
+
+    def collapsed(self) -> str:
+        """折叠栈格式输出"""
+        with self._lock:
+            items = self.stacks.most_common()
+        return "".join(f"{stack} {count}\n" for stack, count in items)
+
+    def _run(self) -> None:
+        while not self._stopping.wait(self.interval):
+            with self._lock:
+                thread_ids = list(self._active)
+            if not thread_ids:
+                continue
+            frames = sys._current_frames()
+            samples = {}
+            for thread_id in thread_ids:
+                frame = frames.get(thread_id)
+                if frame is not None:
+                    samples[thread_id] = self._format_stack(frame)
+            with self._lock:
+                for thread_id, stack in samples.items():
+                    active = self._active.get(thread_id)
+                    if active is not None:
+                        active.append(stack)
+
+    @staticmethod
+    def _format_stack(frame) -> str:
+        parts = []
+        while frame is not None:
+            code = frame.f_code
+            parts.append(f"{code.co_name} ({code.co_filename.rsplit('/', 1)[-1]}:{frame.f_lineno})")
+            frame = frame.f_back
+        return ";".join(reversed(parts))
+
+
+PROFILER = SamplingProfiler()
@@ -0,0 +1,80 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Hashable, Optional, Set
+
+
+class QRCodeCache:
+    """二维码渲染结果缓存(LRU + TTL，线程安全)
+
+    缓存键为 (payment_url, 渲染参数)，同时维护 order_id -> 缓存键 的映射，
+    订单离开 pending 状态时可按订单整体驱逐。
+    """
+
+    def __init__(self, max_size: int = 1024, ttl: float = 300.0):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._items: "OrderedDict[Hashable, tuple]" = OrderedDict()  # key -> (expire_at, order_id, value)
+        self._by_order: Dict[str, Set[Hashable]] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Hashable) -> Optional[Dict]:
+        """读取缓存，过期条目视为未命中"""
+        with self._lock:
+            item = self._items.get(key)
+            if item is None:
+                self.misses += 1
+                return None
+            expire_at, order_id, value = item
+            if expire_at < time.monotonic():
+                self._remove(key, order_id)
+                self.misses += 1
+                return None
+            self._items.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key: Hashable, order_id: str, value: Dict) -> None:
+        """写入缓存，超出容量时淘汰最久未使用的条目"""
+        if self.max_size <= 0:
+            return
+        with self._lock:
+            if key in self._items:
+                self._remove(key, self._items[key][1])
+            self._items[key] = (time.monotonic() + self.ttl, order_id, value)
+            self._by_order.setdefault(order_id, set()).add(key)
+            while len(self._items) > self.max_size:
+                old_key, (_, old_order, _) = self._items.popitem(last=False)
+                self._unlink(old_key, old_order)
+
+    def evict_order(self, order_id: str) -> int:
+        """驱逐某订单的全部缓存条目，返回驱逐数量"""
+        with self._lock:
+            keys = self._by_order.pop(order_id, set())
+            for key in keys:
+                self._items.pop(key, None)
+            return len(keys)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._items.clear()
+            self._by_order.clear()
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def stats(self) -> Dict:
+        return {"size": len(self._items), "hits": self.hits, "misses": self.misses}
+
+    def _remove(self, key: Hashable, order_id: str) -> None:
+        self._items.pop(key, None)
+        self._unlink(key, order_id)
+
+    def _unlink(self, key: Hashable, order_id: str) -> None:
+        keys = self._by_order.get(order_id)
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._by_order[order_id]
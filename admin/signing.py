@@ -0,0 +1,141 @@
+"""支付回调签名(HMAC-SHA256)与重放防护
+
+签名串为除 signature 外全部非空参数按键名排序后的 key=value&key=value，
+嵌套值按紧凑 JSON 编码；回调需携带 timestamp(秒) 与 nonce，
+验签通过后 nonce 写入重放缓存，有效期内重复投递直接识别为重复回调；
+回调处理失败时调用 CallbackVerifier.release 释放 nonce，网关以同一 nonce 重试时可以重新处理。
+多个 worker 共享存储时使用 StoreReplayCache，重放缓存随存储在进程间共享。
+"""
+import hashlib
+import hmac
+import json
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Dict, Optional
+
+# 验签结果
+VALID = "valid"
+INVALID = "invalid"          # 签名缺失或不匹配
+EXPIRED = "expired"          # 时间戳缺失或超出允许偏差
+REPLAYED = "replayed"        # 有效期内重复投递
+
+
+def canonicalize(params: Dict) -> bytes:
+    """生成签名串"""
+    parts = []
+    for key in sorted(params):
+        value = params[key]
+        if key == "signature" or value is None or value == "":
+            continue
+        if isinstance(value, (dict, list)):
+            value = json.dumps(value, ensure_ascii=False, sort_keys=True, separators=(",", ":"))
+        elif isinstance(value, bool):
+            value = "true" if value else "false"
+        parts.append(f"{key}={value}")
+    return "&".join(parts).encode()
+
+
+def sign(params: Dict, secret: str) -> str:
+    return hmac.new(secret.encode(), canonicalize(params), hashlib.sha256).hexdigest()
+
+
+def sign_callback(params: Dict, secret: str, timestamp: Optional[float] = None) -> Dict:
+    """补充 timestamp、nonce 并签名，返回新的回调参数(供网关/模拟网关/压测脚本使用)"""
+    signed = dict(params)
+    signed.setdefault("timestamp", int(timestamp if timestamp is not None else time.time()))
+    signed.setdefault("nonce", uuid.uuid4().hex)
+    signed["signature"] = sign(signed, secret)
+    return signed
+
+
+class ReplayCache:
+    """nonce 重放缓存(容量有限，按 TTL 淘汰，线程安全)
+
+    所有条目 TTL 相同，插入顺序即过期顺序，淘汰只需从队头弹出。
+    """
+
+    def __init__(self, ttl: float = 600.0, max_size: int = 100000):
+        self.ttl = ttl
+        self.max_size = max_size
+        self._items: "OrderedDict[str, float]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def add(self, nonce: str, now: Optional[float] = None) -> bool:
+        """登记 nonce，有效期内已登记过则返回 False"""
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            items = self._items
+            while items:
+                oldest, expire_at = next(iter(items.items()))
+                if expire_at > now and len(items) < self.max_size:
+                    break
+                del items[oldest]
+            if nonce in items:
+                return False
+            items[nonce] = now + self.ttl
+            return True
+
+    def discard(self, nonce: str) -> None:
+        """移除 nonce(对应的回调处理失败，允许重试)"""
+        with self._lock:
+            self._items.pop(nonce, None)
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+
+class StoreReplayCache:
+    """保存在存储后端中的 nonce 重放缓存，多个 worker 共享(存储需实现 claim_nonce/release_nonce)"""
+
+    def __init__(self, store, ttl: float = 600.0):
+        self.store = store
+        self.ttl = ttl
+
+    def add(self, nonce: str) -> bool:
+        """登记 nonce，有效期内已登记过则返回 False"""
+        return self.store.claim_nonce(nonce, self.ttl)
+
+    def discard(self, nonce: str) -> None:
+        self.store.release_nonce(nonce)
+
+
+class CallbackVerifier:
+    """回调验签：HMAC 常量时间比较 + 时间戳窗口 + nonce 重放缓存"""
+
+    def __init__(self, secret: str, max_skew: float = 300.0, replay_cache=None):
+        """
+        :param max_skew: 回调时间戳与本机时间允许的最大偏差(秒)
+        :param replay_cache: nonce 缓存(ReplayCache/StoreReplayCache)，TTL 应不小于 2 * max_skew
+        """
+        self.key = secret.encode()
+        self.max_skew = max_skew
+        self.replay_cache = replay_cache or ReplayCache(ttl=2 * max_skew)
+
+    def verify(self, params: Dict) -> str:
+        signature = params.get("signature")
+        if not isinstance(signature, str):
+            return INVALID
+        expected = hmac.new(self.key, canonicalize(params), hashlib.sha256).hexdigest()
+        if not hmac.compare_digest(expected, signature):
+            return INVALID
+        try:
+            skew = abs(time.time() - float(params["timestamp"]))
+        except (KeyError, TypeError, ValueError):
+            return EXPIRED
+        if skew > self.max_skew:
+            return EXPIRED
+        if not self.replay_cache.add(self._replay_key(params)):
+            return REPLAYED
+        return VALID
+
+    def release(self, params: Dict) -> None:
+        """释放已通过验签的回调的 nonce：回调处理失败(未应答成功)时调用，网关重试不会被当作重复投递"""
+        self.replay_cache.discard(self._replay_key(params))
+
+    @staticmethod
+    def _replay_key(params: Dict) -> str:
+        # 未携带 nonce 时以签名代替(相同参数的重复投递签名相同)
+        nonce = params.get("nonce")
+        return str(nonce) if nonce else params["signature"]
@@ -0,0 +1,168 @@
+import random
+import threading
+import time
+import uuid
+import logging
+from typing import Dict, Optional
+
+from flask import Flask, request, jsonify
+
+from .payment_gateway import PaymentMethod, PaymentStatus
+from .signing import sign_callback
+
+logger = logging.getLogger(__name__)
+
+
+def create_stub_app(api_secret: str = "your-secret-key", latency_ms: float = 0.0,
+                    failure_rate: float = 0.0, callback_url: Optional[str] = None) -> Flask:
+    """
+    创建本地模拟支付网关(用于离线联调与压测真实模式客户端)
+    :param latency_ms: 每个请求注入的延迟(毫秒)
+    :param failure_rate: 随机返回 HTTP 503 的概率，用于验证重试与熔断
+    :param callback_url: 扫码支付完成后回调商户的地址，为空则不回调
+    """
+    app = Flask(__name__)
+    payments: Dict[str, Dict] = {}
+    refunds: Dict[str, Dict] = {}
+    lock = threading.Lock()
+
+    @app.before_request
+    def inject_faults():
+        if request.path.startswith("/api/"):
+            if request.headers.get("X-Api-Key") != api_secret:
+                return jsonify({"code": 401, "msg": "invalid api key"}), 401
+            if latency_ms:
+                time.sleep(latency_ms / 1000)
+            if failure_rate and random.random() < failure_rate:
+                return jsonify({"code": 503, "msg": "gateway unavailable"}), 503
+        return None
+
+    @app.route("/")
+    def index():
+        return "Admin Service is running!"
+
+    @app.route("/api/payments", methods=["POST"])
+    def create_payment():
+        data = request.get_json(silent=True) or {}
+        order_id = data.get("order_id")
+        method = data.get("method", PaymentMethod.DIRECT.value)
+        if not order_id or data.get("amount") is None:
+            return jsonify({"code": 400, "msg": "missing order_id or amount"}), 400
+        with lock:
+            # 以订单ID幂等：重复请求返回同一笔交易
+            payment = payments.get(order_id)
+            if payment is None:
+                payment = payments[order_id] = {
+                    "order_id": order_id,
+                    "payment_method": method,
+                    "amount": data["amount"],
+                    "status": PaymentStatus.PAID.value,
+                    "transaction_id": f"stub_{uuid.uuid4().hex[:8]}",
+                    "timestamp": time.time()
+                }
+        return jsonify(payment), 200
+
+    @app.route("/api/payments/<order_id>", methods=["GET"])
+    def payment_status(order_id):
+        payment = payments.get(order_id)
+        if payment is None:
+            return jsonify({"order_id": order_id, "status": PaymentStatus.PENDING.value,
+                            "transaction_id": None, "last_checked": time.time()}), 200
+        return jsonify(dict(payment, last_checked=time.time())), 200
+
+    @app.route("/api/refunds", methods=["POST"])
+    def create_refund():
+        data = request.get_json(silent=True) or {}
+        order_id = data.get("order_id")
+        if not order_id:
+            return jsonify({"code": 400, "msg": "missing order_id"}), 400
+        with lock:
+            refund = refunds.get(order_id)
+            if refund is None:
+                refund = refunds[order_id] = {
+                    "order_id": order_id,
+                    "refund_id": f"ref_{uuid.uuid4().hex[:8]}",
+                    "amount": data.get("amount"),
+                    "status": PaymentStatus.REFUNDED.value,
+                    "timestamp": time.time()
+                }
+                if order_id in payments:
+                    payments[order_id]["status"] = PaymentStatus.REFUNDED.value
+        return jsonify(refund), 200
+
+    @app.route("/pay", methods=["GET"])
+    def scan_pay():
+        """扫码落地页：模拟用户完成支付并回调商户"""
+        order_id = request.args.get("order_id")
+        amount = request.args.get("amount")
+        if not order_id:
+            return "missing order_id", 400
+        with lock:
+            payments.setdefault(order_id, {
+                "order_id": order_id,
+                "payment_method": PaymentMethod.QR_CODE.value,
+                "amount": amount,
+                "status": PaymentStatus.PAID.value,
+                "transaction_id": f"stub_{uuid.uuid4().hex[:8]}",
+                "timestamp": time.time()
+            })
+        if callback_url:
+            payload = sign_callback({"order_id": order_id, "status": "success",
+                                     "transaction_id": payments[order_id]["transaction_id"]}, api_secret)
+            threading.Thread(target=_send_callback, args=(callback_url, payload), daemon=True).start()
+        return f"订单 {order_id} 支付成功", 200
+
+    return app
+
+
+def _send_callback(callback_url: str, payload: Dict) -> None:
+    import requests
+
+    try:
+        requests.post(callback_url, json=payload, timeout=(2, 5))
+    except requests.RequestException as e:
+        logger.warning(f"回调商户失败: 订单ID={payload['order_id']}, 错误={e}")
+
+
+def serve_stub_in_thread(host: str = "127.0.0.1", port: int = 0, **kwargs):
+    """
+    在后台线程中启动模拟网关(多线程 WSGI 服务器)，用于测试与压测
+    :param port: 0 表示随机空闲端口
+    :return: (server, base_url)，调用 server.shutdown() 停止
+    """
+    from werkzeug.serving import make_server
+
+    server = make_server(host, port, create_stub_app(**kwargs), threaded=True)
+    threading.Thread(target=server.serve_forever, name="stub-gateway", daemon=True).start()
+    return server, f"http://{host}:{server.server_port}"
+
+
+def _serve_forever(host: str, port: int, kwargs: Dict) -> None:
+    from werkzeug.serving import make_server
+
+    logging.getLogger("werkzeug").setLevel(logging.ERROR)
+    make_server(host, port, create_stub_app(**kwargs), threaded=True).serve_forever()
+
+
+def serve_stub_in_process(host: str = "127.0.0.1", port: int = 0, **kwargs):
+    """
+    在独立进程中启动模拟网关，压测时避免与被测代码争用 GIL
+    :return: (process, base_url)，调用 process.terminate() 停止
+    """
+    import multiprocessing
+    import socket
+
+    if not port:
+        with socket.socket() as sock:
+            sock.bind((host, 0))
+            port = sock.getsockname()[1]
+    process = multiprocessing.Process(target=_serve_forever, args=(host, port, kwargs), daemon=True)
+    process.start()
+    deadline = time.monotonic() + 10
+    while time.monotonic() < deadline:
+        try:
+            with socket.create_connection((host, port), timeout=0.2):
+                break
+        except OSError:
+            time.sleep(0.05)
+    return process, f"http://{host}:{port}"
@@ -1,271 +1,1349 @@
-from flask import Flask, request, jsonify, render_template
+from flask import Flask, Blueprint, current_app, request, jsonify, render_template, Response, redirect, url_for
+import json
 import uuid
 import time
 import re
 from dotenv import load_dotenv
-import requests
-import io
 import base64
-import qrcode
 import os
-from admin.__main__ import PaymentGateway, PaymentMethod, PaymentStatus
+import logging
+import threading
+import math
+import functools
+import hmac
+from typing import Callable, Optional
+from admin.__main__ import PaymentGateway, PaymentMethod, PaymentStatus, QR_FORMATS, GatewayError, CircuitOpenError
+from admin.__main__ import REGISTRY, HTTP_REQUEST_SECONDS, STORE_OPERATION_SECONDS, PROFILER, StoreReplayCache
+from store import create_store, TimedStore, ORDER_TIME_FIELDS
+from ledger import Ledger, InsufficientBalance, to_cents, from_cents, is_whole_cents
+from callback_queue import CallbackQueue, CallbackWorkerPool
+from pubsub import OrderEventBus
+from order_reaper import OrderReaper
+from reconciler import Reconciler, StatusLookup
+from refund_jobs import RefundJobStore, RefundJobRunner
+from balance_cache import BalanceCache
+from ratelimit import RateLimiter, ConcurrencyLimiter
+from json_provider import dumps_bytes, json_provider_class
+from idempotency import (IdempotencyCache, IdempotencyConflict, IdempotencyInProgress,
+                         MemoryIdempotencyStore, SQLiteIdempotencyStore, fingerprint)
+
+try:
+    import fcntl
+except ImportError:  # Windows 无 fcntl，单进程运行时无需选主
+    fcntl = None
 
 load_dotenv()  # 加载环境变量
 
-# 支付模式配置 (True表示模拟模式, False表示真实模式)
-MOCK_MODE = os.getenv('MOCK_MODE', 'true').lower() == 'true'
+logger = logging.getLogger(__name__)
 
-app = Flask(__name__, template_folder='templates')
+# 推送结束且保留期后归档的订单状态(paid 是直接支付订单的最后状态；归档后仍可退款，退款时恢复到活跃订单表)
+FINAL_ORDER_STATUSES = ("paid", "recharged", "failed", "refunded", "expired")
 
-@app.route('/')
-def index():
-    return render_template('index.html')
+# 非待支付订单打开二维码页时跳转到支付结果页的提示(与 qr_payment.html 中的提示一致)
+QR_CLOSED_MESSAGES = {"expired": "订单已过期，请重新下单", "failed": "支付失败，请重新下单",
+                      "refunding": "订单退款中", "refunded": "订单已退款"}
 
-@app.route('/mock_payment')
-def mock_payment_page():
-    """渲染模拟支付页面"""
-    return render_template('mock_payment.html')
+# 11位中国大陆手机号(使用 fullmatch，不接受结尾换行)
+PHONE_PATTERN = re.compile(r'1[3-9]\d{9}')
 
-@app.route('/payment_callback')
-@app.route('/payment_callback_page')
-def payment_callback_page():
-    """渲染支付回调结果页面，包含订单详情"""
-    order_id = request.args.get('order_id')
-    if not order_id or order_id not in DB["orders"]:
-        return render_template('payment_callback.html',
-                            status='fail',
-                            order_id='无',
-                            amount='无',
-                            pay_time='无')
-    
-    order = DB["orders"][order_id]
-    return render_template('payment_callback.html',
-                        status='success' if order['status'] == 'paid' else 'fail',
-                        order_id=order_id,
-                        amount=order['amount'],
-                        pay_time=time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(order['pay_time'])) if order['pay_time'] else '无')
+# 字符串金额：非负十进制数(拒绝 nan/inf/科学计数法)
+AMOUNT_PATTERN = re.compile(r'\d+(?:\.\d+)?')
+
+# 初始用户数据 {user_id: {"balance_cents": int, "update_time": float}}
+DEMO_USERS = {
+    "13812345678": {"balance_cents": 10000, "update_time": time.time()},    # 普通用户
+    "13512345678": {"balance_cents": 5000, "update_time": time.time()},     # 普通用户2
+    "13612345678": {"balance_cents": 20000, "update_time": time.time()}     # 普通用户3
+}
+
+# 页面与 API 路由，由 create_app 注册到每个应用实例
+bp = Blueprint("payment", __name__)
 
-@app.route('/balance_query')
-def balance_query_page():
-    """渲染余额查询页面"""
-    return render_template('balance_query.html')
 
-# 模拟数据库(内存存储，生产环境需替换为MySQL/Redis等)
-DB = {
-    "orders": {},          # 订单存储 {order_id: order_info}
-    "users": {             # 用户余额 {user_id: {"balance": float, "update_time": float}}
-        "13812345678": {"balance": 100.0, "update_time": time.time()},    # 普通用户
-        "13512345678": {"balance": 50.0, "update_time": time.time()},     # 普通用户2
-        "13612345678": {"balance": 200.0, "update_time": time.time()}     # 普通用户3
+def load_config() -> dict:
+    """从环境变量读取应用配置(键名与环境变量一致)，create_app 的 config 参数可覆盖任意一项"""
+    mock_mode = os.getenv('MOCK_MODE', 'true').lower() == 'true'
+    return {
+        # 支付模式 (True表示模拟模式, False表示真实模式)
+        "MOCK_MODE": mock_mode,
+        # 支付回调处理模式 (sync表示在请求线程内充值, async表示入队后由后台worker批量处理)
+        "CALLBACK_MODE": os.getenv('CALLBACK_MODE', 'sync').lower(),
+        "CALLBACK_QUEUE_PATH": os.getenv('CALLBACK_QUEUE_PATH', 'data/callback_queue.db'),
+        "CALLBACK_WORKERS": int(os.getenv('CALLBACK_WORKERS', '2')),
+        "CALLBACK_BATCH_SIZE": int(os.getenv('CALLBACK_BATCH_SIZE', '50')),
+        # 订单状态推送配置: 心跳间隔(秒)与单条连接最长保持时间(秒)
+        "ORDER_EVENTS_HEARTBEAT": float(os.getenv('ORDER_EVENTS_HEARTBEAT', '15')),
+        "ORDER_EVENTS_MAX_DURATION": float(os.getenv('ORDER_EVENTS_MAX_DURATION', '300')),
+        # 每进程同时等待状态的推送/长轮询连接上限(每条连接占用一个线程，0 不限制)
+        "ORDER_EVENTS_MAX_SUBSCRIBERS": int(os.getenv('ORDER_EVENTS_MAX_SUBSCRIBERS', '16')),
+        # 待支付订单有效期(秒，0表示不过期)与终态订单在活跃订单表中的保留时间(秒，负数表示不归档)
+        "ORDER_TTL": float(os.getenv('ORDER_TTL', '1800')),
+        "ORDER_RETENTION": float(os.getenv('ORDER_RETENTION', '3600')),
+        "ORDER_ARCHIVE_SIZE": int(os.getenv('ORDER_ARCHIVE_SIZE', '100000')),
+        "ORDER_SWEEP_INTERVAL": float(os.getenv('ORDER_SWEEP_INTERVAL', '60')),
+        # 单笔订单金额上限(元)，金额须为 0.01 ~ 该值且最多两位小数
+        "MAX_ORDER_AMOUNT": float(os.getenv('MAX_ORDER_AMOUNT', '1000000')),
+        # 批量接口单次请求的最大条目数
+        "MAX_BATCH_SIZE": int(os.getenv('MAX_BATCH_SIZE', '10000')),
+        # 订单列表接口单页最大条数
+        "MAX_PAGE_SIZE": int(os.getenv('MAX_PAGE_SIZE', '500')),
+        # 管理令牌(退款接口与 /debug/*)，未配置时这些接口不可用
+        "ADMIN_TOKEN": os.getenv('ADMIN_TOKEN', ''),
+        # 存储后端(STORE_BACKEND=memory 为进程内存储；journal 为带追加日志的进程内存储，重启后恢复；
+        # sqlite 可供多个 worker 共享)
+        "STORE_BACKEND": os.getenv('STORE_BACKEND', 'memory').lower(),
+        "STORE_PATH": os.getenv('STORE_PATH', 'data/payment.db'),
+        "JOURNAL_DIR": os.getenv('JOURNAL_DIR', 'data/journal'),
+        "JOURNAL_SNAPSHOT_EVERY": int(os.getenv('JOURNAL_SNAPSHOT_EVERY', '100000')),
+        "JOURNAL_FSYNC": os.getenv('JOURNAL_FSYNC', 'true').lower() == 'true',
+        "STORE_POOL_SIZE": int(os.getenv('STORE_POOL_SIZE', '8')),
+        # 支付网关配置
+        "GATEWAY_URL": os.getenv('GATEWAY_URL', 'http://localhost:5001'),
+        "API_SECRET": os.getenv('API_SECRET', 'your-secret-key'),
+        "GATEWAY_POOL_SIZE": int(os.getenv('GATEWAY_POOL_SIZE', '20')),
+        "GATEWAY_CONNECT_TIMEOUT": float(os.getenv('GATEWAY_CONNECT_TIMEOUT', '2')),
+        "GATEWAY_READ_TIMEOUT": float(os.getenv('GATEWAY_READ_TIMEOUT', '5')),
+        "GATEWAY_MAX_RETRIES": int(os.getenv('GATEWAY_MAX_RETRIES', '3')),
+        "CALLBACK_MAX_SKEW": float(os.getenv('CALLBACK_MAX_SKEW', '300')),
+        # 网关状态对账(模拟网关的状态查询结果是随机的，默认只在真实模式下启用)
+        "RECONCILE_ENABLED": os.getenv('RECONCILE_ENABLED', str(not mock_mode)).lower() == 'true',
+        "RECONCILE_CONCURRENCY": int(os.getenv('RECONCILE_CONCURRENCY', '16')),
+        "RECONCILE_RATE": float(os.getenv('RECONCILE_RATE', '500')),
+        "RECONCILE_STATUSES": [status.strip() for status in os.getenv('RECONCILE_STATUSES', 'pending,paid').split(',')
+                               if status.strip()],
+        "RECONCILE_MIN_AGE": float(os.getenv('RECONCILE_MIN_AGE', '60')),
+        "RECONCILE_MAX_AGE": float(os.getenv('RECONCILE_MAX_AGE', '86400')),
+        "RECONCILE_BATCH_SIZE": int(os.getenv('RECONCILE_BATCH_SIZE', '500')),
+        "RECONCILE_INTERVAL": float(os.getenv('RECONCILE_INTERVAL', '30')),
+        "RECONCILE_MAX_BACKOFF": float(os.getenv('RECONCILE_MAX_BACKOFF', '3600')),
+        # 批量退款任务文件与并行度
+        "REFUND_JOBS_PATH": os.getenv('REFUND_JOBS_PATH', 'data/refund_jobs.db'),
+        "REFUND_WORKERS": int(os.getenv('REFUND_WORKERS', '4')),
+        "REFUND_BATCH_SIZE": int(os.getenv('REFUND_BATCH_SIZE', '20')),
+        # 幂等键响应缓存(memory/sqlite，留空与订单存储相同；sqlite 时多个 worker 共享)
+        "IDEMPOTENCY_BACKEND": os.getenv('IDEMPOTENCY_BACKEND', '').lower(),
+        "IDEMPOTENCY_PATH": os.getenv('IDEMPOTENCY_PATH', 'data/idempotency.db'),
+        "IDEMPOTENCY_TTL": float(os.getenv('IDEMPOTENCY_TTL', '86400')),
+        "IDEMPOTENCY_CACHE_SIZE": int(os.getenv('IDEMPOTENCY_CACHE_SIZE', '100000')),
+        "IDEMPOTENCY_WAIT_TIMEOUT": float(os.getenv('IDEMPOTENCY_WAIT_TIMEOUT', '10')),
+        # 余额读缓存(每进程，0 关闭)；其他 worker 的余额变动最多 BALANCE_CACHE_CHECK_INTERVAL 秒后可见，0 为每次读取都检查
+        "BALANCE_CACHE_SIZE": int(os.getenv('BALANCE_CACHE_SIZE', '100000')),
+        "BALANCE_CACHE_CHECK_INTERVAL": float(os.getenv('BALANCE_CACHE_CHECK_INTERVAL', '0.1')),
+        # 下单/支付/二维码接口限流：按账户与客户端IP的令牌桶(桶状态存于订单存储，多 worker 共享)
+        "RATE_LIMIT_ENABLED": os.getenv('RATE_LIMIT_ENABLED', 'true').lower() == 'true',
+        "RATE_LIMIT_ACCOUNT_RATE": float(os.getenv('RATE_LIMIT_ACCOUNT_RATE', '20')),
+        "RATE_LIMIT_ACCOUNT_BURST": float(os.getenv('RATE_LIMIT_ACCOUNT_BURST', '40')),
+        "RATE_LIMIT_IP_RATE": float(os.getenv('RATE_LIMIT_IP_RATE', '100')),
+        "RATE_LIMIT_IP_BURST": float(os.getenv('RATE_LIMIT_IP_BURST', '200')),
+        "RATE_LIMIT_LEASE": int(os.getenv('RATE_LIMIT_LEASE', '5')),
+        # 上述接口的进程内在途请求上限(0 不限制)，超出时直接返回 429
+        "ADMISSION_MAX_INFLIGHT": int(os.getenv('ADMISSION_MAX_INFLIGHT', '64')),
+        # JSON 序列化：auto(安装 orjson 时使用 orjson)、orjson、std(标准库)
+        "JSON_PROVIDER": os.getenv('JSON_PROVIDER', 'auto').lower(),
+        # 多 worker 部署时只由持有该文件锁的 worker 运行对账
+        "LEADER_LOCK_PATH": os.getenv('LEADER_LOCK_PATH', 'data/leader.lock'),
     }
-}
 
-# 支付网关配置
-payment_gateway = PaymentGateway({
-    "gateway_url": "http://localhost:5001",
-    "api_secret": "your-secret-key",
-    "mock_mode": MOCK_MODE
-})
+
+class LeaderLock:
+    """跨进程选主(非阻塞 flock)：同一时刻只有一个 worker 持有锁，进程退出时锁自动释放"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._file = None
+
+    def try_acquire(self) -> bool:
+        if fcntl is None:
+            return True
+        if self._file is not None:
+            return True
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        lock_file = open(self.path, "a+")
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lock_file.close()
+            return False
+        self._file = lock_file
+        return True
+
+    def release(self) -> None:
+        if self._file is not None:
+            fcntl.flock(self._file, fcntl.LOCK_UN)
+            self._file.close()
+            self._file = None
+
+    @property
+    def held(self) -> bool:
+        return fcntl is None or self._file is not None
 
 
 ### **模块1：用户中心服务（模拟账号校验）**
-def validate_user(account: str) -> bool:
+def validate_user(store, account: str) -> bool:
     """校验账号有效性(示例：假设账号为手机号格式，且必须存在于模拟数据库中)"""
-    if not re.match(r'^1[3-9]\\d{9}$', account):
+    if not PHONE_PATTERN.fullmatch(account):
         return False
-    return account in DB["users"] # 修改为只允许已存在的用户
+    return store.get_user(account) is not None # 修改为只允许已存在的用户
 
 
 ### **模块2：订单服务**
 class OrderService:
+    def __init__(self, ctx: "PaymentContext"):
+        self.ctx = ctx
+        self.store = ctx.store
+
+    def validate_order_params(self, account, amount):
+        """校验下单参数，返回 (account, amount, 错误信息)，校验通过时错误信息为 None"""
+        # 校验参数
+        if not account or not amount:
+            return account, amount, "缺少账号或金额参数"
+
+        amount = OrderService.parse_amount(amount)
+        if amount is None:
+            return account, amount, "金额格式无效"
+
+        # 校验账号格式(支持11位手机号)
+        # 先去除前后空格
+        account = str(account).strip()
+        if not PHONE_PATTERN.fullmatch(account):
+            return account, amount, f"账号格式无效，请输入11位中国大陆手机号(如13812345678)，当前输入: {account} (长度: {len(account)})"
+
+        if amount < 0.01:
+            return account, amount, "金额无效"
+        if amount > self.ctx.config["MAX_ORDER_AMOUNT"]:
+            return account, amount, f"金额超过单笔上限 {self.ctx.config['MAX_ORDER_AMOUNT']:.2f}"
+        if not is_whole_cents(amount):
+            return account, amount, "金额最多保留两位小数"
+        return account, amount, None
+
     @staticmethod
-    def create_order(account: str, amount: float) -> str:
-        """创建新订单"""
-        order_id = str(uuid.uuid4())
-        DB["orders"][order_id] = {
+    def parse_amount(amount):
+        """金额转为 float，格式无效(含 nan/inf 与布尔值)返回 None"""
+        if isinstance(amount, bool):
+            return None
+        if isinstance(amount, str):
+            amount = amount.strip()
+            return float(amount) if AMOUNT_PATTERN.fullmatch(amount) else None
+        if isinstance(amount, (int, float)):
+            amount = float(amount)
+            return amount if math.isfinite(amount) else None
+        return None
+
+    @staticmethod
+    def _new_order(account: str, amount: float) -> dict:
+        return {
             "account": account,
             "amount": amount,
-            "status": "pending",  # pending/paid/recharged
+            "status": "pending",  # pending/paid/recharged/failed/expired
             "create_time": time.time(),
             "pay_time": None,
             "recharge_time": None
         }
+
+    def place_order(self, account, amount) -> tuple:
+        """校验参数与余额后创建订单，返回 (响应体, HTTP状态码)"""
+        account, amount, error = self.validate_order_params(account, amount)
+        if error:
+            return {"code": 400, "msg": error}, 400
+
+        # 自动创建新用户(如果不存在)
+        user = self.store.ensure_user(account)
+
+        # 检查余额是否充足
+        if user.get("balance_cents", 0) < to_cents(amount):
+            return {"code": 400, "msg": "余额不足"}, 400
+
+        # 生成订单
+        order_id = self.create_order(account, amount)
+        return {"code": 200, "order_id": order_id}, 200
+
+    def create_order(self, account: str, amount: float) -> str:
+        """创建新订单"""
+        order_id = str(uuid.uuid4())
+        order = self._new_order(account, amount)
+        self.store.insert_order(order_id, order)
+        self.ctx.order_reaper.schedule_expiry(order_id, order["create_time"])
         return order_id
 
-    @staticmethod
-    def update_order_status(order_id: str, status: str):
+    def create_orders(self, items: list) -> list:
+        """批量创建订单
+
+        一次性完成参数校验与账户加载，所有合法订单在一个存储事务中写入。
+        :param items: [{"account": ..., "amount": ...}, ...]
+        :return: 与输入顺序一致的逐条结果
+        """
+        results = []
+        valid = []
+        for index, item in enumerate(items):
+            if not isinstance(item, dict):
+                results.append({"index": index, "code": 400, "msg": "缺少账号或金额参数"})
+                continue
+            account, amount, error = self.validate_order_params(item.get("account"), item.get("amount"))
+            if error:
+                results.append({"index": index, "code": 400, "msg": error})
+                continue
+            results.append(None)
+            valid.append((index, account, amount))
+
+        # 自动创建新用户(如果不存在)
+        users = self.store.ensure_users(account for _, account, _ in valid)
+        orders = {}
+        for index, account, amount in valid:
+            # 检查余额是否充足
+            if users[account].get("balance_cents", 0) < to_cents(amount):
+                results[index] = {"index": index, "code": 400, "msg": "余额不足"}
+                continue
+            order_id = str(uuid.uuid4())
+            orders[order_id] = self._new_order(account, amount)
+            results[index] = {"index": index, "code": 200, "order_id": order_id}
+
+        if orders:
+            self.store.insert_orders(orders)
+            for order_id, order in orders.items():
+                self.ctx.order_reaper.schedule_expiry(order_id, order["create_time"])
+        return results
+
+    def update_order_status(self, order_id: str, status: str):
         """修改订单状态"""
-        if order_id in DB["orders"]:
-            DB["orders"][order_id]["status"] = status
-            if status == "paid":
-                DB["orders"][order_id]["pay_time"] = time.time()
-            elif status == "recharged":
-                DB["orders"][order_id]["recharge_time"] = time.time()
+        fields = {"status": status}
+        if status == "paid":
+            fields["pay_time"] = time.time()
+        elif status == "recharged":
+            fields["recharge_time"] = time.time()
+        if self.store.update_order(order_id, **fields):
+            self._status_changed(order_id, status)
         return None
 
+    def _status_changed(self, order_id: str, status: str):
+        self.ctx.order_events.publish(order_id, {"order_id": order_id, "status": status})
+        if status != "pending":
+            # 订单离开待支付状态后二维码不再使用，释放缓存
+            self.ctx.payment_gateway.evict_qr_code(order_id)
+        if status in FINAL_ORDER_STATUSES:
+            self.ctx.order_reaper.schedule_archive(order_id)
+
+    def transition(self, order_id: str, from_statuses: tuple, status: str, **fields) -> bool:
+        """仅当订单当前状态属于 from_statuses 时修改状态(及 fields 中的其他字段)，返回是否修改"""
+        with self.store.transaction():
+            order = self.store.get_order(order_id)
+            if order is None or order["status"] not in from_statuses:
+                return False
+            self.store.update_order(order_id, status=status, **fields)
+        self._status_changed(order_id, status)
+        return True
+
+    def restore(self, order_id: str, order: dict, status: str) -> bool:
+        """把已归档订单以 status 状态恢复到活跃订单表，订单已在活跃订单表中时不修改并返回 False"""
+        if not self.store.insert_order_if_absent(order_id, dict(order, status=status)):
+            return False
+        self._status_changed(order_id, status)
+        return True
+
+    def expire_order(self, order_id: str) -> bool:
+        """将超时未支付的订单置为 expired，订单已离开 pending 状态时返回 False"""
+        return self.transition(order_id, ("pending",), "expired")
+
+    def orders_archived(self, orders: dict):
+        """订单归档后释放其缓存数据与(内存存储中)不会再被记账的账本条目
+
+        已归档的订单不再支付、充值；已支付/已充值订单仍可能恢复后退款，只有已退款订单释放退款条目。
+        """
+        refs = []
+        for order_id, order in orders.items():
+            self.ctx.payment_gateway.evict_qr_code(order_id)
+            refs += [("payment", order_id), ("recharge", order_id)]
+            if order["status"] == "refunded":
+                refs.append(("refund", RefundService.refund_id(order_id)))
+        self.store.release_ledger_entries(refs)
+
+    def get_order(self, order_id: str):
+        """读取订单(含已归档订单)，不存在返回 None"""
+        return self.store.get_order(order_id) or self.store.get_archived_order(order_id)
+
+    def get_order_status(self, order_id: str):
+        """读取订单 (状态, 金额)(含已归档订单)，不存在返回 None"""
+        summary = self.store.get_order_status(order_id)
+        if summary is None:
+            order = self.store.get_archived_order(order_id)
+            summary = (order["status"], order["amount"]) if order is not None else None
+        return summary
+
+    @staticmethod
+    def encode_cursor(order: dict, time_field: str) -> str:
+        """以本页最后一条订单的 (时间, 订单ID) 生成翻页游标"""
+        raw = json.dumps([order[time_field], order["order_id"]]).encode()
+        return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+    @staticmethod
+    def decode_cursor(cursor: str) -> tuple:
+        """解析翻页游标，格式无效时抛出 ValueError"""
+        try:
+            raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+            time_value, order_id = json.loads(raw)
+        except (ValueError, TypeError) as e:
+            raise ValueError("游标无效") from e
+        if not isinstance(time_value, (int, float)) or not isinstance(order_id, str):
+            raise ValueError("游标无效")
+        return time_value, order_id
+
+    def list_orders(self, account=None, status=None, time_field="create_time", start=None, end=None,
+                    cursor=None, limit=50, descending=True) -> tuple:
+        """按账户/状态/时间范围分页查询订单，返回 (订单列表, 下一页游标)"""
+        after = self.decode_cursor(cursor) if cursor else None
+        # 多取一条用于判断是否还有下一页
+        orders = self.store.query_orders(account=account, status=status, time_field=time_field,
+                                         start=start, end=end, after=after, limit=limit + 1,
+                                         descending=descending)
+        next_cursor = None
+        if len(orders) > limit:
+            orders = orders[:limit]
+            next_cursor = self.encode_cursor(orders[-1], time_field)
+        return orders, next_cursor
+
 
 ### **模块3：支付服务（使用支付网关）**
 class PaymentService:
+    def __init__(self, ctx: "PaymentContext"):
+        self.ctx = ctx
+        self.store = ctx.store
+        self.payment_gateway = ctx.payment_gateway
+
+    def process(self, order_id: str, payment_method: str = "direct") -> tuple:
+        """处理支付请求，返回 (响应体, HTTP状态码)"""
+        order = self.store.get_order(order_id) if order_id else None
+        error = self.check_payable(order)
+        if error is not None:
+            return error
+
+        # 如果是二维码支付，返回二维码信息
+        if payment_method == "qr_code":
+            qr_data = self.generate_qr_code(order_id, order["amount"])
+            return {
+                "code": 200,
+                "payment_method": "qr_code",
+                "data": qr_data
+            }, 200
+
+        # 调用支付网关(根据MOCK_MODE使用模拟支付或真实支付)
+        try:
+            pay_result = self.pay(order_id)
+        except CircuitOpenError:
+            return {"code": 503, "msg": "支付网关暂不可用，请稍后重试"}, 503
+        except GatewayError:
+            return {"code": 502, "msg": "支付网关调用失败"}, 502
+        return self.settle(order_id, order, pay_result)
+
     @staticmethod
-    def simulate_payment(order_id: str) -> dict:
-        """使用支付网关处理支付请求"""
-        return payment_gateway.process_payment(
+    def check_payable(order: Optional[dict]) -> Optional[tuple]:
+        """只有待支付订单可以支付，否则返回 (响应体, HTTP状态码)；在调用网关之前检查"""
+        if order is None:
+            return {"code": 404, "msg": "订单不存在"}, 404
+        if order["status"] == "expired":
+            return {"code": 400, "msg": "订单已过期"}, 400
+        if order["status"] != "pending":
+            return {"code": 400, "msg": "订单状态不允许支付"}, 400
+        return None
+
+    def pay(self, order_id: str) -> dict:
+        """使用支付网关处理支付请求(模拟模式由网关直接返回结果，真实模式调用远程网关)"""
+        return self.payment_gateway.process_payment(
             order_id=order_id,
-            amount=DB["orders"][order_id]["amount"],
+            amount=self.store.get_order(order_id)["amount"],
             method=PaymentMethod.DIRECT
         )
 
-    @staticmethod
-    def verify_signature(params: dict) -> bool:
-        """支付回调签名验证"""
-        return payment_gateway.verify_callback(params)
+    def settle(self, order_id: str, order: dict, pay_result: dict) -> tuple:
+        """根据网关支付结果扣款并更新订单状态，返回 (响应体, HTTP状态码)"""
+        if pay_result["status"] == PaymentStatus.PAID.value:
+            # 支付成功后扣除用户余额(账本原子扣款，按 order_id 去重，并发重复支付不会重复扣款)
+            try:
+                entry = self.ctx.ledger.debit(order["account"], to_cents(order["amount"]), "payment", order_id)
+            except InsufficientBalance:
+                # 余额不足，订单置为失败
+                self.ctx.orders.update_order_status(order_id, "failed")
+                return {"code": 400, "msg": "Insufficient balance"}, 400
+            if entry["duplicate"]:
+                # 并发的重复支付已扣过款，订单状态以首次结算为准(可能已退款)，不再覆盖
+                return {"code": 200, "msg": "Already processed"}, 200
+            self.ctx.orders.update_order_status(order_id, "paid")
+            return {
+                "code": 200,
+                "msg": "Payment succeeded",
+                "transaction_id": pay_result["transaction_id"]
+            }, 200
+        return {"code": 400, "msg": "支付失败"}, 400
 
-    @staticmethod
-    def generate_qr_code(order_id: str, amount: float) -> dict:
+    def verify_signature(self, params: dict) -> str:
+        """支付回调验签(HMAC-SHA256 + 时间戳窗口 + nonce 重放缓存)，返回 valid/invalid/expired/replayed"""
+        return self.payment_gateway.check_callback(params)
+
+    def release_signature(self, params: dict) -> None:
+        """回调处理失败时释放其 nonce，网关重试同一回调时重新处理而不是被当作重复投递"""
+        self.payment_gateway.release_callback(params)
+
+    def generate_qr_code(self, order_id: str, amount: float, fmt: str = "png") -> dict:
         """创建支付二维码"""
-        return payment_gateway.generate_qr_code(order_id, amount)
+        return self.payment_gateway.generate_qr_code(order_id, amount, fmt=fmt)
+
+    def generate_qr_codes(self, order_ids: list, fmt: str = "png") -> list:
+        """批量预渲染待支付订单的二维码"""
+        orders = []
+        for order_id in order_ids:
+            order = self.store.get_order(order_id)
+            if order is not None and order["status"] == "pending":
+                orders.append((order_id, order["amount"]))
+        return self.payment_gateway.generate_qr_codes(orders, fmt=fmt)
 
 
 ### **模块4：充值服务（核心实时操作）**
 class RechargeService:
-    @staticmethod
-    def recharge(account: str, amount: float, order_id: str) -> bool:
-        """执行充值操作(需保证幂等性)"""
-        # 幂等性校验：检查订单是否已充值
-        if DB["orders"][order_id]["status"] == "recharged":
-            return True  # 已处理过，直接返回成功
-
-        # 模拟账户余额更新（实际需调用钱包服务）
-        if account not in DB["users"]:
-            DB["users"][account] = {"balance": 0.0, "update_time": time.time()}
-        DB["users"][account]["balance"] += amount
-        DB["users"][account]["update_time"] = time.time()
-        OrderService.update_order_status(order_id, "recharged")
+    # 可充值的订单状态(网关回调)；已支付、已充值、退款中/已退款、失败、过期的订单一律视为已处理
+    RECHARGEABLE_STATUSES = ("pending",)
+
+    def __init__(self, ctx: "PaymentContext"):
+        self.ctx = ctx
+
+    def recharge(self, account: str, amount: float, order_id: str,
+                 from_statuses: tuple = RECHARGEABLE_STATUSES) -> bool:
+        """执行充值操作(可重复调用)，返回本次是否入账；订单已不在 from_statuses 中时返回 False
+
+        先以条件更新把订单从 from_statuses 置为 recharged，只有更新成功的调用才入账，
+        因此重复、并发或迟到(如退款之后)的回调都不会重复入账或改写订单状态。
+        """
+        orders = self.ctx.orders
+        previous = next((status for status in from_statuses
+                         if orders.transition(order_id, (status,), "recharged", recharge_time=time.time())), None)
+        if previous is None:
+            return False
+        try:
+            # 账户余额入账(账本按 order_id 去重)
+            self.ctx.ledger.credit(account, to_cents(amount), "recharge", order_id)
+        except Exception:
+            # 入账失败时恢复订单状态，网关重试回调时重新处理
+            orders.transition(order_id, ("recharged",), previous, recharge_time=None)
+            raise
         return True
 
 
-### **模块5：API接口**
-@app.route("/api/place_order", methods=["POST"])
-def place_order():
-    """创建订单接口"""
-    data = request.json
+### **模块5：通知与回调处理**
+class NotificationService:
+    def __init__(self):
+        # 充值通知订阅者 callable(account, amount, order_id)，实际可接入WebSocket/短信等
+        self.subscribers = [
+            lambda account, amount, order_id: print(f"Recharged {amount} to {account}")
+        ]
+
+    def notify_recharged(self, account: str, amount: float, order_id: str):
+        """向所有订阅者广播充值成功通知"""
+        for subscriber in self.subscribers:
+            try:
+                subscriber(account, amount, order_id)
+            except Exception as e:
+                logger.error(f"充值通知失败: 订单ID={order_id}, 错误={e}")
+
+
+class CallbackService:
+    def __init__(self, ctx: "PaymentContext"):
+        self.ctx = ctx
+
+    def handle_queued(self, payload: dict):
+        """处理队列中的回调任务(可重复执行)"""
+        order_id = payload["order_id"]
+        order = self.ctx.store.get_order(order_id)
+        if order is None:
+            logger.warning(f"回调任务对应订单不存在: 订单ID={order_id}")
+            return
+        # 对账发现的丢失回调可以恢复已过期的订单，网关回调只处理待支付订单
+        from_statuses = ("pending", "expired") if payload.get("source") == "reconcile" \
+            else RechargeService.RECHARGEABLE_STATUSES
+        if order["status"] not in from_statuses:
+            return  # 已处理过
+        if self.ctx.recharges.recharge(order["account"], order["amount"], order_id, from_statuses):
+            self.ctx.notifications.notify_recharged(order["account"], order["amount"], order_id)
+
+    def enqueue(self, payload: dict) -> bool:
+        """异步回调模式下写入回调队列并唤醒 worker，同步模式返回 False"""
+        if self.ctx.callback_queue is None:
+            return False
+        self.ctx.callback_queue.enqueue(payload)
+        self.ctx.callback_workers.notify()
+        return True
+
+
+### **模块6：退款服务**
+class RefundService:
+    # 可退款的订单状态；refunding 表示上次退款未完成，重试时从中断处继续
+    REFUNDABLE_STATUSES = ("paid", "recharged", "refunding")
+
+    def __init__(self, ctx: "PaymentContext"):
+        self.ctx = ctx
+        self.store = ctx.store
+
+    @staticmethod
+    def refund_id(order_id: str) -> str:
+        """退款单号(全额退款，每个订单只有一笔退款，与网关幂等键一致)"""
+        return f"refund-{order_id}"
+
+    def refund(self, order_id: str) -> tuple:
+        """全额退款，返回 (响应体, HTTP状态码)
+
+        订单先置为 refunding 再执行余额冲正与网关退款，每一步都以退款单号幂等，
+        任一步失败后重试都会从中断处继续，不会重复退款或重复变更余额：
+        - 充值订单(已入账)：先从账户扣回充值金额，再调用网关退款
+        - 支付订单(已扣款)：网关退款成功后把金额退回账户
+        """
+        store, orders, ledger = self.store, self.ctx.orders, self.ctx.ledger
+        order = store.get_order(order_id) if order_id else None
+        if order is None and order_id:
+            order = store.get_archived_order(order_id)
+            if order is not None and order["status"] in self.REFUNDABLE_STATUSES:
+                # 已归档的订单以退款中状态恢复到活跃订单表(恢复与状态修改为同一原子操作)；
+                # 并发的退款请求只有一个能恢复成功，其余按退款处理中应答
+                if not orders.restore(order_id, order, "refunding"):
+                    return {"code": 409, "msg": "退款处理中，请稍后重试"}, 409
+                order = store.get_order(order_id)
+        if order is None:
+            return {"code": 404, "msg": "订单不存在"}, 404
+        refund_id = self.refund_id(order_id)
+        if order["status"] == "refunded":
+            return {"code": 200, "msg": "Already refunded", "refund_id": refund_id}, 200
+        if order["status"] not in self.REFUNDABLE_STATUSES:
+            return {"code": 400, "msg": "订单状态不允许退款"}, 400
+        if order["status"] != "refunding" and not orders.transition(
+                order_id, ("paid", "recharged"), "refunding"):
+            # 并发请求已修改订单状态，按最新状态重新处理
+            return self.refund(order_id)
+
+        account, cents = order["account"], to_cents(order["amount"])
+        reverse_recharge = order["recharge_time"] is not None
+        if reverse_recharge:
+            try:
+                ledger.debit(account, cents, "refund", refund_id)
+            except InsufficientBalance:
+                orders.transition(order_id, ("refunding",), "recharged")
+                return {"code": 400, "msg": "余额不足，无法退款"}, 400
+
+        try:
+            result = self.ctx.payment_gateway.refund(order_id, order["amount"])
+        except CircuitOpenError:
+            return {"code": 503, "msg": "支付网关暂不可用，请稍后重试"}, 503
+        except GatewayError:
+            return {"code": 502, "msg": "支付网关调用失败"}, 502
+        if result.get("status") != PaymentStatus.REFUNDED.value:
+            return {"code": 502, "msg": "网关退款未完成"}, 502
+
+        if not reverse_recharge:
+            ledger.credit(account, cents, "refund", refund_id)
+        orders.transition(order_id, ("refunding",), "refunded")
+        return {"code": 200, "msg": "Refund succeeded", "refund_id": refund_id,
+                "gateway_refund_id": result.get("refund_id")}, 200
+
+
+class ReconcileService:
+    def __init__(self, ctx: "PaymentContext"):
+        self.ctx = ctx
+
+    def apply(self, order_id: str, order: dict, gateway_result: dict) -> str:
+        """根据网关查询结果修正订单状态，返回对账结果类别
+
+        - 网关已支付而订单仍待支付/已过期：视为回调丢失，走与回调相同的幂等处理路径
+        - 网关支付失败而订单仍待支付：订单置为失败
+        - 订单已支付但网关状态不一致：只记录，交由人工核查
+        - 订单已支付且网关确认已支付：confirmed，此后不再查询该订单
+        """
+        gateway_status = gateway_result.get("status")
+        status = order["status"]
+        if gateway_status == PaymentStatus.PAID.value and status in ("pending", "expired"):
+            payload = {"order_id": order_id, "received_time": time.time(), "source": "reconcile"}
+            if not self.ctx.callbacks.enqueue(payload):
+                self.ctx.callbacks.handle_queued(payload)
+            return "recovered"
+        if gateway_status == PaymentStatus.FAILED.value and status == "pending":
+            return "failed" if self.ctx.orders.transition(order_id, ("pending",), "failed") else "unchanged"
+        if status == "paid" and gateway_status != PaymentStatus.PAID.value:
+            logger.warning(f"对账状态不一致: 订单ID={order_id}, 订单状态={status}, 网关状态={gateway_status}")
+            return "mismatch"
+        if status == "paid":
+            return "confirmed"
+        return "unchanged"
+
+
+class PaymentContext:
+    """应用实例持有的全部运行时状态：存储、账本、网关、各服务与后台任务
+
+    由 create_app 按配置创建，每个 worker 进程一份，互不共享；close() 停止后台任务并释放连接。
+    """
+
+    def __init__(self, config):
+        self.config = config
+        backend = config["STORE_BACKEND"]
+        self.store = TimedStore(create_store(
+            backend=backend,
+            path=config["JOURNAL_DIR"] if backend == "journal" else config["STORE_PATH"],
+            users=DEMO_USERS,
+            pool_size=config["STORE_POOL_SIZE"],
+            archive_size=config["ORDER_ARCHIVE_SIZE"],
+            snapshot_every=config["JOURNAL_SNAPSHOT_EVERY"],
+            fsync=config["JOURNAL_FSYNC"]
+        ), STORE_OPERATION_SECONDS, backend)
+        if backend == "journal":
+            logger.info("日志恢复完成: %s", self.store.inner.recovery)
+
+        # 余额读缓存(内存存储本身即进程内读取，不再缓存)
+        self.balance_cache = None
+        if backend == "sqlite" and config["BALANCE_CACHE_SIZE"] > 0:
+            self.balance_cache = BalanceCache(self.store, max_size=config["BALANCE_CACHE_SIZE"],
+                                              check_interval=config["BALANCE_CACHE_CHECK_INTERVAL"])
+
+        # 余额账本(整数分，按账户分段加锁)，变动后失效本进程的余额缓存
+        self.ledger = Ledger(self.store, on_change=self.balance_cache.invalidate if self.balance_cache else None)
+
+        # 订单状态事件总线(进程内)；等待状态的连接各占一个线程，超过上限时不再等待，避免占满线程池
+        self.order_events = OrderEventBus()
+        self.order_event_slots = ConcurrencyLimiter(config["ORDER_EVENTS_MAX_SUBSCRIBERS"])
+
+        self.payment_gateway = PaymentGateway({
+            "gateway_url": config["GATEWAY_URL"],
+            "api_secret": config["API_SECRET"],
+            "mock_mode": config["MOCK_MODE"],
+            "http_pool_size": config["GATEWAY_POOL_SIZE"],
+            "connect_timeout": config["GATEWAY_CONNECT_TIMEOUT"],
+            "read_timeout": config["GATEWAY_READ_TIMEOUT"],
+            "max_retries": config["GATEWAY_MAX_RETRIES"],
+            "callback_max_skew": config["CALLBACK_MAX_SKEW"],
+            # nonce 重放缓存保存在存储中，多个 worker 共享
+            "replay_cache": StoreReplayCache(self.store, ttl=2 * config["CALLBACK_MAX_SKEW"])
+        })
+
+        # 幂等键响应缓存
+        if (config["IDEMPOTENCY_BACKEND"] or backend) == "sqlite":
+            idempotency_store = SQLiteIdempotencyStore(config["IDEMPOTENCY_PATH"])
+        else:
+            idempotency_store = MemoryIdempotencyStore(max_size=config["IDEMPOTENCY_CACHE_SIZE"])
+        self.idempotency = IdempotencyCache(idempotency_store, ttl=config["IDEMPOTENCY_TTL"],
+                                            wait_timeout=config["IDEMPOTENCY_WAIT_TIMEOUT"])
+
+        self.orders = OrderService(self)
+        self.payments = PaymentService(self)
+        self.recharges = RechargeService(self)
+        self.notifications = NotificationService()
+        self.callbacks = CallbackService(self)
+        self.refunds = RefundService(self)
+        self.reconcile = ReconcileService(self)
+
+        # 限流与准入控制
+        self.account_limiter = self.ip_limiter = None
+        if config["RATE_LIMIT_ENABLED"]:
+            self.account_limiter = RateLimiter(self.store, config["RATE_LIMIT_ACCOUNT_RATE"],
+                                               config["RATE_LIMIT_ACCOUNT_BURST"], lease=config["RATE_LIMIT_LEASE"])
+            self.ip_limiter = RateLimiter(self.store, config["RATE_LIMIT_IP_RATE"],
+                                          config["RATE_LIMIT_IP_BURST"], lease=config["RATE_LIMIT_LEASE"])
+        self.admission = ConcurrencyLimiter(config["ADMISSION_MAX_INFLIGHT"])
+
+        # 异步回调队列与worker池(仅async模式启用)
+        self.callback_queue = None
+        self.callback_workers = None
+        if config["CALLBACK_MODE"] == "async":
+            self.callback_queue = CallbackQueue(config["CALLBACK_QUEUE_PATH"])
+            self.callback_workers = CallbackWorkerPool(
+                self.callback_queue,
+                self.callbacks.handle_queued,
+                workers=config["CALLBACK_WORKERS"],
+                batch_size=config["CALLBACK_BATCH_SIZE"]
+            )
+
+        # 待支付订单过期与终态订单归档(时间轮只含本进程创建的订单，每个 worker 各自运行)
+        self.order_reaper = OrderReaper(
+            self.store,
+            expire=self.orders.expire_order,
+            archived=self.orders.orders_archived,
+            order_ttl=config["ORDER_TTL"],
+            retention=config["ORDER_RETENTION"],
+            final_statuses=FINAL_ORDER_STATUSES,
+            sweep_interval=config["ORDER_SWEEP_INTERVAL"]
+        )
+
+        # 网关状态对账(多 worker 部署时只在持有选主锁的 worker 中运行)
+        self.reconciler = Reconciler(
+            self.store,
+            StatusLookup(self.payment_gateway.check_payment_status,
+                         concurrency=config["RECONCILE_CONCURRENCY"],
+                         rate=config["RECONCILE_RATE"]),
+            self.reconcile.apply,
+            statuses=config["RECONCILE_STATUSES"],
+            min_age=config["RECONCILE_MIN_AGE"],
+            max_age=config["RECONCILE_MAX_AGE"],
+            batch_size=config["RECONCILE_BATCH_SIZE"],
+            interval=config["RECONCILE_INTERVAL"],
+            max_backoff=config["RECONCILE_MAX_BACKOFF"]
+        )
+        self.leader_lock = LeaderLock(config["LEADER_LOCK_PATH"])
+        self.reconciler_running = False
+
+        # 批量退款任务(首次提交批量退款时创建；任务文件已存在时启动即恢复未完成的任务)
+        self.refund_jobs = None
+        self.refund_runner = None
+        self._refund_jobs_lock = threading.Lock()
+
+    def start(self) -> None:
+        """启动后台任务(prefork 部署时须在 fork 之后调用)"""
+        config = self.config
+        if self.callback_workers is not None:
+            self.callback_workers.start()
+        if config["ORDER_TTL"] > 0 or config["ORDER_RETENTION"] >= 0:
+            self.order_reaper.start()
+        if config["RECONCILE_ENABLED"] and self.leader_lock.try_acquire():
+            self.reconciler.start()
+            self.reconciler_running = True
+        if os.path.exists(config["REFUND_JOBS_PATH"]):
+            self.get_refund_runner()
+
+    def close(self) -> None:
+        """停止后台任务并释放连接(worker 退出或热重载时调用)"""
+        self.order_reaper.stop()
+        self.reconciler.stop()
+        self.leader_lock.release()
+        if self.callback_workers is not None:
+            self.callback_workers.stop()
+            self.callback_queue.close()
+        with self._refund_jobs_lock:
+            if self.refund_runner is not None:
+                self.refund_runner.stop()
+                self.refund_jobs.close()
+                self.refund_runner = self.refund_jobs = None
+        self.payment_gateway.close()
+        self.idempotency.close()
+        self.store.close()
+
+    def check_rate_limits(self, scope: str, client_ip: Optional[str], account: Optional[str] = None) -> float:
+        """按客户端IP与账户限流，通过返回 0，被限流时返回建议的重试等待秒数"""
+        if self.ip_limiter is not None and client_ip:
+            retry_after = self.ip_limiter.acquire(f"{scope}:ip:{client_ip}")
+            if retry_after:
+                return retry_after
+        if self.account_limiter is not None and account:
+            return self.account_limiter.acquire(f"{scope}:account:{account}")
+        return 0.0
+
+    def get_refund_runner(self) -> RefundJobRunner:
+        with self._refund_jobs_lock:
+            if self.refund_runner is None:
+                self.refund_jobs = RefundJobStore(self.config["REFUND_JOBS_PATH"])
+                self.refund_runner = RefundJobRunner(
+                    self.refund_jobs,
+                    self.refunds.refund,
+                    workers=self.config["REFUND_WORKERS"],
+                    batch_size=self.config["REFUND_BATCH_SIZE"]
+                )
+                self.refund_runner.start()
+            return self.refund_runner
+
+    def register_metrics(self) -> None:
+        """登记采集时读取的现有状态(指标注册表为进程级，同一进程内后创建的应用覆盖先前的登记)"""
+        gateway, reaper, reconciler = self.payment_gateway, self.order_reaper, self.reconciler
+        REGISTRY.gauge_func("qr_cache_size", "二维码缓存条目数", lambda: gateway.qr_cache.stats()["size"])
+        REGISTRY.gauge_func("qr_cache_hits", "二维码缓存命中次数", lambda: gateway.qr_cache.hits)
+        REGISTRY.gauge_func("qr_cache_misses", "二维码缓存未命中次数", lambda: gateway.qr_cache.misses)
+        REGISTRY.gauge_func("order_event_subscribers", "订单状态推送连接数", self.order_events.subscriber_count)
+        REGISTRY.gauge_func("order_event_rejected", "超出上限未等待状态的推送/长轮询连接数",
+                            lambda: self.order_event_slots.rejected)
+        if self.callback_queue is not None:
+            REGISTRY.gauge_func("callback_queue_depth", "回调队列积压任务数", self.callback_queue.depth)
+        REGISTRY.gauge_func("order_reaper_timers", "订单过期/归档定时任务数", lambda: len(reaper.wheel))
+        REGISTRY.gauge_func("orders_expired", "已过期的待支付订单数", lambda: reaper.expired_count)
+        REGISTRY.gauge_func("orders_archived", "已归档订单数", lambda: reaper.archived_count)
+        REGISTRY.gauge_func("idempotency_replayed", "幂等键命中缓存重放的请求数", lambda: self.idempotency.replayed)
+        REGISTRY.gauge_func("idempotency_coalesced", "幂等键并发合并的请求数", lambda: self.idempotency.coalesced)
+        limiters = [limiter for limiter in (self.account_limiter, self.ip_limiter) if limiter is not None]
+        REGISTRY.gauge_func("rate_limited_requests", "被限流拒绝的请求数",
+                            lambda: sum(limiter.rejected for limiter in limiters))
+        REGISTRY.gauge_func("admission_inflight", "准入控制下的在途请求数", lambda: self.admission.inflight)
+        REGISTRY.gauge_func("admission_rejected", "超出在途上限被拒绝的请求数", lambda: self.admission.rejected)
+        journal = getattr(self.store.inner, "journal", None)
+        if journal is not None:
+            REGISTRY.gauge_func("journal_durable_seq", "已落盘的日志序号", lambda: journal.durable_seq)
+            REGISTRY.gauge_func("journal_commits", "日志组提交(fsync)次数", lambda: journal.commits)
+        if self.balance_cache is not None:
+            REGISTRY.gauge_func("balance_cache_hits", "余额缓存命中次数", lambda: self.balance_cache.hits)
+            REGISTRY.gauge_func("balance_cache_misses", "余额缓存未命中次数", lambda: self.balance_cache.misses)
+        REGISTRY.gauge_func("reconcile_checked", "已对账订单数", lambda: reconciler.checked)
+        REGISTRY.gauge_func("reconcile_lag_seconds", "最近一轮对账中最早订单的在途时长",
+                            lambda: reconciler.last_pass.get("lag", 0.0))
+        REGISTRY.gauge_func("reconcile_throughput", "最近一轮对账吞吐(订单/秒)",
+                            lambda: reconciler.last_pass.get("throughput", 0.0))
+
+
+def start_request_timer():
+    request.environ["app.started"] = time.perf_counter()
+    PROFILER.begin_request()
+
+
+def record_request_metrics(response):
+    started = request.environ.get("app.started")
+    if started is not None:
+        duration = time.perf_counter() - started
+        # 按路由模板聚合，避免路径参数撑爆标签基数
+        route = request.url_rule.rule if request.url_rule else "unmatched"
+        HTTP_REQUEST_SECONDS.observe((route, request.method, str(response.status_code)), duration)
+        PROFILER.end_request(duration, f"{request.method} {route}")
+    return response
+
+
+def create_app(config: Optional[dict] = None) -> Flask:
+    """应用工厂：按配置创建 Flask 应用及其存储、网关与后台任务
+
+    每次调用都创建独立的 PaymentContext，不依赖模块级状态；prefork 部署时
+    在每个 worker 进程 fork 之后调用(见 wsgi.py 与 gunicorn.conf.py)。
+    :param config: 覆盖 load_config() 从环境变量读取的配置项
+    """
+    settings = load_config()
+    settings.update(config or {})
+    flask_app = Flask(__name__, template_folder='templates')
+    flask_app.config.update(settings)
+    flask_app.json = json_provider_class(settings["JSON_PROVIDER"])(flask_app)
+    context = PaymentContext(flask_app.config)
+    flask_app.extensions["payment"] = context
+    flask_app.before_request(start_request_timer)
+    flask_app.after_request(record_request_metrics)
+    flask_app.register_blueprint(bp)
+    context.register_metrics()
+    context.start()
+    return flask_app
+
+
+def get_context(flask_app: Optional[Flask] = None) -> PaymentContext:
+    """应用的运行时上下文，缺省取当前请求所属的应用"""
+    return (flask_app or current_app).extensions["payment"]
+
+
+# 按环境变量创建的默认应用(兼容 `gunicorn app:app` 与 `python app.py`)，首次访问 app.app 时创建
+_default_app = None
+_default_app_lock = threading.Lock()
+
+
+def __getattr__(name):
+    """模块级 app 属性按需创建(PEP 562)，导入本模块不会创建存储或启动后台任务"""
+    global _default_app
+    if name != "app":
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    with _default_app_lock:
+        if _default_app is None:
+            _default_app = create_app()
+    return _default_app
+
+
+@bp.route('/')
+def index():
+    return render_template('index.html')
+
+@bp.route('/mock_payment')
+def mock_payment_page():
+    """渲染模拟支付页面"""
+    return render_template('mock_payment.html')
+
+@bp.route('/payment_callback')
+@bp.route('/payment_callback_page')
+def payment_callback_page():
+    """渲染支付回调结果页面，包含订单详情"""
+    ctx = get_context()
+    order_id = request.args.get('order_id')
+    order = ctx.orders.get_order(order_id) if order_id else None
+    if order is None:
+        return render_template('payment_callback.html',
+                            status='fail',
+                            order_id='无',
+                            amount='无',
+                            pay_time='无')
+    
+    return render_template('payment_callback.html',
+                        status='success' if order['status'] == 'paid' else 'fail',
+                        order_id=order_id,
+                        amount=order['amount'],
+                        pay_time=time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(order['pay_time'])) if order['pay_time'] else '无')
+
+@bp.route('/balance_query')
+def balance_query_page():
+    """渲染余额查询页面"""
+    return render_template('balance_query.html')
+
+
+### **模块7：API接口**
+def _too_many_requests(msg: str, retry_after: float) -> Response:
+    response = jsonify({"code": 429, "msg": msg})
+    response.status_code = 429
+    response.headers["Retry-After"] = str(max(1, math.ceil(retry_after)))
+    return response
+
+
+def _read_object():
+    """读取 JSON 对象请求体，返回 (data, 错误响应)；请求体缺失、无法解析或不是对象时返回400"""
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        return None, (jsonify({"code": 400, "msg": "请求体无效"}), 400)
+    return data, None
+
+
+def _body_account(ctx, data) -> Optional[str]:
     account = data.get("account")
-    amount = data.get("amount")
+    return account if isinstance(account, str) else None
+
+
+def _order_account(ctx, data) -> Optional[str]:
+    order_id = data.get("order_id")
+    order = ctx.store.get_order(order_id) if isinstance(order_id, str) else None
+    return order["account"] if order is not None else None
+
+
+def _is_admin() -> bool:
+    """请求是否携带与 ADMIN_TOKEN 一致的 X-Admin-Token，未配置令牌时一律为否"""
+    admin_token = current_app.config["ADMIN_TOKEN"]
+    supplied = request.headers.get("X-Admin-Token", "")
+    return bool(admin_token) and hmac.compare_digest(supplied.encode(), admin_token.encode())
+
+
+def admin_required(view):
+    """要求请求携带与 ADMIN_TOKEN 一致的 X-Admin-Token(退款等资金操作与调试接口)，未配置令牌时一律拒绝"""
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        if not _is_admin():
+            return jsonify({"code": 403, "msg": "forbidden"}), 403
+        return view(*args, **kwargs)
+    return wrapper
+
+
+def admission_controlled(scope: str, account: Optional[Callable] = None):
+    """限流与准入控制：先按客户端IP与账户限流，再检查进程内在途请求数，
+    均在接口开始实际处理之前以 429 + Retry-After 拒绝
+
+    :param account: 从 (ctx, 请求体) 取出账户的函数，缺省只按IP限流
+    """
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            ctx = get_context()
+            if ctx.config["RATE_LIMIT_ENABLED"]:
+                data = request.get_json(silent=True) if account is not None else None
+                retry_after = ctx.check_rate_limits(
+                    scope, request.remote_addr, account(ctx, data) if isinstance(data, dict) else None)
+                if retry_after:
+                    return _too_many_requests("请求过于频繁，请稍后重试", retry_after)
+            if not ctx.admission.try_acquire():
+                return _too_many_requests("服务繁忙，请稍后重试", 1)
+            try:
+                return view(*args, **kwargs)
+            finally:
+                ctx.admission.release()
+        return wrapper
+    return decorator
+
+
+@bp.route("/api/place_order", methods=["POST"])
+@admission_controlled("place_order", account=_body_account)
+def place_order():
+    """创建订单接口(支持 Idempotency-Key，重试不会重复下单)"""
+    ctx = get_context()
+    data, error = _read_object()
+    if error:
+        return error
+    return _idempotent("place_order", data,
+                       lambda: ctx.orders.place_order(data.get("account"), data.get("amount")))
+
 
-    # 校验参数
-    if not account or not amount: # Added check for missing account or amount
-        return jsonify({"code": 400, "msg": "缺少账号或金额参数"}), 400
+def _idempotent(scope: str, data, handler):
+    """请求携带 Idempotency-Key 时经幂等缓存执行 handler，否则直接执行；handler 返回 (响应体, HTTP状态码)"""
+    key = request.headers.get("Idempotency-Key")
+    if not key:
+        body, status_code = handler()
+        return jsonify(body), status_code
+    if len(key) > 255:
+        return jsonify({"code": 400, "msg": "Idempotency-Key 过长"}), 400
 
     try:
-        amount = float(amount) # Ensure amount is a float
-    except (ValueError, TypeError):
-        return jsonify({"code": 400, "msg": "金额格式无效"}), 400
+        body, status_code, replayed = get_context().idempotency.execute(scope, key, fingerprint(data), handler)
+    except IdempotencyConflict:
+        return jsonify({"code": 422, "msg": "Idempotency-Key 已用于不同的请求"}), 422
+    except IdempotencyInProgress:
+        return jsonify({"code": 409, "msg": "相同 Idempotency-Key 的请求正在处理，请稍后重试"}), 409
+    response = jsonify(body)
+    response.status_code = status_code
+    if replayed:
+        response.headers["Idempotent-Replayed"] = "true"
+    return response
+
+
+def _wants_ndjson() -> bool:
+    """客户端是否要求以 NDJSON 流式返回批量结果"""
+    return (request.args.get("stream") == "1"
+            or request.accept_mimetypes.best == "application/x-ndjson")
+
+
+def _ndjson_response(results) -> Response:
+    return Response((dumps_bytes(item) + b"\n" for item in results),
+                    mimetype="application/x-ndjson")
 
-    # 校验账号格式(支持11位手机号)
-    # 先去除前后空格
-    account = account.strip()
-    # 更严格的手机号验证
-    if not re.match(r'^1[3-9]\d{9}$', account) or len(account) != 11:
-        return jsonify({
-            "code": 400,
-            "msg": f"账号格式无效，请输入11位中国大陆手机号(如13812345678)，当前输入: {account} (长度: {len(account)})"
-        }), 400
 
-    if amount <= 0:
-        return jsonify({"code": 400, "msg": "金额无效"}), 400
+def _read_batch(field: str):
+    """读取批量请求数组，返回 (items, 错误响应)"""
+    data = request.get_json(silent=True)
+    items = data.get(field) if isinstance(data, dict) else data
+    if not isinstance(items, list) or not items:
+        return None, (jsonify({"code": 400, "msg": f"缺少{field}数组参数"}), 400)
+    max_size = current_app.config["MAX_BATCH_SIZE"]
+    if len(items) > max_size:
+        return None, (jsonify({"code": 400, "msg": f"单次最多{max_size}条"}), 400)
+    return items, None
+
+
+@bp.route("/api/place_orders", methods=["POST"])
+@admission_controlled("place_orders")
+def place_orders():
+    """批量创建订单接口
+
+    请求体为 {"orders": [{"account": ..., "amount": ...}, ...]}，返回逐条结果；
+    请求头 Accept: application/x-ndjson 或参数 stream=1 时以 NDJSON 流式返回。
+    """
+    ctx = get_context()
+    items, error = _read_batch("orders")
+    if error:
+        return error
+
+    results = ctx.orders.create_orders(items)
+    if _wants_ndjson():
+        return _ndjson_response(results)
+    return jsonify({
+        "code": 200,
+        "succeeded": sum(1 for item in results if item["code"] == 200),
+        "results": results
+    }), 200
 
-    # 自动创建新用户(如果不存在)
-    if account not in DB["users"]:
-        DB["users"][account] = {"balance": 0.0, "update_time": time.time()}
 
-    # 检查余额是否充足
-    if DB["users"][account].get("balance", 0) < amount:
-         return jsonify({"code": 400, "msg": "余额不足"}), 400
+@bp.route("/api/order_status:batch", methods=["POST"])
+def check_order_status_batch():
+    """批量查询订单状态接口，请求体为 {"order_ids": [...]}"""
+    ctx = get_context()
+    order_ids, error = _read_batch("order_ids")
+    if error:
+        return error
 
-    # 生成订单
-    order_id = OrderService.create_order(account, amount)
-    return jsonify({"code": 200, "order_id": order_id}), 200
+    def results():
+        # 分块读取，流式返回时无需一次性加载全部订单
+        for start in range(0, len(order_ids), 500):
+            chunk = order_ids[start:start + 500]
+            orders = ctx.store.get_orders(order_id for order_id in chunk if isinstance(order_id, str))
+            for order_id in chunk:
+                order = orders.get(order_id) if isinstance(order_id, str) else None
+                if order is None and isinstance(order_id, str):
+                    order = ctx.store.get_archived_order(order_id)
+                if order is None:
+                    yield {"order_id": order_id, "code": 404, "msg": "订单不存在"}
+                else:
+                    yield {"order_id": order_id, "code": 200, "status": order["status"],
+                           "amount": order["amount"]}
 
+    if _wants_ndjson():
+        return _ndjson_response(results())
+    return jsonify({"code": 200, "results": list(results())}), 200
 
-@app.route("/api/pay", methods=["POST"])
+
+@bp.route("/api/pay", methods=["POST"])
+@admission_controlled("pay", account=_order_account)
 def process_payment():
-    """支付处理接口(支持二维码支付)
+    """支付处理接口(支持二维码支付与 Idempotency-Key)
     根据MOCK_MODE决定使用模拟支付还是真实支付
     """
-    data = request.json
-    order_id = data.get("order_id")
-    payment_method = data.get("payment_method", "direct")  # direct/qr_code
-    
-    if order_id not in DB["orders"]:
-        return jsonify({"code": 404, "msg": "订单不存在"}), 404
-    
-    order = DB["orders"][order_id]
-    
-    # 如果是二维码支付，返回二维码信息
-    if payment_method == "qr_code":
-        qr_data = PaymentService.generate_qr_code(order_id, order["amount"])
-        return jsonify({
-            "code": 200,
-            "payment_method": "qr_code",
-            "data": qr_data
-        }), 200
-    
-    # 根据模式选择支付方式
-    if MOCK_MODE:
-        pay_result = PaymentService.simulate_payment(order_id)
-    else:
-        # TODO: 调用真实支付接口
-        return jsonify({"code": 501, "msg": "真实支付功能暂未实现"}), 501
-    if pay_result["status"] == PaymentStatus.PAID.value:
-        OrderService.update_order_status(order_id, "paid")
-        # 支付成功后扣除用户余额
-        order = DB["orders"][order_id]
-        if order["account"] in DB["users"]:
-            # 再次校验余额(防止并发问题)
-            if DB["users"][order["account"]]["balance"] >= order["amount"]:
-                DB["users"][order["account"]]["balance"] -= order["amount"]
-                DB["users"][order["account"]]["update_time"] = time.time()
-            else:
-                # 余额不足，回滚订单状态
-                OrderService.update_order_status(order_id, "failed")
-                return jsonify({"code": 400, "msg": "Insufficient balance"}), 400
-        return jsonify({
-            "code": 200,
-            "msg": "Payment succeeded",
-            "transaction_id": pay_result["transaction_id"]
-        }), 200
-    return jsonify({"code": 400, "msg": "支付失败"}), 400
-
-
-@app.route("/api/generate_qr_payment", methods=["POST"])
+    ctx = get_context()
+    data, error = _read_object()
+    if error:
+        return error
+    return _idempotent("pay", data, lambda: ctx.payments.process(
+        data.get("order_id"), data.get("payment_method", "direct")))
+
+
+@bp.route("/api/generate_qr_payment", methods=["POST"])
+@admission_controlled("generate_qr_payment", account=_order_account)
 def generate_qr_payment():
     """创建支付二维码接口"""
-    data = request.json
+    ctx = get_context()
+    data, error = _read_object()
+    if error:
+        return error
     order_id = data.get("order_id")
     
-    if not order_id or order_id not in DB["orders"]:
+    order = ctx.store.get_order(order_id) if order_id else None
+    if order is None:
         return jsonify({"code": 404, "msg": "订单不存在"}), 404
     
-    order = DB["orders"][order_id]
     if order["status"] != "pending":
         return jsonify({"code": 400, "msg": "订单状态不允许支付"}), 400
-    
+
+    fmt = data.get("format", "png")  # png/svg/matrix
+    if fmt not in QR_FORMATS:
+        return jsonify({"code": 400, "msg": "二维码格式无效"}), 400
+
     # 生成二维码
-    qr_data = PaymentService.generate_qr_code(order_id, order["amount"])
+    qr_data = ctx.payments.generate_qr_code(order_id, order["amount"], fmt)
     
     return jsonify({
         "code": 200,
         "data": qr_data
     }), 200
 
-@app.route("/api/check_order_status", methods=["GET"])
+@bp.route("/api/prerender_qr", methods=["POST"])
+@admission_controlled("prerender_qr")
+def prerender_qr():
+    """批量预渲染二维码接口(进程池并行渲染并写入缓存)"""
+    ctx = get_context()
+    data, error = _read_object()
+    if error:
+        return error
+    order_ids = data.get("order_ids")
+    fmt = data.get("format", "png")
+    if not isinstance(order_ids, list) or not order_ids:
+        return jsonify({"code": 400, "msg": "缺少订单列表参数"}), 400
+    if fmt not in QR_FORMATS:
+        return jsonify({"code": 400, "msg": "二维码格式无效"}), 400
+
+    results = ctx.payments.generate_qr_codes(order_ids, fmt)
+    return jsonify({
+        "code": 200,
+        "count": len(results),
+        "order_ids": [item["order_id"] for item in results]
+    }), 200
+
+@bp.route("/api/check_order_status", methods=["GET"])
 def check_order_status():
     """获取订单状态接口"""
+    ctx = get_context()
     order_id = request.args.get("order_id")
-    if not order_id or order_id not in DB["orders"]:
+    summary = ctx.orders.get_order_status(order_id) if order_id else None
+    if summary is None:
         return jsonify({"code": 404, "msg": "订单不存在"}), 404
-    
-    order = DB["orders"][order_id]
+
+    status, amount = summary
+    return jsonify({"code": 200, "status": status, "order_id": order_id, "amount": amount}), 200
+
+@bp.route("/api/orders", methods=["GET"])
+def list_orders():
+    """订单列表接口
+
+    可按 account、status 与时间范围 [start, end) 过滤，time_field 为 create_time(默认) 或 pay_time，
+    order 为 desc(默认，最新在前) 或 asc；结果按游标分页，将响应中的 next_cursor 作为 cursor 参数取下一页。
+    不指定 account 的全量查询需携带管理令牌(X-Admin-Token)。
+    """
+    ctx = get_context()
+    args = request.args
+    account = args.get("account") or None
+    if account is None and not _is_admin():
+        return jsonify({"code": 403, "msg": "查询全部订单需要管理令牌，请指定 account"}), 403
+    time_field = args.get("time_field", "create_time")
+    if time_field not in ORDER_TIME_FIELDS:
+        return jsonify({"code": 400, "msg": "时间字段无效"}), 400
+    order = args.get("order", "desc")
+    if order not in ("asc", "desc"):
+        return jsonify({"code": 400, "msg": "排序参数无效"}), 400
+    try:
+        limit = int(args.get("limit", 50))
+        start = float(args["start"]) if "start" in args else None
+        end = float(args["end"]) if "end" in args else None
+    except ValueError:
+        return jsonify({"code": 400, "msg": "分页或时间参数无效"}), 400
+    max_page_size = ctx.config["MAX_PAGE_SIZE"]
+    if not 0 < limit <= max_page_size:
+        return jsonify({"code": 400, "msg": f"limit 取值范围为 1-{max_page_size}"}), 400
+
+    try:
+        orders, next_cursor = ctx.orders.list_orders(
+            account=account, status=args.get("status") or None,
+            time_field=time_field, start=start, end=end, cursor=args.get("cursor"),
+            limit=limit, descending=order == "desc")
+    except ValueError:
+        return jsonify({"code": 400, "msg": "游标无效"}), 400
+    return jsonify({"code": 200, "orders": orders, "next_cursor": next_cursor}), 200
+
+def _sse_message(order_id: str, status: str) -> str:
+    return f"event: status\ndata: {dumps_bytes({'order_id': order_id, 'status': status}).decode()}\n\n"
+
+@bp.route("/api/order_events", methods=["GET"])
+def order_events_stream():
+    """订单状态推送接口(Server-Sent Events)
+
+    连接建立后立即推送当前状态，此后每次状态变化推送一条 status 事件，
+    订单进入终态或超过最长保持时间后结束。连接数达到上限时返回 503，客户端退化为轮询。
+    """
+    ctx = get_context()
+    order_id = request.args.get("order_id")
+    # 含已归档订单：等待期间订单可能被归档
+    order = ctx.orders.get_order(order_id) if order_id else None
+    if order is None:
+        return jsonify({"code": 404, "msg": "订单不存在"}), 404
+    if not ctx.order_event_slots.try_acquire():
+        response = jsonify({"code": 503, "msg": "推送连接已满，请改用轮询"})
+        response.status_code = 503
+        response.headers["Retry-After"] = "5"
+        return response
+    heartbeat = ctx.config["ORDER_EVENTS_HEARTBEAT"]
+    max_duration = ctx.config["ORDER_EVENTS_MAX_DURATION"]
+
+    def stream():
+        with ctx.order_events.subscribe(order_id) as subscription:
+            # 先订阅再读取当前状态，避免遗漏两者之间发生的变化
+            status = (ctx.orders.get_order(order_id) or order)["status"]
+            yield "retry: 3000\n" + _sse_message(order_id, status)
+            deadline = time.monotonic() + max_duration
+            while status not in FINAL_ORDER_STATUSES and time.monotonic() < deadline:
+                event = subscription.get(timeout=heartbeat)
+                if event is None:
+                    # 心跳时重新读取存储，兼容其他worker进程中发生的状态变化
+                    current = ctx.orders.get_order(order_id)
+                    if current is None:
+                        break
+                    if current["status"] == status:
+                        yield ": keepalive\n\n"
+                        continue
+                    event = {"status": current["status"]}
+                if event["status"] != status:
+                    status = event["status"]
+                    yield _sse_message(order_id, status)
+
+    response = Response(stream(), mimetype="text/event-stream",
+                        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+    # 服务器关闭响应时释放连接名额(客户端在开始读取前断开时生成器不会执行)
+    response.call_on_close(ctx.order_event_slots.release)
+    return response
+
+@bp.route("/api/wait_order_status", methods=["GET"])
+def wait_order_status():
+    """订单状态长轮询接口: 状态与 since 不同或超时后返回；等待连接数达到上限时立即返回当前状态"""
+    ctx = get_context()
+    order_id = request.args.get("order_id")
+    since = request.args.get("since", "pending")
+    try:
+        timeout = min(float(request.args.get("timeout", 25)), ctx.config["ORDER_EVENTS_MAX_DURATION"])
+    except ValueError:
+        return jsonify({"code": 400, "msg": "超时参数无效"}), 400
+    # 含已归档订单：等待期间订单可能被归档
+    order = ctx.orders.get_order(order_id) if order_id else None
+    if order is None:
+        return jsonify({"code": 404, "msg": "订单不存在"}), 404
+    heartbeat = ctx.config["ORDER_EVENTS_HEARTBEAT"]
+    waiting = timeout > 0 and ctx.order_event_slots.try_acquire()
+    if not waiting:
+        timeout = 0
+
+    try:
+        with ctx.order_events.subscribe(order_id) as subscription:
+            order = ctx.orders.get_order(order_id) or order
+            deadline = time.monotonic() + timeout
+            while order["status"] == since:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                subscription.get(timeout=min(remaining, heartbeat))
+                order = ctx.orders.get_order(order_id) or order
+    finally:
+        if waiting:
+            ctx.order_event_slots.release()
+
     return jsonify({
         "code": 200,
         "status": order["status"],
@@ -273,64 +1351,213 @@ def check_order_status():
         "amount": order["amount"]
     }), 200
 
-@app.route('/qr_payment')
+@bp.route('/qr_payment')
 def qr_payment_page():
-    """二维码支付展示页面"""
+    """二维码支付展示页面
+
+    只为待支付订单渲染(并缓存)二维码；已支付、过期、失败或退款的订单(含已归档订单)跳转到支付结果页。
+    """
+    ctx = get_context()
     order_id = request.args.get('order_id')
-    if not order_id or order_id not in DB["orders"]:
+    order = ctx.orders.get_order(order_id) if order_id else None
+    if order is None:
         return "订单不存在", 404
+    if order["status"] != "pending":
+        if order["status"] in ("paid", "recharged"):
+            result = {"status": "success"}
+        else:
+            result = {"status": "fail", "msg": QR_CLOSED_MESSAGES.get(order["status"], "订单状态不允许支付")}
+        return redirect(url_for("payment.payment_callback_page", order_id=order_id, amount=order["amount"],
+                                **result))
     
-    order = DB["orders"][order_id]
-    qr_data = PaymentService.generate_qr_code(order_id, order["amount"])
+    qr_data = ctx.payments.generate_qr_code(order_id, order["amount"])
     
     return render_template('qr_payment.html',
                          order_id=order_id,
                          amount=order["amount"],
                          qr_code=qr_data["qr_code"])
 
-@app.route("/api/payment_callback", methods=["POST"])
+@bp.route("/api/payment_callback", methods=["POST"])
 def payment_callback():
     """支付回调处理接口(需保证安全性)"""
-    params = request.json
-    order_id = params.get("order_id")
+    ctx = get_context()
+    params = request.get_json(silent=True)
+    if not isinstance(params, dict):
+        return jsonify({"code": 400, "msg": "请求体无效"}), 400
 
-    # 校验签名（简化逻辑）
-    if not PaymentService.verify_signature(params):
+    verified = ctx.payments.verify_signature(params)
+    if verified == "replayed":
+        # 重复投递在读取订单前直接应答
+        return jsonify({"code": 200, "msg": "Already processed"}), 200
+    if verified == "expired":
+        return jsonify({"code": 403, "msg": "回调已过期"}), 403
+    if verified != "valid":
         return jsonify({"code": 403, "msg": "签名无效"}), 403
 
-    # 处理支付结果
-    if DB["orders"][order_id]["status"] == "paid":
-        return jsonify({"code": 200, "msg": "Already processed"}), 200  # 幂等性处理
+    # 验签时已登记 nonce；处理失败(异常或非 2xx 应答)时释放，网关重试同一回调时重新处理
+    try:
+        body, status_code = _handle_payment_callback(ctx, params)
+    except Exception:
+        ctx.payments.release_signature(params)
+        raise
+    if status_code >= 300:
+        ctx.payments.release_signature(params)
+    return jsonify(body), status_code
+
+
+def _handle_payment_callback(ctx: PaymentContext, params: dict):
+    """处理已通过验签的支付回调，返回 (响应体, 状态码)"""
+    order_id = params.get("order_id")
+    order = ctx.store.get_order(order_id) if order_id else None
+    if order is None:
+        if order_id and ctx.store.get_archived_order(order_id) is not None:
+            # 已归档的订单早已处理完毕，迟到的重复回调直接应答，避免网关不断重试
+            return {"code": 200, "msg": "Already processed"}, 200
+        return {"code": 404, "msg": "订单不存在"}, 404
+
+    # 处理支付结果：只有待支付订单可以充值，其他状态(含已退款、失败、过期)都已处理完毕
+    if order["status"] not in RechargeService.RECHARGEABLE_STATUSES:
+        return {"code": 200, "msg": "Already processed"}, 200  # 幂等性处理
+
+    # 异步模式：入队后立即应答，充值与通知由后台worker处理
+    if ctx.callbacks.enqueue({"order_id": order_id, "received_time": time.time()}):
+        return {"code": 200, "msg": "Callback accepted"}, 200
 
-    # 触发充值（异步或同步，示例中直接调用）
-    order = DB["orders"][order_id]
-    if RechargeService.recharge(order["account"], order["amount"], order_id):
-        # 通知用户（示例中用打印模拟，实际需用WebSocket/短信等）
-        print(f"Recharged {order['amount']} to {order['account']}")
-        return jsonify({"code": 200, "msg": "Recharge succeeded"}), 200
-    return jsonify({"code": 500, "msg": "充值失败"}), 500
+    # 同步模式：在请求线程内触发充值
+    if ctx.recharges.recharge(order["account"], order["amount"], order_id):
+        ctx.notifications.notify_recharged(order["account"], order["amount"], order_id)
+        return {"code": 200, "msg": "Recharge succeeded"}, 200
+    # 并发的重复回调已完成充值
+    return {"code": 200, "msg": "Already processed"}, 200
 
 
-@app.route("/api/check_balance", methods=["GET"])
+@bp.route("/api/callback_queue/metrics", methods=["GET"])
+def callback_queue_metrics():
+    """回调队列指标(队列深度、批大小、处理延迟)"""
+    ctx = get_context()
+    mode = ctx.config["CALLBACK_MODE"]
+    if ctx.callback_workers is None:
+        return jsonify({"code": 200, "mode": mode, "metrics": None}), 200
+    return jsonify({"code": 200, "mode": mode, "metrics": ctx.callback_workers.metrics()}), 200
+
+
+@bp.route("/api/refund", methods=["POST"])
+@admin_required
+def refund():
+    """退款接口(全额退款，可重复调用)"""
+    ctx = get_context()
+    data, error = _read_object()
+    if error:
+        return error
+    body, status_code = ctx.refunds.refund(data.get("order_id"))
+    return jsonify(body), status_code
+
+
+@bp.route("/api/refunds:batch", methods=["POST"])
+@admin_required
+def refund_batch():
+    """批量退款接口，请求体为 {"order_ids": [...], "reason": "..."}，返回任务ID，由后台任务并行处理"""
+    order_ids, error = _read_batch("order_ids")
+    if error:
+        return error
+    if not all(isinstance(order_id, str) for order_id in order_ids):
+        return jsonify({"code": 400, "msg": "订单ID格式无效"}), 400
+    data = request.get_json(silent=True)
+    reason = data.get("reason", "") if isinstance(data, dict) else ""
+    runner = get_context().get_refund_runner()
+    job = runner.jobs.create_job(order_ids, reason=str(reason))
+    runner.notify()
+    return jsonify(dict(job, code=202)), 202
+
+
+@bp.route("/api/refund_jobs/<job_id>", methods=["GET"])
+@admin_required
+def refund_job_status(job_id):
+    """批量退款任务进度"""
+    job = get_context().get_refund_runner().jobs.get_job(job_id)
+    if job is None:
+        return jsonify({"code": 404, "msg": "任务不存在"}), 404
+    return jsonify(dict(job, code=200)), 200
+
+
+@bp.route("/api/reconcile/metrics", methods=["GET"])
+def reconcile_metrics():
+    """对账指标(吞吐、滞后、各结果类别计数)"""
+    ctx = get_context()
+    metrics = dict(ctx.reconciler.metrics(), leader=ctx.reconciler_running)
+    return jsonify({"code": 200, "enabled": ctx.config["RECONCILE_ENABLED"], "metrics": metrics}), 200
+
+
+@bp.route("/api/check_balance", methods=["GET"])
 def check_balance():
     """账户余额查询接口"""
+    ctx = get_context()
     account = request.args.get("account")
+    # 只读取余额、版本与更新时间，不复制用户记录
+    balance = None
+    if account:
+        balance = ctx.balance_cache.get(account) if ctx.balance_cache else ctx.store.get_balance(account)
+    balance_cents, version, update_time = balance if balance is not None else (0, 0, 0)
+    # 余额未变时客户端凭 If-None-Match 得到不带响应体的 304(no-cache: 浏览器每次都带 ETag 重新验证)
+    etag = f"{version}-{update_time!r}"
+    if etag in request.if_none_match:
+        response = Response(status=304)
+    else:
+        response = jsonify({"code": 200, "account": account, "balance": from_cents(balance_cents),
+                            "update_time": update_time})
+    response.set_etag(etag)
+    response.headers["Cache-Control"] = "no-cache"
+    return response
+
+
+@bp.route("/metrics", methods=["GET"])
+def metrics():
+    """Prometheus 指标导出"""
+    return Response(REGISTRY.render(), mimetype="text/plain; version=0.0.4")
+
+
+@bp.route("/debug/profiler", methods=["GET", "POST"])
+@admin_required
+def debug_profiler():
+    """采样分析器开关(POST)与折叠栈导出(GET)，需携带 X-Admin-Token"""
+    if request.method == "GET":
+        return Response(PROFILER.collapsed(), mimetype="text/plain")
+
+    data, error = _read_object()
+    if error:
+        return error
+    if data.get("reset"):
+        PROFILER.reset()
+    if "enabled" in data:
+        if data["enabled"]:
+            interval_ms = data.get("interval_ms")
+            slow_ms = data.get("slow_ms")
+            PROFILER.start(
+                interval=float(interval_ms) / 1000 if interval_ms is not None else None,
+                slow_threshold=float(slow_ms) / 1000 if slow_ms is not None else None
+            )
+        else:
+            PROFILER.stop()
     return jsonify({
         "code": 200,
-        "account": account,
-        "balance": DB["users"].get(account, {"balance": 0.0, "update_time": 0})["balance"],
-        "update_time": DB["users"].get(account, {"balance": 0.0, "update_time": 0})["update_time"]
+        "enabled": PROFILER.enabled,
+        "interval_ms": PROFILER.interval * 1000,
+        "slow_ms": PROFILER.slow_threshold * 1000,
+        "slow_requests": PROFILER.slow_requests,
+        "stacks": len(PROFILER.stacks)
     }), 200
 
 
-@app.route("/api/payment_mode", methods=["GET"])
+@bp.route("/api/payment_mode", methods=["GET"])
 def get_payment_mode():
     """查询当前支付模式"""
+    mock_mode = current_app.config["MOCK_MODE"]
     return jsonify({
         "code": 200,
-        "mock_mode": MOCK_MODE,
-        "message": "模拟模式已启用" if MOCK_MODE else "真实支付模式"
+        "mock_mode": mock_mode,
+        "message": "模拟模式已启用" if mock_mode else "真实支付模式"
     }), 200
 
 if __name__ == "__main__":
-    app.run(debug=True, host='0.0.0.0', port=5000)
\ No newline at end of file
+    # 开发服务器(生产部署见 wsgi.py / gunicorn.conf.py)；FLASK_DEBUG=1 时开启调试模式
+    create_app().run(debug=os.getenv('FLASK_DEBUG', '0') == '1', host='0.0.0.0', port=5000, threaded=True)
\ No newline at end of file
@@ -0,0 +1,284 @@
+"""ASGI 入口
+
+/api/pay 等需要调用支付网关的接口以协程方式处理(AsyncPaymentGateway)，
+网关请求期间不占用线程，单进程可同时保持数百个进行中的网关调用；
+订单状态推送(/api/order_events)与长轮询(/api/wait_order_status)同样以协程等待状态变化，
+大量打开的支付页面不会占满线程池；其余路由转交 Flask 应用在线程池中执行，行为与 WSGI 部署一致。
+
+启动示例: uvicorn asgi:application --port 5000 --workers 4
+(每个 worker 进程导入本模块时各自创建应用、存储与网关连接池)
+"""
+import asyncio
+import io
+import math
+import sys
+import time
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import parse_qs
+
+import app as payment_app
+from admin.__main__ import PaymentMethod, GatewayError, CircuitOpenError
+from admin.async_gateway import AsyncPaymentGateway
+from json_provider import dumps_bytes, loads
+
+flask_app = payment_app.create_app()
+context = payment_app.get_context(flask_app)
+store = context.store
+
+# 与同步网关共用配置与二维码缓存(订单状态变化时的缓存驱逐对两者同时生效)
+async_gateway = AsyncPaymentGateway(context.payment_gateway.config)
+async_gateway.qr_cache = context.payment_gateway.qr_cache
+
+
+async def _read_body(receive) -> bytes:
+    chunks = []
+    while True:
+        message = await receive()
+        chunks.append(message.get("body", b""))
+        if not message.get("more_body"):
+            return b"".join(chunks)
+
+
+async def _send_json(send, body: Dict, status: int = 200, headers: List[Tuple[bytes, bytes]] = ()) -> None:
+    payload = dumps_bytes(body)
+    await send({"type": "http.response.start", "status": status,
+                "headers": [(b"content-type", b"application/json"),
+                            (b"content-length", str(len(payload)).encode()), *headers]})
+    await send({"type": "http.response.body", "body": payload})
+
+
+async def pay(scope, receive, send) -> None:
+    """支付处理接口(异步版本，逻辑与 app.process_payment 一致)"""
+    try:
+        data = loads(await _read_body(receive) or b"{}")
+    except ValueError:
+        data = None
+    if not isinstance(data, dict):
+        return await _send_json(send, {"code": 400, "msg": "请求体无效"}, 400)
+    order_id = data.get("order_id")
+    payment_method = data.get("payment_method", "direct")  # direct/qr_code
+
+    order = await asyncio.to_thread(store.get_order, order_id) if order_id else None
+    error = context.payments.check_payable(order)
+    if error is not None:
+        return await _send_json(send, *error)
+
+    # 限流与 Flask 接口共用令牌桶；协程不占线程，不做在途请求数限制
+    client = scope.get("client")
+    retry_after = await asyncio.to_thread(context.check_rate_limits, "pay", client[0] if client else None,
+                                          order["account"])
+    if retry_after:
+        return await _send_json(send, {"code": 429, "msg": "请求过于频繁，请稍后重试"}, 429,
+                                [(b"retry-after", str(max(1, math.ceil(retry_after))).encode())])
+
+    # 如果是二维码支付，返回二维码信息
+    if payment_method == "qr_code":
+        qr_data = await asyncio.to_thread(async_gateway.generate_qr_code, order_id, order["amount"])
+        return await _send_json(send, {"code": 200, "payment_method": "qr_code", "data": qr_data})
+
+    try:
+        pay_result = await async_gateway.process_payment(order_id, order["amount"], PaymentMethod.DIRECT)
+    except CircuitOpenError:
+        return await _send_json(send, {"code": 503, "msg": "支付网关暂不可用，请稍后重试"}, 503)
+    except GatewayError:
+        return await _send_json(send, {"code": 502, "msg": "支付网关调用失败"}, 502)
+
+    body, status = await asyncio.to_thread(context.payments.settle, order_id, order, pay_result)
+    await _send_json(send, body, status)
+
+
+def _query(scope) -> Dict[str, str]:
+    return {name: values[-1] for name, values in parse_qs(scope.get("query_string", b"").decode("latin-1")).items()}
+
+
+async def _wait_disconnect(receive) -> None:
+    while (await receive())["type"] != "http.disconnect":
+        pass
+
+
+class _EventWaiter:
+    """在协程中等待订单事件：发布方线程经 call_soon_threadsafe 唤醒事件循环，等待期间不占用线程；
+    同时监听客户端断开"""
+
+    def __init__(self, order_id: str, receive):
+        loop = asyncio.get_running_loop()
+        self.wakeup = asyncio.Event()
+        self.subscription = context.order_events.subscribe(
+            order_id, listener=lambda: loop.call_soon_threadsafe(self.wakeup.set))
+        self.disconnected = asyncio.ensure_future(_wait_disconnect(receive))
+
+    async def get(self, timeout: float) -> Optional[Dict]:
+        """等待下一条事件，超时或客户端断开返回 None"""
+        event = self.subscription.get(timeout=0)
+        if event is None and not self.disconnected.done():
+            waiter = asyncio.ensure_future(self.wakeup.wait())
+            await asyncio.wait({waiter, self.disconnected}, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+            waiter.cancel()
+            self.wakeup.clear()
+            event = self.subscription.get(timeout=0)
+        return event
+
+    def close(self) -> None:
+        self.subscription.close()
+        self.disconnected.cancel()
+
+
+async def order_events(scope, receive, send) -> None:
+    """订单状态推送接口(协程版本，逻辑与 app.order_events_stream 一致，不受每进程推送连接数上限限制)"""
+    order_id = _query(scope).get("order_id")
+    # 含已归档订单：等待期间订单可能被归档
+    order = await asyncio.to_thread(context.orders.get_order, order_id) if order_id else None
+    if order is None:
+        return await _send_json(send, {"code": 404, "msg": "订单不存在"}, 404)
+    heartbeat = context.config["ORDER_EVENTS_HEARTBEAT"]
+
+    waiter = _EventWaiter(order_id, receive)
+    try:
+        # 先订阅再读取当前状态，避免遗漏两者之间发生的变化
+        status = (await asyncio.to_thread(context.orders.get_order, order_id) or order)["status"]
+        await send({"type": "http.response.start", "status": 200,
+                    "headers": [(b"content-type", b"text/event-stream; charset=utf-8"),
+                                (b"cache-control", b"no-cache"), (b"x-accel-buffering", b"no")]})
+        message = "retry: 3000\n" + payment_app._sse_message(order_id, status)
+        await send({"type": "http.response.body", "body": message.encode(), "more_body": True})
+        deadline = time.monotonic() + context.config["ORDER_EVENTS_MAX_DURATION"]
+        while status not in payment_app.FINAL_ORDER_STATUSES and time.monotonic() < deadline:
+            event = await waiter.get(heartbeat)
+            if waiter.disconnected.done():
+                return
+            if event is None:
+                # 心跳时重新读取存储，兼容其他worker进程中发生的状态变化
+                current = await asyncio.to_thread(context.orders.get_order, order_id)
+                if current is None:
+                    break
+                if current["status"] == status:
+                    await send({"type": "http.response.body", "body": b": keepalive\n\n", "more_body": True})
+                    continue
+                event = {"status": current["status"]}
+            if event["status"] != status:
+                status = event["status"]
+                await send({"type": "http.response.body", "more_body": True,
+                            "body": payment_app._sse_message(order_id, status).encode()})
+        await send({"type": "http.response.body", "body": b""})
+    finally:
+        waiter.close()
+
+
+async def wait_order_status(scope, receive, send) -> None:
+    """订单状态长轮询接口(协程版本，逻辑与 app.wait_order_status 一致)"""
+    query = _query(scope)
+    order_id = query.get("order_id")
+    since = query.get("since", "pending")
+    try:
+        timeout = min(float(query.get("timeout", 25)), context.config["ORDER_EVENTS_MAX_DURATION"])
+    except ValueError:
+        return await _send_json(send, {"code": 400, "msg": "超时参数无效"}, 400)
+    # 含已归档订单：等待期间订单可能被归档
+    order = await asyncio.to_thread(context.orders.get_order, order_id) if order_id else None
+    if order is None:
+        return await _send_json(send, {"code": 404, "msg": "订单不存在"}, 404)
+    heartbeat = context.config["ORDER_EVENTS_HEARTBEAT"]
+
+    waiter = _EventWaiter(order_id, receive)
+    try:
+        order = await asyncio.to_thread(context.orders.get_order, order_id) or order
+        deadline = time.monotonic() + timeout
+        while order["status"] == since:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0 or waiter.disconnected.done():
+                break
+            await waiter.get(min(remaining, heartbeat))
+            order = await asyncio.to_thread(context.orders.get_order, order_id) or order
+    finally:
+        waiter.close()
+    await _send_json(send, {"code": 200, "status": order["status"], "order_id": order_id, "amount": order["amount"]})
+
+
+# 原生协程路由 {(method, path): handler}
+ASYNC_ROUTES = {
+    ("POST", "/api/pay"): pay,
+    ("GET", "/api/order_events"): order_events,
+    ("GET", "/api/wait_order_status"): wait_order_status,
+}
+
+
+def _build_environ(scope, body: bytes) -> Dict:
+    server = scope.get("server") or ("localhost", 80)
+    environ = {
+        "REQUEST_METHOD": scope["method"],
+        "SCRIPT_NAME": scope.get("root_path", ""),
+        "PATH_INFO": scope["path"],
+        "QUERY_STRING": scope.get("query_string", b"").decode("latin-1"),
+        "SERVER_NAME": server[0],
+        "SERVER_PORT": str(server[1]),
+        "SERVER_PROTOCOL": f"HTTP/{scope.get('http_version', '1.1')}",
+        "REMOTE_ADDR": (scope.get("client") or ("", 0))[0],
+        "CONTENT_LENGTH": str(len(body)),
+        "wsgi.version": (1, 0),
+        "wsgi.url_scheme": scope.get("scheme", "http"),
+        "wsgi.input": io.BytesIO(body),
+        "wsgi.errors": sys.stderr,
+        "wsgi.multithread": True,
+        "wsgi.multiprocess": False,
+        "wsgi.run_once": False,
+    }
+    for name, value in scope.get("headers", []):
+        key = name.decode("latin-1").upper().replace("-", "_")
+        value = value.decode("latin-1")
+        if key == "CONTENT_TYPE":
+            environ["CONTENT_TYPE"] = value
+        elif key != "CONTENT_LENGTH":
+            key = f"HTTP_{key}"
+            environ[key] = f"{environ[key]},{value}" if key in environ else value
+    return environ
+
+
+async def _call_wsgi(scope, receive, send) -> None:
+    """在线程池中执行 Flask 应用，逐块转发响应(支持 SSE 等流式响应)"""
+    environ = _build_environ(scope, await _read_body(receive))
+    started: List[Tuple[str, list]] = []
+
+    def start_response(status, headers, exc_info=None):
+        started[:] = [(status, headers)]
+
+    def call():
+        iterable = flask_app.wsgi_app(environ, start_response)
+        return iterable, iter(iterable)
+
+    iterable, chunks = await asyncio.to_thread(call)
+    try:
+        first = await asyncio.to_thread(next, chunks, None)
+        status, headers = started[0]
+        await send({"type": "http.response.start", "status": int(status.split(" ", 1)[0]),
+                    "headers": [(k.lower().encode("latin-1"), v.encode("latin-1")) for k, v in headers]})
+        chunk = first
+        while chunk is not None:
+            if chunk:
+                await send({"type": "http.response.body", "body": chunk, "more_body": True})
+            chunk = await asyncio.to_thread(next, chunks, None)
+        await send({"type": "http.response.body", "body": b""})
+    finally:
+        if hasattr(iterable, "close"):
+            await asyncio.to_thread(iterable.close)
+
+
+async def application(scope, receive, send) -> None:
+    if scope["type"] == "lifespan":
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                await async_gateway.aclose()
+                await asyncio.to_thread(context.close)
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+    if scope["type"] != "http":
+        return
+
+    handler = ASYNC_ROUTES.get((scope["method"], scope["path"]))
+    # 携带 Idempotency-Key 的请求交给 Flask 应用，经幂等缓存处理
+    if handler is not None and not any(name.lower() == b"idempotency-key" for name, _ in scope.get("headers", [])):
+        await handler(scope, receive, send)
+    else:
+        await _call_wsgi(scope, receive, send)
@@ -0,0 +1,93 @@
+"""账户余额读缓存
+
+/api/check_balance 的读取远多于余额变动，每个进程缓存账户的 (余额分, 版本, 更新时间)：
+- 本进程经 Ledger 的入账/扣款(充值、支付扣款、退款)完成后立即失效对应账户
+- 其他 worker 的变动通过共享存储的账本序号(账本条目自增ID)发现：读取时若距上次同步
+  超过 check_interval，查询该序号之后有变动的账户并逐个失效；check_interval 为 0 时每次读取都同步
+- 不存在的账户不缓存
+"""
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+
+class BalanceCache:
+    def __init__(self, store, max_size: int = 100000, check_interval: float = 0.1, sync_limit: int = 1000):
+        """
+        :param store: 存储后端(需实现 get_balance / balance_version / balance_changes)
+        :param check_interval: 两次同步共享账本序号的最小间隔(秒)，即其他 worker 变动的最大可见延迟
+        :param sync_limit: 单次同步读取的变动条数上限，超过时清空整个缓存
+        """
+        self.store = store
+        self.max_size = max_size
+        self.check_interval = check_interval
+        self.sync_limit = sync_limit
+        self._entries: "OrderedDict[str, Tuple[int, int, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._sync_lock = threading.Lock()
+        self._version = store.balance_version()
+        self._next_sync = time.monotonic() + check_interval
+        # 每次失效递增；未命中回填前后代数不同说明期间有变动，放弃回填
+        self._generation = 0
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def get(self, account: str) -> Optional[Tuple[int, int, float]]:
+        """读取 (余额分, 版本, 更新时间)，账户不存在返回 None"""
+        self._sync()
+        with self._lock:
+            entry = self._entries.get(account)
+            if entry is not None:
+                self._entries.move_to_end(account)
+                self.hits += 1
+                return entry
+            self.misses += 1
+            generation = self._generation
+        entry = self.store.get_balance(account)
+        if entry is not None:
+            with self._lock:
+                if generation == self._generation:
+                    self._entries[account] = entry
+                    if len(self._entries) > self.max_size:
+                        self._entries.popitem(last=False)
+        return entry
+
+    def invalidate(self, account: str) -> None:
+        """余额变动后调用(变动已写入存储)"""
+        with self._lock:
+            self._entries.pop(account, None)
+            self._generation += 1
+            self.invalidations += 1
+
+    def _sync(self) -> None:
+        """按共享账本序号失效其他进程变动过的账户"""
+        if time.monotonic() < self._next_sync:
+            return
+        with self._sync_lock:
+            if time.monotonic() < self._next_sync:
+                return
+            changes = self.store.balance_changes(self._version, self.sync_limit)
+            self._next_sync = time.monotonic() + self.check_interval
+            if not changes:
+                return
+            with self._lock:
+                if len(changes) >= self.sync_limit:
+                    self._entries.clear()
+                else:
+                    for _, account in changes:
+                        self._entries.pop(account, None)
+                self._generation += 1
+                self.invalidations += 1
+                self._version = changes[-1][0]
+
+    def metrics(self) -> Dict:
+        with self._lock:
+            return {
+                "size": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "invalidations": self.invalidations,
+                "version": self._version
+            }
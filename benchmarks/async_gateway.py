@@ -0,0 +1,158 @@
+"""同步与异步网关路径对比压测(离线，使用本地模拟网关)
+
+gateway 级别: PaymentGateway(线程池) vs AsyncPaymentGateway(单事件循环)
+app 级别:     Flask /api/pay(线程池 + test client) vs asgi.application /api/pay(进程内直接调用 ASGI)
+
+用法(在仓库根目录执行):
+    python -m benchmarks.async_gateway --latency-ms 50 --requests 2000
+    python -m benchmarks.async_gateway --level app --latency-ms 50 --inflight 256
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from admin.__main__ import PaymentGateway, PaymentMethod, serve_stub_in_process
+from admin.async_gateway import AsyncPaymentGateway
+
+API_SECRET = "bench-secret"
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="同步/异步网关路径对比压测")
+    parser.add_argument("--level", choices=("gateway", "app"), default="gateway")
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--threads", type=int, default=32, help="同步路径线程数")
+    parser.add_argument("--inflight", type=int, default=256, help="异步路径最大并发请求数")
+    parser.add_argument("--latency-ms", type=float, default=50.0, help="模拟网关注入延迟")
+    return parser.parse_args()
+
+
+def report(label, total, elapsed, latencies):
+    latencies.sort()
+    p = lambda q: latencies[min(len(latencies) - 1, int(len(latencies) * q))] * 1000
+    print(f"{label:<28} {total / elapsed:>8.0f} req/s  p50={p(0.5):7.2f}ms  p99={p(0.99):7.2f}ms")
+
+
+def run_sync(label, call, total, threads):
+    def timed(index):
+        started = time.perf_counter()
+        call(index)
+        return time.perf_counter() - started
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        latencies = list(executor.map(timed, range(total)))
+    report(label, total, time.perf_counter() - started, latencies)
+
+
+async def run_async(label, call, total, inflight):
+    semaphore = asyncio.Semaphore(inflight)
+
+    async def timed(index):
+        async with semaphore:
+            started = time.perf_counter()
+            await call(index)
+            return time.perf_counter() - started
+
+    started = time.perf_counter()
+    latencies = await asyncio.gather(*(timed(i) for i in range(total)))
+    report(label, total, time.perf_counter() - started, list(latencies))
+
+
+def bench_gateway(args, base_url):
+    config = {"gateway_url": base_url, "api_secret": API_SECRET, "mock_mode": False,
+              "http_pool_size": args.threads, "async_pool_size": args.inflight,
+              "breaker_threshold": 10 ** 6}
+    gateway = PaymentGateway(config)
+    async_gateway = AsyncPaymentGateway(config)
+    _quiet()
+
+    run_sync(f"sync  threads={args.threads}",
+             lambda i: gateway.process_payment(uuid.uuid4().hex, 1.0, PaymentMethod.DIRECT),
+             args.requests, args.threads)
+
+    async def main():
+        await run_async(f"async inflight={args.inflight}",
+                        lambda i: async_gateway.process_payment(uuid.uuid4().hex, 1.0, PaymentMethod.DIRECT),
+                        args.requests, args.inflight)
+        await async_gateway.aclose()
+
+    asyncio.run(main())
+
+
+async def asgi_post(application, path, body):
+    payload = json.dumps(body).encode()
+    scope = {"type": "http", "method": "POST", "path": path, "query_string": b"",
+             "headers": [(b"content-type", b"application/json")], "http_version": "1.1",
+             "scheme": "http", "server": ("bench", 80), "client": ("127.0.0.1", 0)}
+    response = {}
+
+    async def receive():
+        return {"type": "http.request", "body": payload, "more_body": False}
+
+    async def send(message):
+        if message["type"] == "http.response.start":
+            response["status"] = message["status"]
+
+    await application(scope, receive, send)
+    return response["status"]
+
+
+def bench_app(args, base_url):
+    os.environ.update(MOCK_MODE="false", GATEWAY_URL=base_url, API_SECRET=API_SECRET,
+                      GATEWAY_POOL_SIZE=str(args.threads), STORE_BACKEND="memory", RATE_LIMIT_ENABLED="false")
+    import asgi
+    _quiet()
+    context = asgi.context
+
+    account = "13812345678"
+    context.ledger.credit(account, 10 ** 12, "seed", "async-bench")
+
+    def new_orders():
+        results = context.orders.create_orders(
+            [{"account": account, "amount": 1} for _ in range(args.requests)])
+        return [item["order_id"] for item in results]
+
+    order_ids = new_orders()
+
+    def sync_call(index):
+        client = asgi.flask_app.test_client()
+        assert client.post("/api/pay", json={"order_id": order_ids[index]}).status_code == 200
+
+    run_sync(f"flask /api/pay threads={args.threads}", sync_call, args.requests, args.threads)
+
+    order_ids = new_orders()
+
+    async def main():
+        async def call(index):
+            assert await asgi_post(asgi.application, "/api/pay", {"order_id": order_ids[index]}) == 200
+        await run_async(f"asgi  /api/pay inflight={args.inflight}", call, args.requests, args.inflight)
+        await asgi.async_gateway.aclose()
+
+    asyncio.run(main())
+
+
+def _quiet():
+    for name in ("admin", "admin.payment_gateway", "admin.async_gateway", "werkzeug", "httpx"):
+        logging.getLogger(name).setLevel(logging.ERROR)
+
+
+def main():
+    args = parse_args()
+    _quiet()
+    # 模拟网关运行在独立进程中，避免与被测代码争用 GIL
+    stub, base_url = serve_stub_in_process(api_secret=API_SECRET, latency_ms=args.latency_ms)
+    print(f"stub={base_url} level={args.level} requests={args.requests} latency={args.latency_ms}ms")
+    try:
+        bench_gateway(args, base_url) if args.level == "gateway" else bench_app(args, base_url)
+    finally:
+        stub.terminate()
+
+
+if __name__ == "__main__":
+    main()
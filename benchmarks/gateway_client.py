@@ -0,0 +1,92 @@
+"""真实模式网关客户端压测(离线，使用本地模拟网关)
+
+对比共享连接池的 GatewayClient 与每次新建连接的调用方式，
+并可注入网关延迟/故障率验证超时、重试与熔断。
+
+用法(在仓库根目录执行):
+    python -m benchmarks.gateway_client --requests 2000 --concurrency 32
+    python -m benchmarks.gateway_client --latency-ms 20 --failure-rate 0.05
+"""
+import argparse
+import logging
+import statistics
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from admin.__main__ import PaymentGateway, PaymentMethod, GatewayError, serve_stub_in_thread
+
+API_SECRET = "bench-secret"
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="网关客户端压测")
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="模拟网关注入延迟")
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="模拟网关随机 503 概率")
+    return parser.parse_args()
+
+
+def run(label, call, total, concurrency):
+    latencies, failures = [], 0
+
+    def timed(index):
+        started = time.perf_counter()
+        try:
+            call(index)
+            return time.perf_counter() - started, None
+        except (GatewayError, requests.RequestException) as e:
+            return time.perf_counter() - started, e
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        for latency, error in executor.map(timed, range(total)):
+            latencies.append(latency)
+            failures += error is not None
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    p = lambda q: latencies[min(len(latencies) - 1, int(len(latencies) * q))] * 1000
+    print(f"{label:<22} {total / elapsed:>8.0f} req/s  p50={p(0.5):6.2f}ms  p95={p(0.95):6.2f}ms  "
+          f"p99={p(0.99):6.2f}ms  mean={statistics.mean(latencies) * 1000:6.2f}ms  failures={failures}")
+
+
+def main():
+    args = parse_args()
+    logging.getLogger("admin").setLevel(logging.ERROR)
+    logging.getLogger("werkzeug").setLevel(logging.ERROR)
+    server, base_url = serve_stub_in_thread(api_secret=API_SECRET, latency_ms=args.latency_ms,
+                                            failure_rate=args.failure_rate)
+    gateway = PaymentGateway({"gateway_url": base_url, "api_secret": API_SECRET, "mock_mode": False,
+                              "http_pool_size": args.concurrency, "max_retries": 3,
+                              "breaker_threshold": 10 ** 6})
+    logging.getLogger("admin.payment_gateway").setLevel(logging.ERROR)
+
+    print(f"stub={base_url} requests={args.requests} concurrency={args.concurrency} "
+          f"latency={args.latency_ms}ms failure_rate={args.failure_rate}")
+    try:
+        def fresh_connection(index):
+            response = requests.post(f"{base_url}/api/payments",
+                                     json={"order_id": uuid.uuid4().hex, "amount": 1, "method": "direct"},
+                                     headers={"X-Api-Key": API_SECRET, "Connection": "close"},
+                                     timeout=(2, 5))
+            response.raise_for_status()
+
+        def pooled(index):
+            gateway.process_payment(uuid.uuid4().hex, 1.0, method=PaymentMethod.DIRECT)
+
+        def status(index):
+            gateway.check_payment_status(uuid.uuid4().hex)
+
+        run("new connection/call", fresh_connection, args.requests, args.concurrency)
+        run("pooled process_payment", pooled, args.requests, args.concurrency)
+        run("pooled check_status", status, args.requests, args.concurrency)
+    finally:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
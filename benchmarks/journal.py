@@ -0,0 +1,97 @@
+"""追加日志微基准：组提交写入吞吐与崩溃恢复耗时
+
+- 写入：多个线程并发执行 入账(apply_balance_delta)，每次写入都等待落盘，
+  对比不同线程数下的吞吐与每次 fsync 平均提交的记录数
+- 恢复：写入 --events 条日志后模拟崩溃(不生成最终快照)，分别测量
+  只靠日志全量回放与 加载快照 + 回放尾部 的恢复耗时
+
+用法(在仓库根目录执行):
+    python -m benchmarks.journal --threads 1,8,64 --writes 20000
+    python -m benchmarks.journal --events 1000000 --snapshot-every 100000
+"""
+import argparse
+import shutil
+import tempfile
+import threading
+import time
+
+from store import JournaledMemoryStore
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="追加日志微基准")
+    parser.add_argument("--threads", default="1,8,64", help="依次测试的写入线程数，逗号分隔")
+    parser.add_argument("--writes", type=int, default=20000, help="每轮写入总次数")
+    parser.add_argument("--accounts", type=int, default=1000)
+    parser.add_argument("--no-fsync", action="store_true", help="组提交时不 fsync")
+    parser.add_argument("--events", type=int, default=250000, help="恢复测试的日志条数")
+    parser.add_argument("--snapshot-every", type=int, default=100000)
+    return parser.parse_args()
+
+
+def crash(store):
+    """模拟崩溃：停止后台线程并释放日志，不生成最终快照"""
+    store._stop.set()
+    store._snapshotter.join()
+    store.journal.close()
+
+
+def bench_writes(threads, writes, accounts, fsync):
+    directory = tempfile.mkdtemp(prefix="journal-")
+    store = JournaledMemoryStore(directory, fsync=fsync, snapshot_every=10 ** 9)
+    per_thread = writes // threads
+
+    def worker(index):
+        for number in range(per_thread):
+            account = f"acct-{(index * per_thread + number) % accounts}"
+            store.apply_balance_delta(account, 1, "bench", f"{index}-{number}")
+
+    workers = [threading.Thread(target=worker, args=(index,)) for index in range(threads)]
+    started = time.perf_counter()
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    records, commits = store.journal.seq, store.journal.commits
+    crash(store)
+    shutil.rmtree(directory, ignore_errors=True)
+    return per_thread * threads / elapsed, records / max(commits, 1)
+
+
+def bench_recovery(events, snapshot_every, accounts):
+    results = []
+    for label, every in (("仅日志回放", 10 ** 12), (f"快照(每 {snapshot_every} 条)", snapshot_every)):
+        directory = tempfile.mkdtemp(prefix="journal-")
+        # 快照由本线程按条数触发，结果不受后台线程检查时机影响
+        store = JournaledMemoryStore(directory, fsync=False, snapshot_every=every, check_interval=3600)
+        for number in range(events):
+            store.apply_balance_delta(f"acct-{number % accounts}", 1, "bench", str(number))
+            if store.journal.seq - store.snapshot_seq >= every:
+                store.snapshot()
+        crash(store)
+        started = time.perf_counter()
+        recovered = JournaledMemoryStore(directory, fsync=False)
+        elapsed = time.perf_counter() - started
+        results.append((label, elapsed, recovered.recovery["replayed"], len(recovered.ledger)))
+        crash(recovered)
+        shutil.rmtree(directory, ignore_errors=True)
+    return results
+
+
+def main():
+    args = parse_args()
+    print(f"写入 {args.writes} 次, fsync={'关' if args.no_fsync else '开'}")
+    print(f"{'线程':>6}{'写入/秒':>12}{'记录/fsync':>12}")
+    for threads in [int(value) for value in args.threads.split(",") if value.strip()]:
+        rate, batch = bench_writes(threads, args.writes, args.accounts, not args.no_fsync)
+        print(f"{threads:>6}{rate:>12,.0f}{batch:>12.1f}")
+
+    print(f"\n恢复 {args.events} 条日志")
+    print(f"{'方式':<24}{'耗时(s)':>10}{'回放条数':>12}{'账本条目':>12}")
+    for label, elapsed, replayed, entries in bench_recovery(args.events, args.snapshot_every, args.accounts):
+        print(f"{label:<24}{elapsed:>10.2f}{replayed:>12,}{entries:>12,}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+"""只读接口微基准：JSON provider 与精简读取路径对 /api/check_balance、/api/check_order_status 吞吐的影响
+
+直接调用 WSGI 应用(不经过 HTTP 与 test client)，分别测量：
+- 接口吞吐：JSON_PROVIDER=std(标准库) 与 orjson 两个应用实例
+- 存储读取：完整记录 get_user/get_order 与只取所需字段的 get_balance/get_order_status，
+  以及 SQLite 后端下余额缓存命中的读取
+- 响应体序列化：标准库 json 与 orjson
+
+用法(在仓库根目录执行):
+    python -m benchmarks.json_api --count 20000
+    python -m benchmarks.json_api --backend sqlite
+"""
+import argparse
+import io
+import json
+import logging
+import os
+import sys
+import tempfile
+import time
+
+import app as payment_app
+from json_provider import orjson
+
+ACCOUNT = "13812345678"
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="只读接口 JSON/读取路径微基准")
+    parser.add_argument("--count", type=int, default=20000, help="每项测量的调用次数")
+    parser.add_argument("--backend", choices=("memory", "sqlite"), default="memory")
+    parser.add_argument("--rounds", type=int, default=3, help="每项重复测量的轮数(取最快一轮)")
+    return parser.parse_args()
+
+
+def make_environ(path, query):
+    return {
+        "REQUEST_METHOD": "GET", "SCRIPT_NAME": "", "PATH_INFO": path, "QUERY_STRING": query,
+        "SERVER_NAME": "localhost", "SERVER_PORT": "80", "SERVER_PROTOCOL": "HTTP/1.1",
+        "wsgi.version": (1, 0), "wsgi.url_scheme": "http", "wsgi.input": io.BytesIO(),
+        "wsgi.errors": sys.stderr, "wsgi.multithread": True, "wsgi.multiprocess": False,
+        "wsgi.run_once": False,
+    }
+
+
+def measure(func, count, rounds):
+    func()  # 预热
+    best = None
+    for _ in range(rounds):
+        started = time.perf_counter()
+        for _ in range(count):
+            func()
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return count / best, best / count * 1e6
+
+
+def call_wsgi(flask_app, path, query):
+    environ = make_environ(path, query)
+
+    def start_response(status, headers, exc_info=None):
+        assert status.startswith("200"), status
+
+    def call():
+        environ["wsgi.input"].seek(0)
+        body = flask_app.wsgi_app(dict(environ), start_response)
+        b"".join(body)
+        body.close()
+    return call
+
+
+def main():
+    args = parse_args()
+    logging.getLogger("admin.payment_gateway").setLevel(logging.WARNING)
+    data_dir = tempfile.mkdtemp(prefix="json-api-")
+    count, rounds, reads = args.count, args.rounds, args.count * 5
+    providers = ["std"] + (["orjson"] if orjson is not None else [])
+    rows = []
+    order_id = None
+    for provider in providers:
+        flask_app = payment_app.create_app({
+            "JSON_PROVIDER": provider, "STORE_BACKEND": args.backend,
+            "STORE_PATH": os.path.join(data_dir, f"{provider}.db"), "ORDER_TTL": 0, "ORDER_RETENTION": -1
+        })
+        context = payment_app.get_context(flask_app)
+        body, _ = context.orders.place_order(ACCOUNT, 1)
+        order_id = body["order_id"]
+        for name, path, query in (("check_balance", "/api/check_balance", f"account={ACCOUNT}"),
+                                  ("check_order_status", "/api/check_order_status", f"order_id={order_id}")):
+            rows.append((f"{name} [{provider}]",) + measure(call_wsgi(flask_app, path, query), count, rounds))
+        store = context.store
+        if provider == providers[-1]:
+            rows.append(("store.get_user",) + measure(lambda: store.get_user(ACCOUNT), reads, rounds))
+            rows.append(("store.get_balance",) + measure(lambda: store.get_balance(ACCOUNT), reads, rounds))
+            if context.balance_cache is not None:
+                cache = context.balance_cache
+                rows.append(("balance_cache.get",) + measure(lambda: cache.get(ACCOUNT), reads, rounds))
+            rows.append(("store.get_order",) + measure(lambda: store.get_order(order_id), reads, rounds))
+            rows.append(("store.get_order_status",) + measure(lambda: store.get_order_status(order_id),
+                                                              reads, rounds))
+        context.close()
+
+    body = {"code": 200, "status": "pending", "order_id": order_id, "amount": 12.5}
+    rows.append(("json.dumps",) + measure(lambda: json.dumps(body).encode(), reads, rounds))
+    if orjson is not None:
+        rows.append(("orjson.dumps",) + measure(lambda: orjson.dumps(body), reads, rounds))
+
+    print(f"后端: {args.backend}, 次数: {args.count}, orjson: {'已安装' if orjson is not None else '未安装'}")
+    print(f"{'项目':<34}{'次/秒':>14}{'单次(µs)':>12}")
+    for label, rate, micros in rows:
+        print(f"{label:<34}{rate:>14,.0f}{micros:>12.2f}")
+
+
+if __name__ == "__main__":
+    main()
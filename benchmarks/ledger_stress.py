@@ -0,0 +1,161 @@
+"""账本并发压测：大量线程同时扣款/入账，校验无丢失更新
+
+用法(在仓库根目录执行):
+    python -m benchmarks.ledger_stress --threads 2000 --accounts 50
+    python -m benchmarks.ledger_stress --mode api --backend sqlite --threads 500
+"""
+import argparse
+import contextlib
+import io
+import logging
+import os
+import random
+import tempfile
+import threading
+import time
+from collections import defaultdict
+
+from admin.signing import sign_callback
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="账本并发压测")
+    parser.add_argument("--mode", choices=("ledger", "api"), default="ledger",
+                        help="ledger 直接调用 Ledger；api 通过 Flask test client 调用 /api/pay 与 /api/payment_callback")
+    parser.add_argument("--backend", choices=("memory", "sqlite"), default="memory")
+    parser.add_argument("--threads", type=int, default=2000)
+    parser.add_argument("--ops", type=int, default=20, help="每个线程的操作次数")
+    parser.add_argument("--accounts", type=int, default=50)
+    parser.add_argument("--seed", type=int, default=42)
+    return parser.parse_args()
+
+
+def run_threads(count, target):
+    barrier = threading.Barrier(count)
+    errors = []
+
+    def worker(index):
+        barrier.wait()
+        try:
+            target(index)
+        except Exception as e:  # 压测中任何异常都视为失败
+            errors.append(e)
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(count)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return time.perf_counter() - started, errors
+
+
+def verify(store, accounts, initial):
+    """校验：最终余额 = 初始余额 + 账本变动之和，且每条日志的余额快照连续"""
+    lost = 0
+    for account in accounts:
+        entries = list(reversed(store.list_ledger_entries(account, limit=10 ** 9)))
+        expected = initial[account] + sum(entry["delta_cents"] for entry in entries)
+        actual = store.get_user(account)["balance_cents"]
+        running = initial[account]
+        for entry in entries:
+            running += entry["delta_cents"]
+            if entry["balance_cents"] != running or running < 0:
+                lost += 1
+        if actual != expected:
+            lost += 1
+    return lost
+
+
+def bench_ledger(args, accounts):
+    from store import create_store
+    from ledger import Ledger, InsufficientBalance
+
+    path = os.path.join(tempfile.mkdtemp(), "ledger.db")
+    initial = {account: 10000 for account in accounts}
+    store = create_store(args.backend, path=path, pool_size=16,
+                         users={account: {"balance_cents": cents} for account, cents in initial.items()})
+    ledger = Ledger(store)
+    counters = defaultdict(int)
+
+    def work(index):
+        rng = random.Random(args.seed + index)
+        for op in range(args.ops):
+            account = rng.choice(accounts)
+            ref = f"{index}-{op}"
+            if rng.random() < 0.5:
+                ledger.credit(account, rng.randint(1, 500), "recharge", ref)
+                counters["credit"] += 1
+            else:
+                try:
+                    ledger.debit(account, rng.randint(1, 800), "payment", ref)
+                    counters["debit"] += 1
+                except InsufficientBalance:
+                    counters["rejected"] += 1
+
+    elapsed, errors = run_threads(args.threads, work)
+    return store, initial, elapsed, errors, counters
+
+
+def bench_api(args, accounts):
+    import app as payment_app
+    logging.getLogger("admin.payment_gateway").setLevel(logging.WARNING)
+
+    flask_app = payment_app.create_app({
+        "STORE_BACKEND": args.backend,
+        "STORE_PATH": os.path.join(tempfile.mkdtemp(), "api.db"),
+        "RATE_LIMIT_ENABLED": False, "ADMISSION_MAX_INFLIGHT": 0
+    })
+    context = payment_app.get_context(flask_app)
+    client = flask_app.test_client()
+    for account in accounts:
+        context.store.ensure_user(account)
+        context.ledger.credit(account, 100000, "seed", account)
+    initial = {account: 0 for account in accounts}
+    counters = defaultdict(int)
+
+    def work(index):
+        rng = random.Random(args.seed + index)
+        local = flask_app.test_client()
+        for _ in range(args.ops):
+            account = rng.choice(accounts)
+            response = local.post("/api/place_order", json={"account": account, "amount": rng.randint(1, 50)})
+            if response.status_code != 200:
+                counters["order_rejected"] += 1
+                continue
+            order_id = response.json["order_id"]
+            if rng.random() < 0.5:
+                # 同一订单并发重复支付，校验不会重复扣款
+                local.post("/api/pay", json={"order_id": order_id})
+                response = local.post("/api/pay", json={"order_id": order_id})
+                counters["pay"] += 1
+            else:
+                local.post("/api/payment_callback",
+                           json=sign_callback({"order_id": order_id}, context.payment_gateway.api_secret))
+                counters["recharge"] += 1
+
+    del client
+    with contextlib.redirect_stdout(io.StringIO()):  # 屏蔽回调中的通知打印
+        elapsed, errors = run_threads(args.threads, work)
+    return context.store, initial, elapsed, errors, counters
+
+
+def main():
+    args = parse_args()
+    accounts = [f"139{i:08d}" for i in range(args.accounts)]
+    bench = bench_ledger if args.mode == "ledger" else bench_api
+    store, initial, elapsed, errors, counters = bench(args, accounts)
+    lost = verify(store, accounts, initial)
+    total = args.threads * args.ops
+
+    print(f"mode={args.mode} backend={args.backend} threads={args.threads} ops={total}")
+    print(f"elapsed={elapsed:.2f}s throughput={total / elapsed:.0f} ops/s")
+    print("counters: " + ", ".join(f"{key}={value}" for key, value in sorted(counters.items())))
+    print(f"errors={len(errors)} lost_updates={lost}")
+    if errors:
+        print(f"first error: {errors[0]!r}")
+    raise SystemExit(1 if errors or lost else 0)
+
+
+if __name__ == "__main__":
+    main()
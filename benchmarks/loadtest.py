@@ -0,0 +1,322 @@
+"""下单 → 支付 → 回调 全流程压测
+
+按配置的比例混合调用 /api/place_order、/api/pay(direct 与 qr_code)、/api/payment_callback、
+/api/check_balance 与 /api/check_order_status，统计吞吐、分位延迟与各接口 CPU 时间，
+结果可保存为 JSON，并与历史结果对比以发现性能回退。
+
+默认在进程内通过 Flask test client 运行(离线)，也可用 --url 压测已启动的服务。
+进程内模式的 CPU 时间包含服务端处理，--url 模式仅为客户端 CPU。
+
+用法(在仓库根目录执行):
+    python -m benchmarks.loadtest --requests 5000 --concurrency 16 --output bench.json
+    python -m benchmarks.loadtest --mix place_order=1,pay=1,check_balance=8 --compare bench.json
+    python -m benchmarks.loadtest --url http://127.0.0.1:5000 --duration 30
+"""
+import argparse
+import contextlib
+import io
+import json
+import logging
+import os
+import platform
+import random
+import threading
+import time
+from collections import defaultdict
+
+from admin.signing import sign_callback
+
+ENDPOINTS = ("place_order", "pay", "pay_qr", "callback", "check_balance", "check_order_status")
+DEFAULT_MIX = "place_order=3,pay=2,pay_qr=1,callback=2,check_balance=4,check_order_status=4"
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="下单/支付/回调全流程压测")
+    parser.add_argument("--url", help="压测已启动的服务，例如 http://127.0.0.1:5000；缺省为进程内 test client")
+    parser.add_argument("--requests", type=int, default=5000, help="总请求数(与 --duration 二选一)")
+    parser.add_argument("--duration", type=float, help="压测时长(秒)")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--mix", default=DEFAULT_MIX, help="接口权重，如 place_order=3,pay=2")
+    parser.add_argument("--accounts", type=int, default=100)
+    parser.add_argument("--backend", choices=("memory", "sqlite"), default="memory", help="进程内模式的存储后端")
+    parser.add_argument("--secret", default=os.getenv("API_SECRET", "your-secret-key"), help="回调签名密钥")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", help="结果保存路径(JSON)")
+    parser.add_argument("--compare", help="与历史结果 JSON 对比")
+    return parser.parse_args()
+
+
+def parse_mix(text):
+    mix = {}
+    for part in text.split(","):
+        name, _, weight = part.partition("=")
+        name = name.strip()
+        if name not in ENDPOINTS:
+            raise SystemExit(f"未知接口: {name}，可选: {', '.join(ENDPOINTS)}")
+        mix[name] = float(weight or 1)
+    return mix
+
+
+class InProcessClient:
+    """进程内客户端(Flask test client)"""
+
+    def __init__(self, flask_app):
+        self._app = flask_app
+        self._local = threading.local()
+
+    def _client(self):
+        client = getattr(self._local, "client", None)
+        if client is None:
+            client = self._local.client = self._app.test_client()
+        return client
+
+    def post(self, path, body):
+        response = self._client().post(path, json=body)
+        return response.status_code, response.get_json(silent=True) or {}
+
+    def get(self, path, params):
+        response = self._client().get(path, query_string=params)
+        return response.status_code, response.get_json(silent=True) or {}
+
+
+class HttpClient:
+    """真实 HTTP 客户端(每线程一个长连接 Session)"""
+
+    def __init__(self, base_url):
+        import requests
+
+        self._requests = requests
+        self.base_url = base_url.rstrip("/")
+        self._local = threading.local()
+
+    def _session(self):
+        session = getattr(self._local, "session", None)
+        if session is None:
+            session = self._local.session = self._requests.Session()
+        return session
+
+    def post(self, path, body):
+        response = self._session().post(self.base_url + path, json=body, timeout=30)
+        return response.status_code, _json(response)
+
+    def get(self, path, params):
+        response = self._session().get(self.base_url + path, params=params, timeout=30)
+        return response.status_code, _json(response)
+
+
+def _json(response):
+    try:
+        return response.json()
+    except ValueError:
+        return {}
+
+
+class Workload:
+    """维护压测过程中的订单池，生成各接口的请求"""
+
+    def __init__(self, client, accounts, secret):
+        self.client = client
+        self.accounts = accounts
+        self.secret = secret
+        self.pending = []          # 待支付订单
+        self.known = []            # 所有已创建订单
+        self.lock = threading.Lock()
+
+    def _take_pending(self, rng):
+        with self.lock:
+            if self.pending:
+                return self.pending.pop(rng.randrange(len(self.pending)))
+        return self._create(rng)
+
+    def _create(self, rng):
+        status, body = self.client.post("/api/place_order",
+                                        {"account": rng.choice(self.accounts), "amount": rng.randint(1, 5)})
+        order_id = body.get("order_id") if status == 200 else None
+        if order_id:
+            with self.lock:
+                self.known.append(order_id)
+        return order_id
+
+    def place_order(self, rng):
+        order_id = self._create(rng)
+        if order_id:
+            with self.lock:
+                self.pending.append(order_id)
+            return 200
+        return 400
+
+    def prepare(self, name, rng):
+        """准备请求参数(不计入延迟)，返回可调用对象"""
+        if name == "place_order":
+            return lambda: self.place_order(rng)
+        if name in ("pay", "pay_qr", "callback"):
+            order_id = self._take_pending(rng)
+            if name == "pay":
+                return lambda: self.client.post("/api/pay", {"order_id": order_id})[0]
+            if name == "pay_qr":
+                with self.lock:
+                    self.pending.append(order_id)  # 二维码支付不改变订单状态，放回订单池
+                return lambda: self.client.post("/api/pay", {"order_id": order_id, "payment_method": "qr_code"})[0]
+            params = sign_callback({"order_id": order_id, "status": "success"}, self.secret)
+            return lambda: self.client.post("/api/payment_callback", params)[0]
+        if name == "check_balance":
+            account = rng.choice(self.accounts)
+            return lambda: self.client.get("/api/check_balance", {"account": account})[0]
+        with self.lock:
+            order_id = rng.choice(self.known) if self.known else ""
+        return lambda: self.client.get("/api/check_order_status", {"order_id": order_id})[0]
+
+
+def percentile(sorted_values, q):
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * q))]
+
+
+def run(args, workload, mix):
+    names = list(mix)
+    weights = [mix[name] for name in names]
+    latencies = defaultdict(list)
+    cpu = defaultdict(float)
+    errors = defaultdict(int)
+    counter = iter(range(args.requests if not args.duration else 1 << 62))
+    counter_lock = threading.Lock()
+    deadline = time.perf_counter() + args.duration if args.duration else None
+
+    def worker(index):
+        rng = random.Random(args.seed * 1000 + index)
+        local_latencies = defaultdict(list)
+        local_cpu = defaultdict(float)
+        local_errors = defaultdict(int)
+        while True:
+            with counter_lock:
+                if next(counter, None) is None:
+                    break
+            if deadline and time.perf_counter() >= deadline:
+                break
+            name = rng.choices(names, weights)[0]
+            call = workload.prepare(name, rng)
+            cpu_started = time.thread_time()
+            started = time.perf_counter()
+            try:
+                status = call()
+            except Exception:
+                status = 599
+            local_latencies[name].append(time.perf_counter() - started)
+            local_cpu[name] += time.thread_time() - cpu_started
+            if status >= 500:
+                local_errors[name] += 1
+        with counter_lock:
+            for name, values in local_latencies.items():
+                latencies[name].extend(values)
+                cpu[name] += local_cpu[name]
+                errors[name] += local_errors[name]
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(args.concurrency)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    endpoints = {}
+    total = 0
+    for name in names:
+        values = sorted(latencies[name])
+        total += len(values)
+        endpoints[name] = {
+            "count": len(values),
+            "errors": errors[name],
+            "req_per_s": len(values) / elapsed if elapsed else 0.0,
+            "p50_ms": percentile(values, 0.50) * 1000,
+            "p95_ms": percentile(values, 0.95) * 1000,
+            "p99_ms": percentile(values, 0.99) * 1000,
+            "cpu_ms_per_req": cpu[name] / len(values) * 1000 if values else 0.0,
+            "cpu_s_total": cpu[name],
+        }
+    all_values = sorted(v for values in latencies.values() for v in values)
+    return {
+        "total": {
+            "count": total,
+            "elapsed_s": elapsed,
+            "req_per_s": total / elapsed if elapsed else 0.0,
+            "p50_ms": percentile(all_values, 0.50) * 1000,
+            "p95_ms": percentile(all_values, 0.95) * 1000,
+            "p99_ms": percentile(all_values, 0.99) * 1000,
+        },
+        "endpoints": endpoints,
+    }
+
+
+def print_report(result, baseline=None):
+    def delta(current, previous, key):
+        if not previous or not previous.get(key):
+            return ""
+        change = (current[key] - previous[key]) / previous[key] * 100
+        return f" ({change:+.1f}%)"
+
+    total = result["total"]
+    base_total = baseline["total"] if baseline else None
+    print(f"total: {total['count']} requests in {total['elapsed_s']:.2f}s, "
+          f"{total['req_per_s']:.0f} req/s{delta(total, base_total, 'req_per_s')}, "
+          f"p50={total['p50_ms']:.2f}ms p95={total['p95_ms']:.2f}ms p99={total['p99_ms']:.2f}ms"
+          f"{delta(total, base_total, 'p99_ms')}")
+    print(f"{'endpoint':<20}{'count':>8}{'err':>6}{'req/s':>10}{'p50ms':>9}{'p95ms':>9}{'p99ms':>9}{'cpu ms/req':>12}")
+    for name, stats in result["endpoints"].items():
+        previous = baseline["endpoints"].get(name) if baseline else None
+        print(f"{name:<20}{stats['count']:>8}{stats['errors']:>6}{stats['req_per_s']:>10.0f}"
+              f"{stats['p50_ms']:>9.2f}{stats['p95_ms']:>9.2f}{stats['p99_ms']:>9.2f}"
+              f"{stats['cpu_ms_per_req']:>12.3f}{delta(stats, previous, 'p99_ms')}")
+
+
+def main():
+    args = parse_args()
+    mix = parse_mix(args.mix)
+    rng = random.Random(args.seed)
+
+    if args.url:
+        client = HttpClient(args.url)
+        # 真实服务无法直接注入余额，使用内置演示账号
+        accounts = ["13812345678", "13512345678", "13612345678"]
+    else:
+        import tempfile
+        import app as payment_app
+        for name in ("admin", "admin.payment_gateway", "werkzeug"):
+            logging.getLogger(name).setLevel(logging.WARNING)
+        flask_app = payment_app.create_app({
+            "STORE_BACKEND": args.backend,
+            "STORE_PATH": os.path.join(tempfile.mkdtemp(), "loadtest.db"),
+            "RATE_LIMIT_ENABLED": False, "ADMISSION_MAX_INFLIGHT": 0
+        })
+        client = InProcessClient(flask_app)
+        accounts = [f"13{rng.randint(3, 9)}{i:08d}" for i in range(args.accounts)]
+        for account in accounts:
+            payment_app.get_context(flask_app).ledger.credit(account, 10 ** 10, "seed", f"loadtest-{account}")
+
+    workload = Workload(client, accounts, args.secret)
+    with contextlib.redirect_stdout(io.StringIO()):  # 屏蔽回调中的通知打印
+        result = run(args, workload, mix)
+
+    result["config"] = {
+        "mode": "http" if args.url else "in-process",
+        "url": args.url,
+        "backend": None if args.url else args.backend,
+        "concurrency": args.concurrency,
+        "mix": mix,
+        "python": platform.python_version(),
+        "timestamp": time.time(),
+    }
+    baseline = None
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)
+    print_report(result, baseline)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+        print(f"结果已保存: {args.output}")
+
+
+if __name__ == "__main__":
+    main()
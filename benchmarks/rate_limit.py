@@ -0,0 +1,80 @@
+"""限流与准入控制微基准：每次检查的耗时(µs)
+
+- allowed: 正常请求，令牌从本地租约中扣减(每 lease 次访问一次存储，结果为摊销后的耗时)
+- rejected: 超限请求，命中本地记住的拒绝时间，不访问存储
+- lease: 每次都向存储租用令牌(lease=1)，即不做本地租用时的耗时
+- admission: 在途请求数检查(取得 + 释放)
+- request: 接口装饰器中的完整检查(IP + 账户限流 + 在途请求数)
+
+用法(在仓库根目录执行):
+    python -m benchmarks.rate_limit --count 200000
+    python -m benchmarks.rate_limit --backend sqlite
+"""
+import argparse
+import os
+import shutil
+import tempfile
+import time
+
+from ratelimit import ConcurrencyLimiter, RateLimiter
+from store import create_store
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="限流与准入控制微基准")
+    parser.add_argument("--count", type=int, default=200000, help="每项测量的检查次数")
+    parser.add_argument("--backend", default="memory", choices=["memory", "sqlite"])
+    parser.add_argument("--lease", type=int, default=5, help="每次从存储租用的令牌数")
+    return parser.parse_args()
+
+
+def measure(label, func, count):
+    started = time.perf_counter()
+    for _ in range(count):
+        func()
+    elapsed = time.perf_counter() - started
+    return label, count / elapsed, elapsed / count * 1e6
+
+
+def main():
+    args = parse_args()
+    data_dir = tempfile.mkdtemp(prefix="rate-limit-")
+    store = create_store(args.backend, path=os.path.join(data_dir, "bench.db"))
+    # 存储访问较慢的 sqlite 后端减少次数，保证总耗时可控
+    store_count = args.count if args.backend == "memory" else max(1000, args.count // 50)
+
+    unlimited = RateLimiter(store, rate=1e9, burst=1e9, lease=args.lease)
+    exhausted = RateLimiter(store, rate=1e-6, burst=1, lease=args.lease)
+    exhausted.acquire("abuser")
+    per_request = RateLimiter(store, rate=1e9, burst=1e9, lease=1)
+    admission = ConcurrencyLimiter(64)
+    account_limiter = RateLimiter(store, rate=1e9, burst=1e9, lease=args.lease)
+
+    def admit():
+        admission.try_acquire()
+        admission.release()
+
+    def request_check():
+        if unlimited.acquire("place_order:ip:127.0.0.1") or account_limiter.acquire("place_order:account:1"):
+            return
+        if admission.try_acquire():
+            admission.release()
+
+    rows = [
+        measure("allowed", lambda: unlimited.acquire("ip:127.0.0.1"), store_count),
+        measure("rejected", lambda: exhausted.acquire("abuser"), args.count),
+        measure("lease", lambda: per_request.acquire("ip:127.0.0.2"), store_count),
+        measure("admission", admit, args.count),
+        measure("request", request_check, store_count),
+    ]
+    store.close()
+    shutil.rmtree(data_dir, ignore_errors=True)
+
+    print(f"存储后端: {args.backend}, lease: {args.lease}")
+    print(f"{'项目':<12}{'次/秒':>14}{'单次(µs)':>12}")
+    for label, rate, micros in rows:
+        print(f"{label:<12}{rate:>14,.0f}{micros:>12.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+"""多 worker 扩展性压测：下单/支付/回调全流程吞吐随 gunicorn worker 数的变化
+
+对每个 worker 数分别以 gunicorn.conf.py 启动服务(STORE_BACKEND=sqlite，临时数据库)，
+由多个客户端进程通过 HTTP 混合调用 /api/place_order、/api/pay 与 /api/payment_callback，
+输出各 worker 数下的吞吐、p99 延迟与相对单 worker 的扩展效率(吞吐倍数 / worker 数)。
+
+客户端进程与服务端共用本机 CPU，扩展效率只有在核数不少于 (最大 worker 数 + 客户端进程数) 时才有参考意义。
+
+用法(在仓库根目录执行，需要 pip install gunicorn):
+    python -m benchmarks.scaling --workers 1,2,4 --clients 4 --duration 15
+    python -m benchmarks.scaling --workers 1,8 --threads 16 --mix place_order=1,pay=1
+"""
+import argparse
+import contextlib
+import io
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from benchmarks.loadtest import HttpClient, Workload, parse_mix, run
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEMO_ACCOUNTS = ["13812345678", "13512345678", "13612345678"]
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="多 worker 扩展性压测")
+    parser.add_argument("--workers", default="1,2,4", help="依次测试的 worker 数，逗号分隔")
+    parser.add_argument("--threads", type=int, default=8, help="每个 worker 的线程数")
+    parser.add_argument("--clients", type=int, default=max(2, (os.cpu_count() or 2) // 2), help="客户端进程数")
+    parser.add_argument("--concurrency", type=int, default=16, help="每个客户端进程的并发线程数")
+    parser.add_argument("--duration", type=float, default=15.0, help="每轮压测时长(秒)")
+    parser.add_argument("--warmup", type=float, default=2.0, help="每轮正式压测前的预热时长(秒)")
+    parser.add_argument("--mix", default="place_order=2,pay=1,callback=1",
+                        help="接口权重(回调入账抵消支付扣款，余额保持稳定)")
+    parser.add_argument("--secret", default="bench-secret")
+    return parser.parse_args()
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_server(workers, threads, port, data_dir, secret):
+    env = dict(os.environ, WEB_CONCURRENCY=str(workers), GUNICORN_THREADS=str(threads),
+               BIND=f"127.0.0.1:{port}", STORE_BACKEND="sqlite", MOCK_MODE="true", API_SECRET=secret,
+               STORE_PATH=os.path.join(data_dir, "payment.db"),
+               CALLBACK_QUEUE_PATH=os.path.join(data_dir, "callback_queue.db"),
+               REFUND_JOBS_PATH=os.path.join(data_dir, "refund_jobs.db"),
+               IDEMPOTENCY_PATH=os.path.join(data_dir, "idempotency.db"),
+               LEADER_LOCK_PATH=os.path.join(data_dir, "leader.lock"),
+               RATE_LIMIT_ENABLED="false", ADMISSION_MAX_INFLIGHT="0")
+    process = subprocess.Popen([sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py", "wsgi:application"],
+                               cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    client = HttpClient(f"http://127.0.0.1:{port}")
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise SystemExit(f"gunicorn 启动失败(退出码 {process.returncode})")
+        try:
+            if client.get("/api/payment_mode", {})[0] == 200:
+                return process
+        except Exception:
+            pass
+        time.sleep(0.2)
+    process.kill()
+    raise SystemExit("gunicorn 启动超时")
+
+
+def drive(task):
+    """客户端进程：在给定时长内压测，返回 loadtest.run 的结果"""
+    url, index, concurrency, duration, mix, secret = task
+    args = argparse.Namespace(requests=0, duration=duration, concurrency=concurrency, seed=index + 1)
+    workload = Workload(HttpClient(url), DEMO_ACCOUNTS, secret)
+    with contextlib.redirect_stdout(io.StringIO()):
+        return run(args, workload, mix)
+
+
+def measure(executor, url, args, mix, duration):
+    tasks = [(url, index, args.concurrency, duration, mix, args.secret) for index in range(args.clients)]
+    results = list(executor.map(drive, tasks))
+    count = sum(result["total"]["count"] for result in results)
+    elapsed = max(result["total"]["elapsed_s"] for result in results)
+    errors = sum(stats["errors"] for result in results for stats in result["endpoints"].values())
+    return {
+        "req_per_s": count / elapsed if elapsed else 0.0,
+        # 各客户端 p99 的最大值(近似整体 p99)
+        "p99_ms": max(result["total"]["p99_ms"] for result in results),
+        "errors": errors,
+    }
+
+
+def main():
+    args = parse_args()
+    mix = parse_mix(args.mix)
+    worker_counts = [int(value) for value in args.workers.split(",") if value.strip()]
+    print(f"CPU 核数: {os.cpu_count()}, 客户端进程: {args.clients} x {args.concurrency} 线程, "
+          f"每 worker 线程: {args.threads}, 时长: {args.duration}s")
+
+    rows = []
+    with ProcessPoolExecutor(max_workers=args.clients) as executor:
+        for workers in worker_counts:
+            data_dir = tempfile.mkdtemp(prefix="scaling-")
+            port = free_port()
+            process = start_server(workers, args.threads, port, data_dir, args.secret)
+            url = f"http://127.0.0.1:{port}"
+            try:
+                if args.warmup > 0:
+                    measure(executor, url, args, mix, args.warmup)
+                rows.append((workers, measure(executor, url, args, mix, args.duration)))
+            finally:
+                process.terminate()
+                process.wait(30)
+                shutil.rmtree(data_dir, ignore_errors=True)
+
+    base = rows[0][1]["req_per_s"] / rows[0][0] if rows and rows[0][1]["req_per_s"] else 0.0
+    print(f"{'workers':>8}{'req/s':>12}{'p99ms':>10}{'errors':>8}{'加速比':>10}{'扩展效率':>10}")
+    for workers, stats in rows:
+        speedup = stats["req_per_s"] / base if base else 0.0
+        print(f"{workers:>8}{stats['req_per_s']:>12,.0f}{stats['p99_ms']:>10.2f}{stats['errors']:>8}"
+              f"{speedup:>10.2f}{speedup / workers:>10.0%}")
+
+
+if __name__ == "__main__":
+    main()
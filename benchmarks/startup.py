@@ -0,0 +1,102 @@
+"""启动耗时基准：python -X importtime 统计导入应用模块的耗时，并检查重依赖是否被延迟加载
+
+- 每轮在新的解释器进程中导入 --module，取多轮中位数，输出总耗时与耗时最多的直接依赖
+- --forbid 列出的模块(默认 requests、qrcode、PIL、asyncio、httpx)不得在导入阶段加载，
+  --max-ms 设置导入总耗时上限；任一检查不通过时以非零状态退出，可用于防止启动耗时回退
+- --create-app 额外测量 create_app() 的耗时(不含导入)
+
+用法(在仓库根目录执行):
+    python -m benchmarks.startup
+    python -m benchmarks.startup --module asgi --forbid requests,qrcode,PIL --rounds 10
+    python -m benchmarks.startup --max-ms 300 --create-app
+"""
+import argparse
+import os
+import re
+import statistics
+import subprocess
+import sys
+from typing import Dict, List, Tuple
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# import time: <自身耗时 µs> | <累计耗时 µs> | <缩进的模块名>
+IMPORTTIME_LINE = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \|( +)(\S+)")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="启动耗时基准")
+    parser.add_argument("--module", default="app", help="导入的模块(app、asgi、wsgi 等)")
+    parser.add_argument("--rounds", type=int, default=5, help="测量轮数(取中位数)")
+    parser.add_argument("--top", type=int, default=10, help="输出耗时最多的直接依赖数")
+    parser.add_argument("--forbid", default="requests,qrcode,PIL,asyncio,httpx",
+                        help="导入阶段不应加载的模块，逗号分隔，留空不检查")
+    parser.add_argument("--max-ms", type=float, default=0, help="导入总耗时上限(毫秒)，0 不检查")
+    parser.add_argument("--create-app", action="store_true", help="同时测量 create_app() 耗时")
+    return parser.parse_args()
+
+
+def import_once(module: str) -> Tuple[float, Dict[str, float], List[str]]:
+    """在新进程中导入模块，返回 (总耗时 ms, 直接依赖 -> 累计耗时 ms, 加载的全部模块)"""
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                            cwd=ROOT, capture_output=True, text=True, check=True)
+    total, direct, loaded = 0.0, {}, []
+    # 解释器启动(site)时的导入不计入
+    lines = result.stderr.splitlines()
+    start = max((index for index, line in enumerate(lines) if line.endswith("| site")), default=-1) + 1
+    for line in lines[start:]:
+        match = IMPORTTIME_LINE.match(line)
+        if match is None:
+            continue
+        cumulative_ms = int(match.group(2)) / 1000
+        depth, name = len(match.group(3)), match.group(4)
+        loaded.append(name)
+        if name == module and depth == 1:
+            total = cumulative_ms
+        elif depth == 3:
+            direct[name] = cumulative_ms
+    return total, direct, loaded
+
+
+def create_app_once() -> float:
+    code = ("import time, app; started = time.perf_counter(); "
+            "flask_app = app.create_app(); elapsed = time.perf_counter() - started; "
+            "flask_app.extensions['payment'].close(); print(elapsed * 1000)")
+    result = subprocess.run([sys.executable, "-c", code], cwd=ROOT, capture_output=True, text=True, check=True)
+    return float(result.stdout.strip().splitlines()[-1])
+
+
+def main():
+    args = parse_args()
+    totals, direct_runs, loaded = [], [], set()
+    for _ in range(args.rounds):
+        total, direct, modules = import_once(args.module)
+        totals.append(total)
+        direct_runs.append(direct)
+        loaded.update(modules)
+
+    print(f"import {args.module}: 中位数 {statistics.median(totals):.1f} ms "
+          f"(最小 {min(totals):.1f} ms, {args.rounds} 轮)")
+    medians = {name: statistics.median(run.get(name, 0.0) for run in direct_runs)
+               for name in direct_runs[0]}
+    print(f"{'直接依赖':<28}{'累计(ms)':>10}")
+    for name, elapsed in sorted(medians.items(), key=lambda item: -item[1])[:args.top]:
+        print(f"{name:<28}{elapsed:>10.1f}")
+
+    if args.create_app:
+        elapsed = statistics.median(create_app_once() for _ in range(args.rounds))
+        print(f"create_app(): 中位数 {elapsed:.1f} ms")
+
+    failures = []
+    forbidden = [name.strip() for name in args.forbid.split(",") if name.strip()]
+    eager = sorted(name for name in forbidden if name in loaded)
+    if eager:
+        failures.append(f"导入阶段加载了应延迟加载的模块: {', '.join(eager)}")
+    if args.max_ms and statistics.median(totals) > args.max_ms:
+        failures.append(f"导入耗时 {statistics.median(totals):.1f} ms 超过上限 {args.max_ms} ms")
+    for failure in failures:
+        print(f"未通过: {failure}")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,220 @@
+"""支付回调异步处理管道
+
+回调接口完成签名校验后只负责入队并立即应答，充值与通知由后台 worker 批量处理：
+- CallbackQueue: SQLite 持久化队列，进程重启后未完成的任务会被重新领取
+- CallbackWorkerPool: 线程池批量拉取任务，调用处理函数(需幂等)并统计指标
+"""
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from typing import Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class CallbackQueue:
+    """SQLite 持久化任务队列
+
+    任务领取采用租约：领取后在 lease_seconds 内未确认的任务会被重新投递，
+    因此处理函数必须幂等。多个进程可共享同一队列文件。
+    """
+
+    SCHEMA = (
+        """CREATE TABLE IF NOT EXISTS callback_jobs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            payload TEXT NOT NULL,
+            status TEXT NOT NULL DEFAULT 'queued',
+            attempts INTEGER NOT NULL DEFAULT 0,
+            enqueue_time REAL NOT NULL,
+            lease_until REAL,
+            finish_time REAL,
+            error TEXT
+        )""",
+        "CREATE INDEX IF NOT EXISTS idx_callback_jobs_status ON callback_jobs(status, id)",
+    )
+
+    def __init__(self, path: str, lease_seconds: float = 30.0, max_attempts: int = 5):
+        self.path = path
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._conn = sqlite3.connect(path, timeout=30, isolation_level=None, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._lock = threading.Lock()
+        with self._lock:
+            for statement in self.SCHEMA:
+                self._conn.execute(statement)
+
+    def enqueue(self, payload: Dict) -> int:
+        """写入任务，返回任务ID"""
+        with self._lock:
+            cursor = self._conn.execute(
+                "INSERT INTO callback_jobs (payload, enqueue_time) VALUES (?, ?)",
+                (json.dumps(payload, ensure_ascii=False), time.time())
+            )
+            return cursor.lastrowid
+
+    def claim(self, limit: int) -> List[Dict]:
+        """领取一批任务(含租约过期的任务)"""
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                rows = self._conn.execute(
+                    "SELECT id, payload, attempts, enqueue_time FROM callback_jobs "
+                    "WHERE status = 'queued' OR (status = 'processing' AND lease_until < ?) "
+                    "ORDER BY id LIMIT ?", (now, limit)
+                ).fetchall()
+                if rows:
+                    self._conn.executemany(
+                        "UPDATE callback_jobs SET status = 'processing', attempts = attempts + 1, "
+                        "lease_until = ? WHERE id = ?",
+                        [(now + self.lease_seconds, row["id"]) for row in rows]
+                    )
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+        return [{"id": row["id"], "payload": json.loads(row["payload"]),
+                 "attempts": row["attempts"] + 1, "enqueue_time": row["enqueue_time"]} for row in rows]
+
+    def ack(self, job_ids: List[int]) -> None:
+        """确认任务处理完成"""
+        if not job_ids:
+            return
+        now = time.time()
+        with self._lock:
+            self._conn.executemany(
+                "UPDATE callback_jobs SET status = 'done', finish_time = ?, lease_until = NULL WHERE id = ?",
+                [(now, job_id) for job_id in job_ids]
+            )
+
+    def nack(self, job: Dict, error: str) -> None:
+        """任务处理失败：未超过重试次数则重新入队，否则标记为 failed"""
+        status = "failed" if job["attempts"] >= self.max_attempts else "queued"
+        with self._lock:
+            self._conn.execute(
+                "UPDATE callback_jobs SET status = ?, lease_until = NULL, error = ? WHERE id = ?",
+                (status, error[:500], job["id"])
+            )
+
+    def depth(self) -> int:
+        """待处理任务数(含处理中)"""
+        with self._lock:
+            return self._conn.execute(
+                "SELECT COUNT(*) FROM callback_jobs WHERE status IN ('queued', 'processing')"
+            ).fetchone()[0]
+
+    def oldest_enqueue_time(self) -> Optional[float]:
+        with self._lock:
+            return self._conn.execute(
+                "SELECT MIN(enqueue_time) FROM callback_jobs WHERE status IN ('queued', 'processing')"
+            ).fetchone()[0]
+
+    def purge(self, older_than: float) -> int:
+        """清理已完成的历史任务"""
+        with self._lock:
+            cursor = self._conn.execute(
+                "DELETE FROM callback_jobs WHERE status = 'done' AND finish_time < ?", (older_than,)
+            )
+            return cursor.rowcount
+
+    def close(self) -> None:
+        self._conn.close()
+
+
+class CallbackWorkerPool:
+    """回调处理 worker 池"""
+
+    def __init__(self, queue: CallbackQueue, handler: Callable[[Dict], None],
+                 workers: int = 2, batch_size: int = 50, poll_interval: float = 0.05):
+        """
+        :param handler: 单个回调的处理函数(必须幂等)，抛出异常则任务重试
+        :param batch_size: 每次领取的任务数
+        :param poll_interval: 队列为空时的轮询间隔(秒)
+        """
+        self.queue = queue
+        self.handler = handler
+        self.workers = workers
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self._wakeup = threading.Event()
+        self._stopping = threading.Event()
+        self._threads: List[threading.Thread] = []
+        self._stats_lock = threading.Lock()
+        self.processed = 0
+        self.failed = 0
+        self.batches = 0
+        self.last_batch_size = 0
+        self.last_lag = 0.0      # 最近一批任务从入队到处理完成的最大耗时(秒)
+
+    def start(self) -> None:
+        for index in range(self.workers):
+            thread = threading.Thread(target=self._run, name=f"callback-worker-{index}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self, timeout: float = 5.0) -> None:
+        self._stopping.set()
+        self._wakeup.set()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads.clear()
+
+    def notify(self) -> None:
+        """有新任务入队时唤醒 worker"""
+        self._wakeup.set()
+
+    def drain_once(self) -> int:
+        """领取并处理一批任务，返回处理数量"""
+        jobs = self.queue.claim(self.batch_size)
+        if not jobs:
+            return 0
+        done, failed = [], 0
+        for job in jobs:
+            try:
+                self.handler(job["payload"])
+                done.append(job["id"])
+            except Exception as e:
+                failed += 1
+                logger.error(f"回调处理失败: 任务ID={job['id']}, 第{job['attempts']}次, 错误={e}")
+                self.queue.nack(job, str(e))
+        self.queue.ack(done)
+        lag = time.time() - min(job["enqueue_time"] for job in jobs)
+        with self._stats_lock:
+            self.processed += len(done)
+            self.failed += failed
+            self.batches += 1
+            self.last_batch_size = len(jobs)
+            self.last_lag = lag
+        return len(jobs)
+
+    def _run(self) -> None:
+        while not self._stopping.is_set():
+            try:
+                if self.drain_once():
+                    continue
+            except Exception as e:
+                logger.error(f"回调队列读取失败: {e}")
+            self._wakeup.wait(self.poll_interval)
+            self._wakeup.clear()
+
+    def metrics(self) -> Dict:
+        oldest = self.queue.oldest_enqueue_time()
+        with self._stats_lock:
+            return {
+                "queue_depth": self.queue.depth(),
+                "oldest_lag": time.time() - oldest if oldest else 0.0,
+                "processed": self.processed,
+                "failed": self.failed,
+                "batches": self.batches,
+                "batch_size": self.batch_size,
+                "last_batch_size": self.last_batch_size,
+                "last_lag": self.last_lag,
+                "workers": self.workers
+            }
@@ -0,0 +1,50 @@
+"""gunicorn 配置(prefork 多进程部署)
+
+    gunicorn -c gunicorn.conf.py wsgi:application
+
+- worker 数取 WEB_CONCURRENCY，缺省为 CPU 核数；每个 worker 使用 gthread 线程池，
+  订单状态推送(SSE/长轮询)占用的是线程而不是进程
+- preload_app=False：应用在每个 worker fork 之后创建，SQLite/HTTP 连接池与后台线程不跨进程共享
+- 平滑重载：kill -HUP <master pid> 逐个启动新 worker 并让旧 worker 在 graceful_timeout 内处理完在途请求；
+  max_requests 加抖动后定期轮换 worker，避免所有 worker 同时重启
+- 二维码渲染库与 requests 在应用导入时不加载，由 post_worker_init 在 worker 接收请求前预加载
+- 多 worker 必须使用 STORE_BACKEND=sqlite，进程内存储无法在 worker 间共享订单与余额
+"""
+import multiprocessing
+import os
+
+from dotenv import load_dotenv
+
+load_dotenv()  # 与应用读取同一份 .env
+
+bind = os.getenv("BIND", "0.0.0.0:5000")
+workers = int(os.getenv("WEB_CONCURRENCY", str(multiprocessing.cpu_count())))
+worker_class = "gthread"
+threads = int(os.getenv("GUNICORN_THREADS", "32"))
+preload_app = False
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "60"))
+graceful_timeout = int(os.getenv("GUNICORN_GRACEFUL_TIMEOUT", "30"))
+keepalive = 5
+max_requests = int(os.getenv("GUNICORN_MAX_REQUESTS", "10000"))
+max_requests_jitter = int(os.getenv("GUNICORN_MAX_REQUESTS_JITTER", "1000"))
+accesslog = os.getenv("GUNICORN_ACCESS_LOG") or None
+
+
+def on_starting(server):
+    backend = os.getenv("STORE_BACKEND", "memory").lower()
+    if server.cfg.workers > 1 and backend in ("memory", "journal"):
+        raise RuntimeError("多 worker 部署需要 STORE_BACKEND=sqlite(进程内存储无法在 worker 间共享)")
+
+
+def post_worker_init(worker):
+    """worker 创建应用后、接收请求前预加载延迟导入的依赖(二维码渲染库、真实模式的网关 HTTP 客户端)"""
+    context = getattr(worker.wsgi, "extensions", {}).get("payment")
+    if context is not None:
+        context.payment_gateway.warm_up()
+
+
+def worker_exit(server, worker):
+    """worker 退出(平滑重载、max_requests 轮换或停止)时停止后台任务并释放连接"""
+    context = getattr(worker.wsgi, "extensions", {}).get("payment")
+    if context is not None:
+        context.close()
@@ -0,0 +1,297 @@
+"""请求幂等键(Idempotency-Key)与响应缓存
+
+客户端为可能重试的写请求携带 Idempotency-Key 请求头，同一键的重复请求直接返回首次的响应：
+- 进程内：并发的重复请求合并，只有一个执行，其余等待其结果
+- 跨进程：执行前在共享存储中登记键(带租约)，其他 worker 收到重复请求时等待首个请求完成
+- 响应按 TTL 过期；5xx 与异常不缓存，客户端可用同一键重试
+- 同一键携带不同请求体视为客户端错误(请求指纹不一致)
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future, TimeoutError as FutureTimeout
+from typing import Callable, Dict, Optional, Tuple
+
+
+class IdempotencyConflict(Exception):
+    """同一幂等键已用于请求体不同的请求"""
+
+
+class IdempotencyInProgress(Exception):
+    """同一幂等键的请求仍在其他 worker 中处理，等待超时"""
+
+
+def fingerprint(payload) -> str:
+    """请求指纹(请求体规范化 JSON 的 SHA-256)"""
+    raw = json.dumps(payload, ensure_ascii=False, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(raw.encode()).hexdigest()
+
+
+class MemoryIdempotencyStore:
+    """进程内幂等记录(容量有限，按过期时间与 LRU 淘汰，线程安全)"""
+
+    def __init__(self, max_size: int = 100000):
+        self.max_size = max_size
+        self._records: "OrderedDict[str, Dict]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def claim(self, key: str, fingerprint: str, lease_until: float, now: float) -> Optional[Dict]:
+        """登记处理中的键：登记成功返回 None，否则返回已有记录(已完成或租约未到期)"""
+        with self._lock:
+            record = self._records.get(key)
+            if record is not None and not self._reclaimable(record, now):
+                return dict(record)
+            self._records[key] = {"fingerprint": fingerprint, "state": "processing", "status_code": None,
+                                  "body": None, "expire_at": lease_until}
+            self._records.move_to_end(key)
+            self._evict(now)
+            return None
+
+    @staticmethod
+    def _reclaimable(record: Dict, now: float) -> bool:
+        # 已完成记录过期，或处理中的记录租约到期(处理进程已崩溃)
+        return record["expire_at"] <= now
+
+    def _evict(self, now: float) -> None:
+        records = self._records
+        while len(records) > self.max_size:
+            records.popitem(last=False)
+        # 队头为最久未更新的记录，过期即淘汰
+        while records:
+            key, record = next(iter(records.items()))
+            if record["expire_at"] > now:
+                break
+            del records[key]
+
+    def get(self, key: str) -> Optional[Dict]:
+        with self._lock:
+            record = self._records.get(key)
+            return dict(record) if record is not None else None
+
+    def complete(self, key: str, status_code: int, body: Dict, expire_at: float) -> None:
+        with self._lock:
+            record = self._records.get(key)
+            if record is None:
+                return
+            record.update(state="done", status_code=status_code, body=body, expire_at=expire_at)
+            self._records.move_to_end(key)
+
+    def release(self, key: str) -> None:
+        with self._lock:
+            self._records.pop(key, None)
+
+    def __len__(self) -> int:
+        return len(self._records)
+
+    def close(self) -> None:
+        pass
+
+
+class SQLiteIdempotencyStore:
+    """SQLite 幂等记录，多个 worker 进程共享同一文件"""
+
+    SCHEMA = (
+        """CREATE TABLE IF NOT EXISTS idempotency_keys (
+            key TEXT PRIMARY KEY,
+            fingerprint TEXT NOT NULL,
+            state TEXT NOT NULL,
+            status_code INTEGER,
+            body TEXT,
+            expire_at REAL NOT NULL
+        )""",
+        "CREATE INDEX IF NOT EXISTS idx_idempotency_keys_expire ON idempotency_keys(expire_at)",
+    )
+
+    def __init__(self, path: str, purge_interval: float = 60.0):
+        """
+        :param purge_interval: 清理过期记录的最小间隔(秒)
+        """
+        self.path = path
+        self.purge_interval = purge_interval
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._conn = sqlite3.connect(path, timeout=30, isolation_level=None, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._lock = threading.Lock()
+        self._next_purge = 0.0
+        with self._lock:
+            for statement in self.SCHEMA:
+                self._conn.execute(statement)
+
+    @staticmethod
+    def _record(row) -> Dict:
+        return {"fingerprint": row["fingerprint"], "state": row["state"], "status_code": row["status_code"],
+                "body": json.loads(row["body"]) if row["body"] is not None else None,
+                "expire_at": row["expire_at"]}
+
+    def claim(self, key: str, fingerprint: str, lease_until: float, now: float) -> Optional[Dict]:
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                if now >= self._next_purge:
+                    self._conn.execute("DELETE FROM idempotency_keys WHERE expire_at <= ?", (now,))
+                    self._next_purge = now + self.purge_interval
+                row = self._conn.execute(
+                    "SELECT fingerprint, state, status_code, body, expire_at FROM idempotency_keys WHERE key = ?",
+                    (key,)
+                ).fetchone()
+                if row is not None and row["expire_at"] > now:
+                    self._conn.execute("COMMIT")
+                    return self._record(row)
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO idempotency_keys (key, fingerprint, state, expire_at) "
+                    "VALUES (?, ?, 'processing', ?)", (key, fingerprint, lease_until)
+                )
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+        return None
+
+    def get(self, key: str) -> Optional[Dict]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT fingerprint, state, status_code, body, expire_at FROM idempotency_keys WHERE key = ?", (key,)
+            ).fetchone()
+        return self._record(row) if row is not None else None
+
+    def complete(self, key: str, status_code: int, body: Dict, expire_at: float) -> None:
+        with self._lock:
+            self._conn.execute(
+                "UPDATE idempotency_keys SET state = 'done', status_code = ?, body = ?, expire_at = ? WHERE key = ?",
+                (status_code, json.dumps(body, ensure_ascii=False), expire_at, key)
+            )
+
+    def release(self, key: str) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM idempotency_keys WHERE key = ?", (key,))
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM idempotency_keys").fetchone()[0]
+
+    def close(self) -> None:
+        self._conn.close()
+
+
+class IdempotencyCache:
+    """按幂等键执行请求处理函数并缓存响应"""
+
+    def __init__(self, store, ttl: float = 86400.0, lease_seconds: float = 30.0,
+                 wait_timeout: float = 10.0, poll_interval: float = 0.05):
+        """
+        :param store: 幂等记录存储(MemoryIdempotencyStore / SQLiteIdempotencyStore)
+        :param ttl: 响应缓存时间(秒)
+        :param lease_seconds: 处理中记录的租约(秒)，处理进程崩溃后其他 worker 可在租约到期后重新执行
+        :param wait_timeout: 重复请求等待首个请求完成的最长时间(秒)
+        """
+        self.store = store
+        self.ttl = ttl
+        self.lease_seconds = lease_seconds
+        self.wait_timeout = wait_timeout
+        self.poll_interval = poll_interval
+        self._inflight: Dict[str, Tuple[str, Future]] = {}
+        self._lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self.executed = 0
+        self.replayed = 0
+        self.coalesced = 0
+
+    def execute(self, scope: str, key: str, request_fingerprint: str,
+                handler: Callable[[], Tuple[Dict, int]]) -> Tuple[Dict, int, bool]:
+        """执行或重放请求，返回 (响应体, HTTP状态码, 是否为重放)
+
+        :param scope: 键的作用域(接口名)，不同接口的同名键互不影响
+        :raises IdempotencyConflict: 同一键的请求指纹不一致
+        :raises IdempotencyInProgress: 等待其他 worker 中的同键请求超时
+        """
+        full_key = f"{scope}:{key}"
+        with self._lock:
+            inflight = self._inflight.get(full_key)
+            if inflight is None:
+                future = Future()
+                self._inflight[full_key] = (request_fingerprint, future)
+        if inflight is not None:
+            return self._join(inflight, request_fingerprint)
+
+        try:
+            result = self._execute(full_key, request_fingerprint, handler)
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            with self._lock:
+                del self._inflight[full_key]
+
+    def _join(self, inflight: Tuple[str, Future], request_fingerprint: str) -> Tuple[Dict, int, bool]:
+        """等待本进程中正在执行的同键请求"""
+        leader_fingerprint, future = inflight
+        if leader_fingerprint != request_fingerprint:
+            raise IdempotencyConflict()
+        try:
+            body, status_code, _ = future.result(timeout=self.wait_timeout)
+        except FutureTimeout:
+            raise IdempotencyInProgress()
+        with self._stats_lock:
+            self.coalesced += 1
+        return body, status_code, True
+
+    def _execute(self, full_key: str, request_fingerprint: str,
+                 handler: Callable[[], Tuple[Dict, int]]) -> Tuple[Dict, int, bool]:
+        now = time.time()
+        record = self.store.claim(full_key, request_fingerprint, now + self.lease_seconds, now)
+        if record is not None:
+            if record["fingerprint"] != request_fingerprint:
+                raise IdempotencyConflict()
+            if record["state"] != "done":
+                record = self._wait(full_key)
+            with self._stats_lock:
+                self.replayed += 1
+            return record["body"], record["status_code"], True
+
+        try:
+            body, status_code = handler()
+        except BaseException:
+            self.store.release(full_key)
+            raise
+        if status_code >= 500:
+            # 服务端错误不缓存，允许客户端用同一键重试
+            self.store.release(full_key)
+        else:
+            self.store.complete(full_key, status_code, body, time.time() + self.ttl)
+        with self._stats_lock:
+            self.executed += 1
+        return body, status_code, False
+
+    def _wait(self, full_key: str) -> Dict:
+        """等待其他 worker 中的同键请求完成(其处理失败释放了键时同样返回 IdempotencyInProgress，由客户端重试)"""
+        deadline = time.monotonic() + self.wait_timeout
+        while time.monotonic() < deadline:
+            time.sleep(self.poll_interval)
+            record = self.store.get(full_key)
+            if record is None:
+                break
+            if record["state"] == "done":
+                return record
+        raise IdempotencyInProgress()
+
+    def metrics(self) -> Dict:
+        with self._stats_lock:
+            return {
+                "executed": self.executed,
+                "replayed": self.replayed,
+                "coalesced": self.coalesced,
+                "records": len(self.store),
+                "ttl": self.ttl
+            }
+
+    def close(self) -> None:
+        self.store.close()
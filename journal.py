@@ -0,0 +1,266 @@
+"""追加式事务日志(NDJSON)与快照
+
+- 日志按段存放：journal-<起始序号>.ndjson，每行一条带序号(seq)的记录
+- 组提交：写入方只把记录放入队列，由后台线程批量写入并 fsync 一次后唤醒所有等待者，
+  并发写入越多，每次 fsync 摊到的记录越多
+- 快照：snapshot-<序号>.ndjson 为截至该序号的完整状态，先写临时文件、fsync 后改名；
+  生成快照前先切换日志段，快照完成后删除更早的日志段与快照
+- 恢复：加载最新快照，再按序回放其后的日志记录；段尾未写完的记录(崩溃时的残行)被忽略
+"""
+import json
+import logging
+import os
+import threading
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+try:
+    import fcntl
+except ImportError:  # Windows 上不做跨进程互斥
+    fcntl = None
+
+try:
+    import orjson
+except ImportError:  # orjson 为可选依赖，安装后编解码(尤其是恢复时的解码)快数倍
+    orjson = None
+
+logger = logging.getLogger(__name__)
+
+SEGMENT_PREFIX = "journal-"
+SNAPSHOT_PREFIX = "snapshot-"
+SUFFIX = ".ndjson"
+
+
+class JournalError(Exception):
+    """日志写入失败(写入失败后日志停止接受新记录)"""
+
+
+def encode(record: Dict) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(record, option=orjson.OPT_APPEND_NEWLINE)
+    return json.dumps(record, ensure_ascii=False, separators=(",", ":")).encode() + b"\n"
+
+
+decode = orjson.loads if orjson is not None else json.loads
+
+
+class Journal:
+    def __init__(self, directory: str, fsync: bool = True):
+        """
+        :param directory: 日志目录(同一时刻只允许一个进程打开)
+        :param fsync: 每批写入后是否 fsync(关闭后只保证写入操作系统缓存)
+        """
+        self.directory = directory
+        self.fsync = fsync
+        os.makedirs(directory, exist_ok=True)
+        self._lock_file = open(os.path.join(directory, "LOCK"), "a+")
+        if fcntl is not None:
+            # 平滑重载时新进程等待旧进程关闭日志
+            fcntl.flock(self._lock_file, fcntl.LOCK_EX)
+        self._cond = threading.Condition()
+        self._pending: List[bytes] = []
+        self._seq = 0            # 最后分配的序号
+        self._durable = 0        # 已落盘的最大序号
+        self._segment_start = 0  # 当前段的起始序号
+        self._rotate_to: Optional[int] = None
+        self._error: Optional[BaseException] = None
+        self._closed = False
+        self._file = None
+        self._thread: Optional[threading.Thread] = None
+        self.commits = 0
+
+    # ---- 文件 ----
+
+    def _files(self, prefix: str) -> List[Tuple[int, str]]:
+        """目录下某类文件的 (序号, 路径)，按序号升序"""
+        files = []
+        for name in os.listdir(self.directory):
+            if name.startswith(prefix) and name.endswith(SUFFIX):
+                try:
+                    number = int(name[len(prefix):-len(SUFFIX)])
+                except ValueError:
+                    continue
+                files.append((number, os.path.join(self.directory, name)))
+        return sorted(files)
+
+    def _path(self, prefix: str, number: int) -> str:
+        return os.path.join(self.directory, f"{prefix}{number:020d}{SUFFIX}")
+
+    def _sync_directory(self) -> None:
+        if self.fsync and hasattr(os, "O_DIRECTORY"):
+            fd = os.open(self.directory, os.O_RDONLY | os.O_DIRECTORY)
+            try:
+                os.fsync(fd)
+            finally:
+                os.close(fd)
+
+    # ---- 恢复 ----
+
+    def load_snapshot(self) -> Tuple[int, Iterator[Dict]]:
+        """返回最新快照的 (序号, 状态记录迭代器)，没有快照时为 (0, 空迭代器)"""
+        snapshots = self._files(SNAPSHOT_PREFIX)
+        if not snapshots:
+            return 0, iter(())
+        seq, path = snapshots[-1]
+        return seq, self._read_snapshot(path)
+
+    @staticmethod
+    def _read_snapshot(path: str) -> Iterator[Dict]:
+        with open(path, "rb") as f:
+            for line in f:
+                yield decode(line)
+
+    def replay(self, after: int) -> Iterator[Dict]:
+        """按序返回序号大于 after 的日志记录"""
+        expected = after + 1
+        for _, path in self._files(SEGMENT_PREFIX):
+            with open(path, "rb") as f:
+                for number, line in enumerate(f, 1):
+                    try:
+                        record = decode(line)
+                    except ValueError:
+                        # 崩溃时未写完的段尾，之后的段从下一序号续写
+                        logger.warning("日志段 %s 第 %d 行不完整，已忽略该段剩余内容", path, number)
+                        break
+                    seq = record["seq"]
+                    if seq < expected:
+                        continue
+                    if seq > expected:
+                        raise JournalError(f"日志序号不连续: 期望 {expected}，实际 {seq} ({path})")
+                    expected += 1
+                    yield record
+
+    def open(self, last_seq: int) -> None:
+        """从 last_seq 之后开始写入新段并启动提交线程(恢复完成后调用)"""
+        self._seq = self._durable = last_seq
+        self._open_segment(last_seq + 1)
+        self._thread = threading.Thread(target=self._run, name="journal-writer", daemon=True)
+        self._thread.start()
+
+    def _open_segment(self, start: int) -> None:
+        path = self._path(SEGMENT_PREFIX, start)
+        # 上次运行在同一序号处留下的段只含残行(其完整记录序号都更小)，直接覆盖
+        self._file = open(path, "wb")
+        self._segment_start = start
+        self._sync_directory()
+
+    # ---- 写入 ----
+
+    def append(self, record: Dict) -> int:
+        """登记一条记录，返回其序号(未落盘，需要时调用 wait)"""
+        with self._cond:
+            if self._error is not None or self._closed:
+                raise JournalError("日志已关闭或写入失败") from self._error
+            self._seq += 1
+            record["seq"] = self._seq
+            self._pending.append(encode(record))
+            self._cond.notify_all()
+            return self._seq
+
+    def wait(self, seq: int) -> None:
+        """等待序号 seq 及之前的记录落盘"""
+        with self._cond:
+            while self._durable < seq:
+                if self._error is not None:
+                    raise JournalError("日志写入失败") from self._error
+                self._cond.wait()
+
+    def rotate(self) -> int:
+        """切换到新日志段，返回旧段的最后序号(其前的记录都在旧段中，且已落盘)"""
+        with self._cond:
+            boundary = self._seq
+            if self._segment_start == boundary + 1:
+                return boundary  # 上次切换后没有新记录
+            self._rotate_to = boundary + 1
+            self._cond.notify_all()
+            while self._segment_start != boundary + 1:
+                if self._error is not None:
+                    raise JournalError("日志写入失败") from self._error
+                self._cond.wait()
+            return boundary
+
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                while not self._pending and self._rotate_to is None and not self._closed:
+                    self._cond.wait()
+                if self._closed and not self._pending:
+                    return
+                rotate_to = self._rotate_to
+                end = self._seq
+                if rotate_to is not None and end >= rotate_to:
+                    # 切换点之后登记的记录留到新段中写入
+                    split = len(self._pending) - (end - rotate_to + 1)
+                    batch, self._pending = self._pending[:split], self._pending[split:]
+                    end = rotate_to - 1
+                else:
+                    batch, self._pending = self._pending, []
+            try:
+                if batch:
+                    self._file.write(b"".join(batch))
+                    self._file.flush()
+                    if self.fsync:
+                        os.fsync(self._file.fileno())
+                if rotate_to is not None:
+                    self._file.close()
+                    self._open_segment(rotate_to)
+            except BaseException as e:
+                logger.exception("日志写入失败")
+                with self._cond:
+                    self._error = e
+                    self._cond.notify_all()
+                return
+            with self._cond:
+                self._durable = end
+                if rotate_to is not None and self._rotate_to == rotate_to:
+                    self._rotate_to = None
+                self.commits += 1
+                self._cond.notify_all()
+
+    # ---- 快照 ----
+
+    def write_snapshot(self, seq: int, records: Iterable[Dict]) -> str:
+        """写入截至 seq 的快照，成功后删除更早的快照与日志段"""
+        path = self._path(SNAPSHOT_PREFIX, seq)
+        temp = path + ".tmp"
+        with open(temp, "wb") as f:
+            buffer = []
+            for record in records:
+                buffer.append(encode(record))
+                if len(buffer) >= 4096:
+                    f.write(b"".join(buffer))
+                    buffer.clear()
+            f.write(b"".join(buffer))
+            f.flush()
+            if self.fsync:
+                os.fsync(f.fileno())
+        os.replace(temp, path)
+        self._sync_directory()
+        for number, old in self._files(SNAPSHOT_PREFIX):
+            if number < seq:
+                os.remove(old)
+        for start, old in self._files(SEGMENT_PREFIX):
+            if start <= seq:
+                os.remove(old)
+        return path
+
+    # ---- 状态 ----
+
+    @property
+    def seq(self) -> int:
+        return self._seq
+
+    @property
+    def durable_seq(self) -> int:
+        return self._durable
+
+    def close(self) -> None:
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        if self._thread is not None:
+            self._thread.join()
+        if self._file is not None:
+            self._file.close()
+        if fcntl is not None:
+            fcntl.flock(self._lock_file, fcntl.LOCK_UN)
+        self._lock_file.close()
@@ -0,0 +1,66 @@
+"""JSON 序列化
+
+安装 orjson 时 Flask 应用与 ASGI 入口使用 orjson 编解码(直接输出 UTF-8 字节，不转义中文、不排序键)，
+未安装时回退到标准库 json，行为与 Flask 默认一致。
+"""
+import json
+from typing import Any
+
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:  # orjson 为可选依赖
+    orjson = None
+
+# 非字符串键(如整数)按字符串输出，与标准库行为一致
+_ORJSON_OPTIONS = orjson.OPT_NON_STR_KEYS if orjson is not None else 0
+
+
+def _default(obj: Any) -> Any:
+    """orjson 不支持的类型(Decimal、date 等)交给 Flask 默认规则处理"""
+    return DefaultJSONProvider.default(obj)
+
+
+def dumps_bytes(obj: Any) -> bytes:
+    """序列化为 UTF-8 字节(供 ASGI 入口与流式响应使用)"""
+    if orjson is not None:
+        try:
+            return orjson.dumps(obj, default=_default, option=_ORJSON_OPTIONS)
+        except TypeError:
+            pass  # 超出 64 位的整数等，回退标准库
+    return json.dumps(obj, default=_default, ensure_ascii=False, separators=(",", ":")).encode()
+
+
+def loads(data):
+    return orjson.loads(data) if orjson is not None else json.loads(data)
+
+
+class OrjsonProvider(DefaultJSONProvider):
+    """基于 orjson 的 Flask JSON provider；带格式参数(indent 等)的调用回退到标准库"""
+
+    def dumps(self, obj: Any, **kwargs: Any) -> str:
+        if kwargs:
+            return super().dumps(obj, **kwargs)
+        return dumps_bytes(obj).decode()
+
+    def loads(self, s, **kwargs: Any) -> Any:
+        if kwargs:
+            return super().loads(s, **kwargs)
+        return orjson.loads(s)
+
+    def response(self, *args: Any, **kwargs: Any):
+        obj = self._prepare_response_obj(args, kwargs)
+        # 直接以字节构造响应，省去 str 编码与拼接换行
+        return self._app.response_class(dumps_bytes(obj) + b"\n", mimetype=self.mimetype)
+
+
+def json_provider_class(name: str = "auto"):
+    """按名称选择 provider：auto(有 orjson 时使用 orjson)、orjson、std"""
+    if name == "std":
+        return DefaultJSONProvider
+    if orjson is None:
+        if name == "orjson":
+            raise ImportError("JSON_PROVIDER=orjson 需要安装 orjson: pip install orjson")
+        return DefaultJSONProvider
+    return OrjsonProvider
@@ -0,0 +1,77 @@
+"""账户余额账本
+
+余额以整数"分"存储，所有变动通过 Ledger 以追加日志条目的方式写入存储：
+- 同一账户的变动经分段锁串行化(进程内)，存储层再以条件更新保证跨进程原子性
+- 不同账户落在不同分段上，可并发执行
+- 每条日志以 (kind, ref) 唯一，重复提交同一业务单据不会重复记账
+"""
+import threading
+import zlib
+from decimal import Decimal, ROUND_HALF_UP
+from typing import Callable, Dict, List, Optional
+
+
+class InsufficientBalance(Exception):
+    """余额不足"""
+
+
+def to_cents(amount) -> int:
+    """元 -> 分(四舍五入)"""
+    return int(Decimal(str(amount)).quantize(Decimal("0.01"), rounding=ROUND_HALF_UP) * 100)
+
+
+def is_whole_cents(amount) -> bool:
+    """金额(元)是否最多两位小数，即换算为分时无需舍入(调用方需先限制金额范围)"""
+    return Decimal(str(amount)) % Decimal("0.01") == 0
+
+
+def from_cents(cents: int) -> float:
+    """分 -> 元"""
+    return cents / 100
+
+
+class Ledger:
+    def __init__(self, store, stripes: int = 256, on_change: Optional[Callable[[str], None]] = None):
+        """
+        :param store: 存储后端(需实现 apply_balance_delta / list_ledger_entries)
+        :param stripes: 分段锁数量
+        :param on_change: 余额变动写入存储后以账户调用(如失效余额缓存)
+        """
+        self.store = store
+        self.on_change = on_change
+        self._locks = [threading.Lock() for _ in range(stripes)]
+
+    def _lock_for(self, account: str) -> threading.Lock:
+        return self._locks[zlib.crc32(account.encode()) % len(self._locks)]
+
+    def credit(self, account: str, cents: int, kind: str, ref: str) -> Dict:
+        """入账，账户不存在时自动创建"""
+        if cents <= 0:
+            raise ValueError("入账金额必须大于0")
+        with self._lock_for(account):
+            entry = self.store.apply_balance_delta(account, cents, kind, ref)
+        self._changed(entry)
+        return entry
+
+    def debit(self, account: str, cents: int, kind: str, ref: str) -> Dict:
+        """扣款，余额不足时抛出 InsufficientBalance"""
+        if cents <= 0:
+            raise ValueError("扣款金额必须大于0")
+        with self._lock_for(account):
+            entry = self.store.apply_balance_delta(account, -cents, kind, ref)
+        if entry is None:
+            raise InsufficientBalance(f"余额不足: 账户={account}, 金额={from_cents(cents)}")
+        self._changed(entry)
+        return entry
+
+    def _changed(self, entry: Optional[Dict]) -> None:
+        if self.on_change is not None and entry is not None and not entry["duplicate"]:
+            self.on_change(entry["account"])
+
+    def balance_cents(self, account: str) -> int:
+        user = self.store.get_user(account)
+        return user["balance_cents"] if user else 0
+
+    def entries(self, account: str, limit: int = 100) -> List[Dict]:
+        """按时间倒序返回账户的账本条目"""
+        return self.store.list_ledger_entries(account, limit)
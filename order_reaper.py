@@ -0,0 +1,213 @@
+"""待支付订单过期与终态订单归档
+
+- TimerWheel: 哈希时间轮，定时任务的登记/取消为 O(1)，每个 tick 只检查一个槽
+- OrderReaper: 后台线程推进时间轮，到期的待支付订单置为 expired，
+  进入终态的订单在保留期后移入归档；另按周期借助订单索引补扫，
+  覆盖进程重启前或其他 worker 进程创建的订单
+"""
+import logging
+import math
+import threading
+import time
+from typing import Callable, Dict, Hashable, Iterable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class TimerWheel:
+    """单层哈希时间轮(线程安全)
+
+    到期时间在第 n 个 tick 起点之前(含)的任务登记在 n % slots 号槽，推进到该 tick 时必已到期；
+    到期时间超过一圈的任务留在槽内等待后续轮次。
+    """
+
+    def __init__(self, tick: float = 1.0, slots: int = 4096, now: Optional[float] = None):
+        self.tick = tick
+        self._slots: List[Dict[Hashable, float]] = [{} for _ in range(slots)]
+        self._slot_of: Dict[Hashable, int] = {}
+        self._current = int((time.time() if now is None else now) / tick)  # 已处理到的 tick 序号
+        self._lock = threading.Lock()
+
+    def schedule(self, key: Hashable, deadline: float) -> None:
+        """登记(或改期)任务，已过期的任务在下一次推进时取出"""
+        with self._lock:
+            self._cancel(key)
+            slot = max(math.ceil(deadline / self.tick), self._current + 1) % len(self._slots)
+            self._slots[slot][key] = deadline
+            self._slot_of[key] = slot
+
+    def cancel(self, key: Hashable) -> bool:
+        with self._lock:
+            return self._cancel(key)
+
+    def _cancel(self, key: Hashable) -> bool:
+        slot = self._slot_of.pop(key, None)
+        if slot is None:
+            return False
+        del self._slots[slot][key]
+        return True
+
+    def advance(self, now: Optional[float] = None) -> List[Hashable]:
+        """推进到 now，返回到期的任务键"""
+        now = time.time() if now is None else now
+        target = int(now / self.tick)
+        due = []
+        with self._lock:
+            # 落后超过一圈时每个槽只需扫描一次
+            steps = min(target - self._current, len(self._slots))
+            for step in range(1, steps + 1):
+                slot = (self._current + step) % len(self._slots)
+                entries = self._slots[slot]
+                expired = [key for key, deadline in entries.items() if deadline <= now]
+                for key in expired:
+                    del entries[key]
+                    del self._slot_of[key]
+                due.extend(expired)
+            self._current = max(self._current, target)
+        return due
+
+    def __len__(self) -> int:
+        return len(self._slot_of)
+
+
+class OrderReaper:
+    """订单过期与归档的后台线程"""
+
+    def __init__(self, store, expire: Callable[[str], bool], archived: Callable[[Dict[str, Dict]], None],
+                 order_ttl: float = 1800.0, retention: float = 3600.0,
+                 final_statuses: Iterable[str] = ("paid", "recharged", "failed", "refunded", "expired"),
+                 tick: float = 1.0, slots: int = 4096, sweep_interval: float = 60.0,
+                 batch_size: int = 500):
+        """
+        :param store: 存储后端(需实现 query_orders / archive_orders)
+        :param expire: 过期单个待支付订单，订单已离开 pending 状态时返回 False
+        :param archived: 订单归档后的回调(驱逐缓存等)，参数为被归档的订单 {order_id: order}
+        :param order_ttl: 待支付订单有效期(秒)，<=0 表示不过期
+        :param retention: 终态订单在活跃订单表中的保留时间(秒)，<0 表示不归档
+        :param sweep_interval: 索引补扫间隔(秒)
+        """
+        self.store = store
+        self.expire = expire
+        self.archived = archived
+        self.order_ttl = order_ttl
+        self.retention = retention
+        self.final_statuses = tuple(final_statuses)
+        self.sweep_interval = sweep_interval
+        self.batch_size = batch_size
+        self.wheel = TimerWheel(tick=tick, slots=slots)
+        self._stopping = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._stats_lock = threading.Lock()
+        self.expired_count = 0
+        self.archived_count = 0
+        self.last_sweep_time = 0.0
+
+    def schedule_expiry(self, order_id: str, create_time: float) -> None:
+        if self.order_ttl > 0:
+            self.wheel.schedule(("expire", order_id), create_time + self.order_ttl)
+
+    def schedule_archive(self, order_id: str, finish_time: Optional[float] = None) -> None:
+        """订单进入终态：取消过期任务，保留期满后归档"""
+        self.wheel.cancel(("expire", order_id))
+        if self.retention >= 0:
+            self.wheel.schedule(("archive", order_id), (finish_time or time.time()) + self.retention)
+
+    def start(self) -> None:
+        self._thread = threading.Thread(target=self._run, name="order-reaper", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 5.0) -> None:
+        self._stopping.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def run_once(self, now: Optional[float] = None) -> int:
+        """处理到期任务，返回处理的订单数"""
+        expire_ids, archive_ids = [], []
+        for kind, order_id in self.wheel.advance(now):
+            (expire_ids if kind == "expire" else archive_ids).append(order_id)
+        return self._expire(expire_ids) + self._archive(archive_ids)
+
+    def sweep(self, now: Optional[float] = None) -> int:
+        """按索引补扫时间轮之外的过期订单与待归档订单，返回处理的订单数"""
+        now = time.time() if now is None else now
+        total = 0
+        if self.order_ttl > 0:
+            total += self._sweep_status("pending", now - self.order_ttl, self._expire)
+        if self.retention >= 0:
+            for status in self.final_statuses:
+                total += self._sweep_status(status, now - self.retention, self._archive)
+        self.last_sweep_time = now
+        return total
+
+    def _finish_time(self, order: Dict) -> float:
+        """订单进入终态的时间(取各时间字段的最大值；过期订单按创建时间加有效期估算)"""
+        finish_time = max(order[name] for name in ("create_time", "pay_time", "recharge_time")
+                          if order.get(name) is not None)
+        if order["status"] == "expired":
+            finish_time = max(finish_time, order["create_time"] + self.order_ttl)
+        return finish_time
+
+    def _sweep_status(self, status: str, before: float, handle: Callable[[List[str]], int]) -> int:
+        """处理 status 状态下完成时间早于 before 的订单(按创建时间索引分批游标遍历)"""
+        total = 0
+        after = None
+        while not self._stopping.is_set():
+            orders = self.store.query_orders(status=status, end=before, after=after,
+                                             limit=self.batch_size, descending=False)
+            if not orders:
+                break
+            after = (orders[-1]["create_time"], orders[-1]["order_id"])
+            due = [order["order_id"] for order in orders
+                   if status == "pending" or self._finish_time(order) < before]
+            total += handle(due)
+            if len(orders) < self.batch_size:
+                break
+        return total
+
+    def _expire(self, order_ids: List[str]) -> int:
+        count = 0
+        for order_id in order_ids:
+            try:
+                if self.expire(order_id):
+                    count += 1
+            except Exception as e:
+                logger.error(f"订单过期处理失败: 订单ID={order_id}, 错误={e}")
+        with self._stats_lock:
+            self.expired_count += count
+        return count
+
+    def _archive(self, order_ids: List[str]) -> int:
+        if not order_ids:
+            return 0
+        # 登记归档后订单可能又发生了变化(如已支付订单开始退款)，由存储在归档的同一原子操作内
+        # 检查状态，只归档仍处于终态的订单
+        archived = self.store.archive_orders(order_ids, self.final_statuses)
+        if archived:
+            self.archived(archived)
+        with self._stats_lock:
+            self.archived_count += len(archived)
+        return len(archived)
+
+    def _run(self) -> None:
+        next_sweep = 0.0
+        while not self._stopping.wait(self.wheel.tick):
+            try:
+                self.run_once()
+                if time.monotonic() >= next_sweep:
+                    self.sweep()
+                    next_sweep = time.monotonic() + self.sweep_interval
+            except Exception as e:
+                logger.error(f"订单清理失败: {e}")
+
+    def metrics(self) -> Dict:
+        with self._stats_lock:
+            return {
+                "timers": len(self.wheel),
+                "expired": self.expired_count,
+                "archived": self.archived_count,
+                "last_sweep_time": self.last_sweep_time,
+                "order_ttl": self.order_ttl,
+                "retention": self.retention
+            }
@@ -0,0 +1,84 @@
+"""进程内订单事件发布/订阅
+
+OrderService 修改订单状态时发布事件，SSE/长轮询接口订阅对应订单，
+状态变化可即时推送给客户端，无需定时轮询。
+"""
+import queue
+import threading
+from typing import Callable, Dict, Optional, Set
+
+
+class Subscription:
+    def __init__(self, bus: "OrderEventBus", order_id: str, maxsize: int = 16,
+                 listener: Optional[Callable[[], None]] = None):
+        """
+        :param listener: 每条事件入队后在发布方线程调用(如唤醒事件循环)，供协程等待事件而不占用线程
+        """
+        self.bus = bus
+        self.order_id = order_id
+        self.listener = listener
+        self._events: "queue.Queue[Dict]" = queue.Queue(maxsize=maxsize)
+
+    def get(self, timeout: Optional[float] = None) -> Optional[Dict]:
+        """等待下一条事件，超时返回 None"""
+        try:
+            return self._events.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def put(self, event: Dict) -> None:
+        try:
+            self._events.put_nowait(event)
+        except queue.Full:
+            # 消费过慢时丢弃最旧事件，只保留最新状态
+            try:
+                self._events.get_nowait()
+            except queue.Empty:
+                pass
+            self._events.put_nowait(event)
+        if self.listener is not None:
+            self.listener()
+
+    def close(self) -> None:
+        self.bus.unsubscribe(self)
+
+    def __enter__(self) -> "Subscription":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+
+class OrderEventBus:
+    def __init__(self):
+        self._subscribers: Dict[str, Set[Subscription]] = {}
+        self._lock = threading.Lock()
+
+    def subscribe(self, order_id: str, listener: Optional[Callable[[], None]] = None) -> Subscription:
+        subscription = Subscription(self, order_id, listener=listener)
+        with self._lock:
+            self._subscribers.setdefault(order_id, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+        with self._lock:
+            subscribers = self._subscribers.get(subscription.order_id)
+            if subscribers is not None:
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self._subscribers[subscription.order_id]
+
+    def publish(self, order_id: str, event: Dict) -> int:
+        """发布订单事件，返回收到事件的订阅者数量"""
+        subscribers = self._subscribers.get(order_id)
+        if not subscribers:
+            return 0
+        with self._lock:
+            targets = list(self._subscribers.get(order_id, ()))
+        for subscription in targets:
+            subscription.put(event)
+        return len(targets)
+
+    def subscriber_count(self) -> int:
+        with self._lock:
+            return sum(len(subscribers) for subscribers in self._subscribers.values())
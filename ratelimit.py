@@ -0,0 +1,89 @@
+"""限流与准入控制
+
+- RateLimiter: 按键(账户、客户端IP)的令牌桶，桶状态保存在存储中，多个 worker 共享同一个桶。
+  各进程每次从存储租用一小批令牌(lease)在本地消耗，被拒绝时在本地记住可重试时间，
+  因此正常请求与被拒绝的突发请求大多不访问存储
+- ConcurrencyLimiter: 进程内在途请求数上限，超出时立即拒绝(不排队)，在开始耗时操作前卸载负载
+"""
+import threading
+import time
+from typing import Dict, List
+
+
+class RateLimiter:
+    def __init__(self, store, rate: float, burst: float, lease: int = 5, lease_ttl: float = 1.0,
+                 max_keys: int = 100000):
+        """
+        :param store: 存储后端(需实现 lease_tokens)
+        :param rate: 每秒补充的令牌数
+        :param burst: 桶容量
+        :param lease: 每次从存储租用的令牌数(不超过 burst)；越大访问存储越少，多 worker 间的限额越不精确
+        :param lease_ttl: 租到的令牌在本地的有效期(秒)，过期未用完的令牌作废
+        :param max_keys: 本地状态的键数上限，超出时清空
+        """
+        self.store = store
+        self.rate = rate
+        self.burst = burst
+        self.lease = max(1, min(lease, int(burst)))
+        self.lease_ttl = lease_ttl
+        self.max_keys = max_keys
+        # 键 -> [剩余租用令牌, 租约到期时间, 拒绝到期时间](monotonic 时钟)
+        self._local: Dict[str, List[float]] = {}
+        self._lock = threading.Lock()
+        self.allowed = 0
+        self.rejected = 0
+
+    def acquire(self, key: str) -> float:
+        """取得一个令牌，成功返回 0，被限流时返回建议的重试等待秒数"""
+        now = time.monotonic()
+        with self._lock:
+            state = self._local.get(key)
+            if state is not None:
+                if now < state[2]:
+                    self.rejected += 1
+                    return state[2] - now
+                if state[0] >= 1 and now < state[1]:
+                    state[0] -= 1
+                    self.allowed += 1
+                    return 0.0
+
+        granted, retry_after = self.store.lease_tokens(key, self.rate, self.burst, self.lease)
+        with self._lock:
+            if len(self._local) >= self.max_keys:
+                self._local.clear()
+            if granted:
+                self._local[key] = [granted - 1, now + self.lease_ttl, 0.0]
+                self.allowed += 1
+                return 0.0
+            self._local[key] = [0, 0.0, now + retry_after]
+            self.rejected += 1
+            return retry_after
+
+
+class ConcurrencyLimiter:
+    """进程内在途请求数上限(非阻塞)，limit <= 0 表示不限制"""
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self._semaphore = threading.BoundedSemaphore(limit) if limit > 0 else None
+        self._lock = threading.Lock()
+        self.inflight = 0
+        self.rejected = 0
+
+    def try_acquire(self) -> bool:
+        if self._semaphore is None:
+            return True
+        if not self._semaphore.acquire(blocking=False):
+            with self._lock:
+                self.rejected += 1
+            return False
+        with self._lock:
+            self.inflight += 1
+        return True
+
+    def release(self) -> None:
+        if self._semaphore is None:
+            return
+        with self._lock:
+            self.inflight -= 1
+        self._semaphore.release()
@@ -0,0 +1,276 @@
+"""支付状态对账
+
+回调丢失时订单会一直停留在 pending/paid。Reconciler 在后台周期性地按订单索引
+分批选出在途订单，并发调用网关 check_payment_status 查询实际状态，
+再把状态差异交给与回调相同的幂等处理路径：
+- 并发数由线程池大小限制，查询速率由令牌桶限制
+- 同一订单的并发查询合并为一次网关调用
+- 网关确认状态一致的订单按指数退避延后下次查询，网关已确认支付的订单不再查询，
+  避免每轮重复查询窗口内的全部订单
+- 统计每轮对账的吞吐与滞后，便于调整批大小、并发与速率
+"""
+import logging
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class TokenBucket:
+    """令牌桶限速(线程安全)"""
+
+    def __init__(self, rate: float, burst: Optional[float] = None):
+        """
+        :param rate: 每秒补充的令牌数，<=0 表示不限速
+        :param burst: 桶容量，缺省等于 rate
+        """
+        self.rate = rate
+        self.capacity = burst if burst is not None else max(rate, 1.0)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float) -> None:
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def try_acquire(self, tokens: float = 1.0) -> bool:
+        if self.rate <= 0:
+            return True
+        with self._lock:
+            self._refill(time.monotonic())
+            if self._tokens >= tokens:
+                self._tokens -= tokens
+                return True
+            return False
+
+    def acquire(self, tokens: float = 1.0) -> None:
+        """取得令牌，不足时等待"""
+        if self.rate <= 0:
+            return
+        while True:
+            with self._lock:
+                self._refill(time.monotonic())
+                if self._tokens >= tokens:
+                    self._tokens -= tokens
+                    return
+                wait = (tokens - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+class StatusLookup:
+    """网关状态查询：并发数受线程池限制，速率受令牌桶限制，同一订单的在途查询合并"""
+
+    def __init__(self, check: Callable[[str], Dict], concurrency: int = 16, rate: float = 0.0):
+        """
+        :param check: 查询单个订单的网关状态(如 PaymentGateway.check_payment_status)
+        :param concurrency: 最大并发查询数
+        :param rate: 每秒最大查询数，<=0 表示不限速
+        """
+        self.check = check
+        self.limiter = TokenBucket(rate)
+        self._executor = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="reconcile")
+        self._inflight: Dict[str, Future] = {}
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.coalesced = 0
+
+    def lookup(self, order_id: str) -> Future:
+        """提交查询，返回结果 Future；已有同一订单的查询在途时复用该查询"""
+        with self._lock:
+            future = self._inflight.get(order_id)
+            if future is not None:
+                self.coalesced += 1
+                return future
+            future = self._inflight[order_id] = self._executor.submit(self._call, order_id)
+        future.add_done_callback(lambda _: self._forget(order_id, future))
+        return future
+
+    def _forget(self, order_id: str, future: Future) -> None:
+        with self._lock:
+            if self._inflight.get(order_id) is future:
+                del self._inflight[order_id]
+
+    def _call(self, order_id: str) -> Dict:
+        self.limiter.acquire()
+        with self._lock:
+            self.calls += 1
+        return self.check(order_id)
+
+    def close(self) -> None:
+        self._executor.shutdown(wait=False)
+
+
+class Reconciler:
+    """在途订单对账 worker"""
+
+    # 网关确认、无需再查询的结果类别
+    SETTLED_OUTCOMES = ("confirmed",)
+    # 状态未变化、按退避间隔延后再查询的结果类别
+    BACKOFF_OUTCOMES = ("unchanged", "mismatch")
+
+    def __init__(self, store, lookup: StatusLookup, apply: Callable[[str, Dict, Dict], str],
+                 statuses: Iterable[str] = ("pending", "paid"), min_age: float = 60.0,
+                 max_age: float = 86400.0, batch_size: int = 500, interval: float = 30.0,
+                 max_backoff: float = 3600.0):
+        """
+        :param store: 存储后端(需实现 query_orders)
+        :param apply: 处理单个订单的对账结果 apply(order_id, order, gateway_result)，返回结果类别
+        :param statuses: 需要对账的订单状态
+        :param min_age: 只对账创建超过 min_age 秒的订单，避免与正常回调竞争
+        :param max_age: 只对账 max_age 秒内创建的订单
+        :param interval: 两轮对账之间的间隔(秒)，也是状态未变化订单的首次退避间隔
+        :param max_backoff: 状态未变化订单的最长退避间隔(秒)
+        """
+        self.store = store
+        self.lookup = lookup
+        self.apply = apply
+        self.statuses = tuple(statuses)
+        self.min_age = min_age
+        self.max_age = max_age
+        self.batch_size = batch_size
+        self.interval = interval
+        self.max_backoff = max_backoff
+        # order_id -> (下次查询时间, 当前退避间隔, 创建时间)；只保存在对账窗口内的订单
+        self._next_check: Dict[str, Tuple[float, float, float]] = {}
+        self._stopping = threading.Event()
+        self._wakeup = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._stats_lock = threading.Lock()
+        self.passes = 0
+        self.checked = 0
+        self.errors = 0
+        self.outcomes: Dict[str, int] = {}
+        self.last_pass: Dict = {}
+
+    def start(self) -> None:
+        self._thread = threading.Thread(target=self._run, name="reconciler", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 5.0) -> None:
+        self._stopping.set()
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+        self.lookup.close()
+
+    def trigger(self) -> None:
+        """立即开始下一轮对账"""
+        self._wakeup.set()
+
+    def run_once(self, now: Optional[float] = None) -> Dict:
+        """执行一轮对账，返回本轮统计"""
+        now = time.time() if now is None else now
+        started = time.monotonic()
+        checked = errors = deferred = 0
+        oldest = None
+        outcomes: Dict[str, int] = {}
+        for status in self.statuses:
+            after = None
+            while not self._stopping.is_set():
+                orders = self.store.query_orders(status=status, start=now - self.max_age,
+                                                 end=now - self.min_age, after=after,
+                                                 limit=self.batch_size, descending=False)
+                if not orders:
+                    break
+                after = (orders[-1]["create_time"], orders[-1]["order_id"])
+                full = len(orders) == self.batch_size
+                total = len(orders)
+                orders = [order for order in orders if self._due(order["order_id"], now)]
+                deferred += total - len(orders)
+                if orders:
+                    if oldest is None or orders[0]["create_time"] < oldest:
+                        oldest = orders[0]["create_time"]
+                    errors += self._reconcile_batch(orders, outcomes, now)
+                    checked += len(orders)
+                if not full:
+                    break
+        self._prune(now)
+
+        duration = time.monotonic() - started
+        result = {
+            "checked": checked,
+            "deferred": deferred,
+            "errors": errors,
+            "outcomes": outcomes,
+            "duration": duration,
+            "throughput": checked / duration if duration > 0 else 0.0,
+            # 本轮处理的最早订单已在途多久(秒)
+            "lag": now - oldest if oldest is not None else 0.0,
+            "finish_time": time.time()
+        }
+        with self._stats_lock:
+            self.passes += 1
+            self.checked += checked
+            self.errors += errors
+            for outcome, count in outcomes.items():
+                self.outcomes[outcome] = self.outcomes.get(outcome, 0) + count
+            self.last_pass = result
+        return result
+
+    def _due(self, order_id: str, now: float) -> bool:
+        scheduled = self._next_check.get(order_id)
+        return scheduled is None or scheduled[0] <= now
+
+    def _schedule(self, order: Dict, outcome: str, now: float) -> None:
+        """按结果类别登记订单的下次查询时间"""
+        order_id = order["order_id"]
+        if outcome in self.SETTLED_OUTCOMES:
+            self._next_check[order_id] = (float("inf"), 0.0, order["create_time"])
+        elif outcome in self.BACKOFF_OUTCOMES:
+            previous = self._next_check.get(order_id)
+            delay = min(previous[1] * 2, self.max_backoff) if previous else self.interval
+            self._next_check[order_id] = (now + delay, delay, order["create_time"])
+        else:
+            # 订单状态已被修正，离开待对账状态
+            self._next_check.pop(order_id, None)
+
+    def _prune(self, now: float) -> None:
+        """移除已离开对账窗口的订单记录"""
+        start = now - self.max_age
+        for order_id in [order_id for order_id, (_, _, create_time) in self._next_check.items()
+                         if create_time < start]:
+            del self._next_check[order_id]
+
+    def _reconcile_batch(self, orders: List[Dict], outcomes: Dict[str, int], now: float) -> int:
+        futures = [(order, self.lookup.lookup(order["order_id"])) for order in orders]
+        errors = 0
+        for order, future in futures:
+            order_id = order["order_id"]
+            try:
+                outcome = self.apply(order_id, order, future.result())
+            except Exception as e:
+                # 查询失败的订单下一轮照常重试
+                errors += 1
+                logger.warning(f"订单对账失败: 订单ID={order_id}, 错误={e}")
+                continue
+            outcomes[outcome] = outcomes.get(outcome, 0) + 1
+            self._schedule(order, outcome, now)
+        return errors
+
+    def _run(self) -> None:
+        while not self._stopping.is_set():
+            try:
+                self.run_once()
+            except Exception as e:
+                logger.error(f"对账失败: {e}")
+            self._wakeup.wait(self.interval)
+            self._wakeup.clear()
+
+    def metrics(self) -> Dict:
+        with self._stats_lock:
+            return {
+                "passes": self.passes,
+                "checked": self.checked,
+                "errors": self.errors,
+                "outcomes": dict(self.outcomes),
+                "gateway_calls": self.lookup.calls,
+                "coalesced": self.lookup.coalesced,
+                "last_pass": dict(self.last_pass),
+                "statuses": list(self.statuses),
+                "tracked_orders": len(self._next_check),
+                "interval": self.interval
+            }
@@ -0,0 +1,238 @@
+"""批量退款任务
+
+事故处理时需要一次退款成千上万笔订单：
+- RefundJobStore: SQLite 持久化任务与逐单进度，每批处理结果写回即为检查点
+- RefundJobRunner: 多个 worker 线程并行领取订单批次执行退款；
+  进程崩溃后未完成的批次在租约到期后被重新领取，从检查点继续而不是从头开始
+
+单笔退款函数必须幂等(重复执行不会重复退款或重复变更余额)。
+"""
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class RefundJobStore:
+    """批量退款任务存储，多个进程可共享同一文件"""
+
+    SCHEMA = (
+        """CREATE TABLE IF NOT EXISTS refund_jobs (
+            job_id TEXT PRIMARY KEY,
+            status TEXT NOT NULL DEFAULT 'running',
+            total INTEGER NOT NULL,
+            reason TEXT,
+            create_time REAL NOT NULL,
+            finish_time REAL
+        )""",
+        """CREATE TABLE IF NOT EXISTS refund_job_items (
+            job_id TEXT NOT NULL,
+            order_id TEXT NOT NULL,
+            status TEXT NOT NULL DEFAULT 'queued',
+            attempts INTEGER NOT NULL DEFAULT 0,
+            lease_until REAL,
+            result TEXT,
+            PRIMARY KEY (job_id, order_id)
+        )""",
+        "CREATE INDEX IF NOT EXISTS idx_refund_job_items_status ON refund_job_items(status, lease_until)",
+    )
+
+    def __init__(self, path: str, lease_seconds: float = 60.0, max_attempts: int = 5):
+        self.path = path
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._conn = sqlite3.connect(path, timeout=30, isolation_level=None, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._lock = threading.Lock()
+        with self._lock:
+            for statement in self.SCHEMA:
+                self._conn.execute(statement)
+
+    def _write(self, func):
+        """在一个写事务中执行 func(conn)"""
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                result = func(self._conn)
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+        return result
+
+    def create_job(self, order_ids: Iterable[str], reason: str = "") -> Dict:
+        """创建任务，重复的订单ID只退款一次"""
+        order_ids = list(dict.fromkeys(order_ids))
+        job_id = uuid.uuid4().hex
+
+        def insert(conn):
+            conn.execute(
+                "INSERT INTO refund_jobs (job_id, total, reason, create_time) VALUES (?, ?, ?, ?)",
+                (job_id, len(order_ids), reason, time.time())
+            )
+            conn.executemany(
+                "INSERT INTO refund_job_items (job_id, order_id) VALUES (?, ?)",
+                [(job_id, order_id) for order_id in order_ids]
+            )
+
+        self._write(insert)
+        return {"job_id": job_id, "total": len(order_ids)}
+
+    def claim(self, limit: int) -> List[Tuple[str, str, int]]:
+        """领取一批待退款订单(含租约过期的订单)，返回 [(job_id, order_id, attempts)]"""
+        now = time.time()
+
+        def claim(conn):
+            rows = conn.execute(
+                "SELECT job_id, order_id, attempts FROM refund_job_items "
+                "WHERE status = 'queued' OR (status = 'processing' AND lease_until < ?) LIMIT ?",
+                (now, limit)
+            ).fetchall()
+            conn.executemany(
+                "UPDATE refund_job_items SET status = 'processing', attempts = attempts + 1, lease_until = ? "
+                "WHERE job_id = ? AND order_id = ?",
+                [(now + self.lease_seconds, row["job_id"], row["order_id"]) for row in rows]
+            )
+            return [(row["job_id"], row["order_id"], row["attempts"] + 1) for row in rows]
+
+        return self._write(claim)
+
+    def checkpoint(self, results: List[Tuple[str, str, int, str, Dict]]) -> None:
+        """写回一批处理结果并结束已全部完成的任务
+
+        :param results: [(job_id, order_id, attempts, outcome, 结果)]，outcome 为 done/failed/retry，
+                        retry 的订单按指数退避后重新领取，超过最大尝试次数记为失败
+        """
+        now = time.time()
+
+        def write(conn):
+            updates = []
+            for job_id, order_id, attempts, outcome, result in results:
+                lease_until = None
+                if outcome == "retry":
+                    if attempts >= self.max_attempts:
+                        outcome = "failed"
+                    else:
+                        # 保持租约到退避时间结束，届时被重新领取
+                        outcome = "processing"
+                        lease_until = now + min(self.lease_seconds, 2 ** attempts)
+                updates.append((outcome, lease_until, json.dumps(result, ensure_ascii=False), job_id, order_id))
+            conn.executemany(
+                "UPDATE refund_job_items SET status = ?, lease_until = ?, result = ? "
+                "WHERE job_id = ? AND order_id = ?", updates
+            )
+            for job_id in {item[0] for item in results}:
+                conn.execute(
+                    "UPDATE refund_jobs SET status = 'finished', finish_time = ? "
+                    "WHERE job_id = ? AND status = 'running' AND NOT EXISTS ("
+                    "SELECT 1 FROM refund_job_items WHERE job_id = ? AND status IN ('queued', 'processing'))",
+                    (now, job_id, job_id)
+                )
+
+        self._write(write)
+
+    def get_job(self, job_id: str, failures: int = 100) -> Optional[Dict]:
+        """任务进度：各状态订单数与前 failures 条失败原因"""
+        with self._lock:
+            job = self._conn.execute(
+                "SELECT job_id, status, total, reason, create_time, finish_time FROM refund_jobs WHERE job_id = ?",
+                (job_id,)
+            ).fetchone()
+            if job is None:
+                return None
+            counts = self._conn.execute(
+                "SELECT status, COUNT(*) FROM refund_job_items WHERE job_id = ? GROUP BY status", (job_id,)
+            ).fetchall()
+            failed = self._conn.execute(
+                "SELECT order_id, result FROM refund_job_items WHERE job_id = ? AND status = 'failed' LIMIT ?",
+                (job_id, failures)
+            ).fetchall()
+        return dict(job, counts={row[0]: row[1] for row in counts},
+                    failures=[{"order_id": row["order_id"], "result": json.loads(row["result"] or "null")}
+                              for row in failed])
+
+    def pending_count(self) -> int:
+        with self._lock:
+            return self._conn.execute(
+                "SELECT COUNT(*) FROM refund_job_items WHERE status IN ('queued', 'processing')"
+            ).fetchone()[0]
+
+    def close(self) -> None:
+        self._conn.close()
+
+
+class RefundJobRunner:
+    """批量退款 worker 池"""
+
+    def __init__(self, jobs: RefundJobStore, refund: Callable[[str], Tuple[Dict, int]],
+                 workers: int = 4, batch_size: int = 20, poll_interval: float = 0.5):
+        """
+        :param refund: 单笔退款函数(必须幂等)，返回 (响应体, HTTP状态码)；
+                       2xx 记为完成，5xx 或抛出异常时稍后重试，其余记为失败
+        :param batch_size: 每次领取的订单数，每批完成后写一次检查点
+        """
+        self.jobs = jobs
+        self.refund = refund
+        self.workers = workers
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self._wakeup = threading.Event()
+        self._stopping = threading.Event()
+        self._threads: List[threading.Thread] = []
+
+    def start(self) -> None:
+        for index in range(self.workers):
+            thread = threading.Thread(target=self._run, name=f"refund-worker-{index}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self, timeout: float = 5.0) -> None:
+        self._stopping.set()
+        self._wakeup.set()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads.clear()
+
+    def notify(self) -> None:
+        """有新任务时唤醒 worker"""
+        self._wakeup.set()
+
+    def drain_once(self) -> int:
+        """领取并处理一批订单，返回处理数量"""
+        items = self.jobs.claim(self.batch_size)
+        results = []
+        for job_id, order_id, attempts in items:
+            try:
+                body, status_code = self.refund(order_id)
+            except Exception as e:
+                logger.error(f"批量退款失败: 任务ID={job_id}, 订单ID={order_id}, 第{attempts}次, 错误={e}")
+                body, status_code = {"code": 500, "msg": str(e)[:500]}, 500
+            if status_code < 300:
+                outcome = "done"
+            elif status_code >= 500:
+                outcome = "retry"
+            else:
+                outcome = "failed"
+            results.append((job_id, order_id, attempts, outcome, body))
+        if results:
+            self.jobs.checkpoint(results)
+        return len(items)
+
+    def _run(self) -> None:
+        while not self._stopping.is_set():
+            try:
+                if self.drain_once():
+                    continue
+            except Exception as e:
+                logger.error(f"退款任务读取失败: {e}")
+            self._wakeup.wait(self.poll_interval)
+            self._wakeup.clear()
@@ -0,0 +1,1234 @@
+"""订单/用户存储后端
+
+提供统一的存储接口，内置内存实现(单进程开发用)、带追加日志的内存实现(单进程，崩溃后由快照与日志恢复)
+与 SQLite 实现(WAL 模式 + 连接池，可供多个 worker 进程共享同一数据文件)。
+"""
+import bisect
+import logging
+import os
+import queue
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+from journal import Journal
+
+logger = logging.getLogger(__name__)
+
+ORDER_FIELDS = ("account", "amount", "status", "create_time", "pay_time", "recharge_time")
+# 可用于时间范围查询与排序的订单字段
+ORDER_TIME_FIELDS = ("create_time", "pay_time")
+USER_FIELDS = ("balance_cents", "version", "update_time")
+# 令牌桶闲置超过该时长(秒)后被清理(视为已满)
+BUCKET_IDLE_SECONDS = 3600
+
+
+class BaseStore(ABC):
+    """存储后端接口
+
+    读接口返回数据副本，修改必须通过 update_* 方法写回。
+    transaction() 内的多次读写作为一个原子单元执行。
+    """
+
+    @abstractmethod
+    def get_order(self, order_id: str) -> Optional[Dict]:
+        """按订单ID读取订单，不存在返回 None"""
+
+    @abstractmethod
+    def insert_order(self, order_id: str, order: Dict) -> None:
+        """写入新订单"""
+
+    @abstractmethod
+    def update_order(self, order_id: str, **fields) -> bool:
+        """更新订单字段，订单不存在返回 False"""
+
+    @abstractmethod
+    def get_user(self, account: str) -> Optional[Dict]:
+        """读取用户信息，不存在返回 None"""
+
+    @abstractmethod
+    def ensure_user(self, account: str) -> Dict:
+        """读取用户信息，不存在时以零余额创建"""
+
+    @abstractmethod
+    def update_user(self, account: str, **fields) -> bool:
+        """更新用户字段，用户不存在返回 False"""
+
+    @abstractmethod
+    def apply_balance_delta(self, account: str, delta_cents: int,
+                            kind: str, ref: str) -> Optional[Dict]:
+        """原子地变更余额并追加账本条目
+
+        - 余额变动后小于0时不做修改，返回 None
+        - (kind, ref) 已记账时不重复变更，返回原条目(duplicate=True)
+        - 入账时账户不存在则自动创建
+        """
+
+    @abstractmethod
+    def list_ledger_entries(self, account: str, limit: int = 100) -> List[Dict]:
+        """按时间倒序列出账户的账本条目"""
+
+    @abstractmethod
+    def balance_version(self) -> int:
+        """当前账本序号(最新账本条目ID)，任何账户的余额变动都会使其增大"""
+
+    @abstractmethod
+    def balance_changes(self, since: int, limit: int = 1000) -> List[Tuple[int, str]]:
+        """按序号升序列出序号大于 since 的账本条目 (序号, 账户)，供各进程的余额缓存失效使用"""
+
+    @abstractmethod
+    def lease_tokens(self, key: str, rate: float, burst: float, tokens: int) -> Tuple[int, float]:
+        """从键对应的令牌桶(每秒补充 rate 个，容量 burst)中取出至多 tokens 个令牌
+
+        返回 (取得的令牌数, 取得0个时距下一个令牌可用的秒数)；长时间未使用的桶视为已满并被清理。
+        """
+
+    @abstractmethod
+    def claim_nonce(self, nonce: str, ttl: float) -> bool:
+        """登记回调 nonce，ttl 秒内已登记过则返回 False；过期的 nonce 被定期清理"""
+
+    @abstractmethod
+    def release_nonce(self, nonce: str) -> None:
+        """移除已登记的 nonce(回调处理失败，允许网关重试)"""
+
+    @abstractmethod
+    def query_orders(self, account: Optional[str] = None, status: Optional[str] = None,
+                     time_field: str = "create_time", start: Optional[float] = None,
+                     end: Optional[float] = None, after: Optional[Tuple[float, str]] = None,
+                     limit: int = 100, descending: bool = True) -> List[Dict]:
+        """按账户、状态与时间范围查询订单(走索引，耗时与结果条数成正比)
+
+        - 结果按 (time_field, order_id) 排序，每条订单包含 order_id
+        - 时间范围为 [start, end)，time_field 为空的订单不参与查询
+        - after 为上一页最后一条的 (time_field 值, order_id)，用于游标分页
+        """
+
+    @abstractmethod
+    def archive_orders(self, order_ids: Iterable[str],
+                       statuses: Optional[Iterable[str]] = None) -> Dict[str, Dict]:
+        """将订单移出活跃订单表并归档，返回被归档的订单 {order_id: order}
+
+        指定 statuses 时只归档当前状态属于其中的订单(状态检查与归档为同一原子操作)。
+        """
+
+    @abstractmethod
+    def get_archived_order(self, order_id: str) -> Optional[Dict]:
+        """读取已归档订单，不存在(或已超出归档容量)返回 None"""
+
+    @abstractmethod
+    def transaction(self):
+        """事务上下文管理器"""
+
+    def has_order(self, order_id: str) -> bool:
+        return self.get_order(order_id) is not None
+
+    def get_order_status(self, order_id: str) -> Optional[Tuple[str, float]]:
+        """只读取订单的 (状态, 金额)，供只读接口使用，不存在返回 None"""
+        order = self.get_order(order_id)
+        return (order["status"], order["amount"]) if order is not None else None
+
+    def get_balance(self, account: str) -> Optional[Tuple[int, int, float]]:
+        """只读取账户的 (余额分, 版本, 更新时间)，供只读接口使用，不存在返回 None"""
+        user = self.get_user(account)
+        return (user["balance_cents"], user["version"], user["update_time"]) if user is not None else None
+
+    def get_orders(self, order_ids: Iterable[str]) -> Dict[str, Dict]:
+        """批量读取订单，返回 {order_id: order}，不存在的订单不包含在结果中"""
+        orders = {}
+        for order_id in order_ids:
+            order = self.get_order(order_id)
+            if order is not None:
+                orders[order_id] = order
+        return orders
+
+    def insert_order_if_absent(self, order_id: str, order: Dict) -> bool:
+        """订单不存在时写入并返回 True，已存在时不修改并返回 False(检查与写入为同一原子操作)"""
+        with self.transaction():
+            if self.has_order(order_id):
+                return False
+            self.insert_order(order_id, order)
+            return True
+
+    def insert_orders(self, orders: Dict[str, Dict]) -> None:
+        """在一个事务中批量写入订单"""
+        with self.transaction():
+            for order_id, order in orders.items():
+                self.insert_order(order_id, order)
+
+    def ensure_users(self, accounts: Iterable[str]) -> Dict[str, Dict]:
+        """批量读取用户信息，不存在时以零余额创建"""
+        return {account: self.ensure_user(account) for account in set(accounts)}
+
+    def release_ledger_entries(self, refs: Iterable[Tuple[str, str]]) -> int:
+        """释放不会再被记账的 (kind, ref) 对应的账本条目与去重索引(如已归档订单)，返回释放条数
+
+        持久化存储保留完整账本，默认不释放；内存存储据此限制账本占用的内存。
+        """
+        return 0
+
+    def close(self) -> None:
+        """释放资源"""
+
+
+class OrderArchive:
+    """内存订单归档(容量有限)
+
+    订单以元组紧凑存储，超出容量时丢弃最早归档的订单。
+    """
+
+    def __init__(self, max_size: int = 100000):
+        self.max_size = max_size
+        self._items: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def add(self, orders: Dict[str, Dict]) -> None:
+        if self.max_size <= 0:
+            return
+        with self._lock:
+            for order_id, order in orders.items():
+                self._items[order_id] = tuple(order.get(name) for name in ORDER_FIELDS)
+            while len(self._items) > self.max_size:
+                self._items.popitem(last=False)
+
+    def get(self, order_id: str) -> Optional[Dict]:
+        item = self._items.get(order_id)
+        return dict(zip(ORDER_FIELDS, item)) if item is not None else None
+
+    def items(self) -> List[Tuple[str, Dict]]:
+        """按归档顺序返回全部 (order_id, order)"""
+        with self._lock:
+            items = list(self._items.items())
+        return [(order_id, dict(zip(ORDER_FIELDS, item))) for order_id, item in items]
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+
+class MemoryStore(BaseStore):
+    """内存存储(仅限单进程，重启后数据丢失)
+
+    订单按账户、状态(均按 create_time 排序)及 create_time/pay_time 维护有序索引，
+    在 insert_order/update_order 中同步更新。
+    已归档订单的账本条目经 release_ledger_entries 释放：先登记释放的条目ID，
+    待释放条目超过账本一半时整体压缩，摊还开销为常数。
+    """
+
+    INDEXED_FIELDS = frozenset(("account", "status") + ORDER_TIME_FIELDS)
+
+    def __init__(self, users: Optional[Dict[str, Dict]] = None, archive_size: int = 100000):
+        self.orders: Dict[str, Dict] = {}
+        self.archive = OrderArchive(archive_size)
+        self.users: Dict[str, Dict] = {
+            account: {"balance_cents": info.get("balance_cents", 0), "version": 0,
+                      "update_time": info.get("update_time", time.time())}
+            for account, info in (users or {}).items()
+        }
+        self.ledger: List[Dict] = []
+        self._ledger_ids: List[int] = []  # 与 ledger 一一对应的条目ID(升序)，供按序号查找
+        self._ledger_refs: Dict[tuple, Dict] = {}
+        self._released_ids: Set[int] = set()  # 已释放、尚未从 ledger 中压缩移除的条目ID
+        self._ledger_seq = 0
+        self._lock = threading.RLock()
+        self._ledger_lock = threading.Lock()
+        self._buckets: Dict[str, List[float]] = {}
+        self._bucket_lock = threading.Lock()
+        self._next_bucket_purge = 0.0
+        self._nonces: Dict[str, float] = {}
+        self._next_nonce_purge = 0.0
+        # 二级索引: 有序列表，元素为 (时间, order_id)；每个时间字段各有全量、按账户、按状态三类索引
+        self._by_time: Dict[str, List[Tuple[float, str]]] = {field: [] for field in ORDER_TIME_FIELDS}
+        self._by_account: Dict[str, Dict[str, List[Tuple[float, str]]]] = {field: {} for field in ORDER_TIME_FIELDS}
+        self._by_status: Dict[str, Dict[str, List[Tuple[float, str]]]] = {field: {} for field in ORDER_TIME_FIELDS}
+
+    def _index_entries(self, order_id: str, order: Dict):
+        """订单在各索引中的 (索引列表, 键)"""
+        for field in ORDER_TIME_FIELDS:
+            value = order.get(field)
+            if value is not None:
+                key = (value, order_id)
+                yield self._by_time[field], key
+                yield self._by_account[field].setdefault(order["account"], []), key
+                yield self._by_status[field].setdefault(order["status"], []), key
+
+    def _index(self, order_id: str, order: Dict) -> None:
+        for index, key in self._index_entries(order_id, order):
+            if not index or index[-1] < key:
+                index.append(key)  # 按时间顺序写入时为 O(1)
+            else:
+                bisect.insort(index, key)
+
+    def _unindex(self, order_id: str, order: Dict) -> None:
+        for index, key in self._index_entries(order_id, order):
+            position = bisect.bisect_left(index, key)
+            if position < len(index) and index[position] == key:
+                del index[position]
+
+    def get_order(self, order_id: str) -> Optional[Dict]:
+        order = self.orders.get(order_id)
+        return dict(order) if order is not None else None
+
+    def has_order(self, order_id: str) -> bool:
+        return order_id in self.orders
+
+    def get_order_status(self, order_id: str) -> Optional[Tuple[str, float]]:
+        order = self.orders.get(order_id)
+        return (order["status"], order["amount"]) if order is not None else None
+
+    def insert_order(self, order_id: str, order: Dict) -> None:
+        with self._lock:
+            previous = self.orders.get(order_id)
+            if previous is not None:
+                self._unindex(order_id, previous)
+            self.orders[order_id] = order = dict(order)
+            self._index(order_id, order)
+
+    def get_orders(self, order_ids: Iterable[str]) -> Dict[str, Dict]:
+        orders = self.orders
+        return {order_id: dict(orders[order_id]) for order_id in order_ids if order_id in orders}
+
+    def insert_orders(self, orders: Dict[str, Dict]) -> None:
+        with self._lock:
+            for order_id, order in orders.items():
+                self.insert_order(order_id, order)
+
+    def update_order(self, order_id: str, **fields) -> bool:
+        with self._lock:
+            order = self.orders.get(order_id)
+            if order is None:
+                return False
+            reindex = any(order.get(name) != value for name, value in fields.items()
+                          if name in self.INDEXED_FIELDS)
+            if reindex:
+                self._unindex(order_id, order)
+            order.update(fields)
+            if reindex:
+                self._index(order_id, order)
+            return True
+
+    def query_orders(self, account: Optional[str] = None, status: Optional[str] = None,
+                     time_field: str = "create_time", start: Optional[float] = None,
+                     end: Optional[float] = None, after: Optional[Tuple[float, str]] = None,
+                     limit: int = 100, descending: bool = True) -> List[Dict]:
+        if time_field not in ORDER_TIME_FIELDS:
+            raise ValueError(f"不支持的时间字段: {time_field}")
+        with self._lock:
+            # 选择最窄的索引，其余条件在遍历时过滤
+            if account is not None:
+                index = self._by_account[time_field].get(account, [])
+            elif status is not None:
+                index = self._by_status[time_field].get(status, [])
+            else:
+                index = self._by_time[time_field]
+
+            lo = bisect.bisect_left(index, (start,)) if start is not None else 0
+            hi = bisect.bisect_left(index, (end,)) if end is not None else len(index)
+            if after is not None:
+                if descending:
+                    hi = min(hi, bisect.bisect_left(index, tuple(after)))
+                else:
+                    lo = max(lo, bisect.bisect_right(index, tuple(after)))
+            positions = range(hi - 1, lo - 1, -1) if descending else range(lo, hi)
+
+            orders = []
+            for position in positions:
+                order_id = index[position][1]
+                order = self.orders[order_id]
+                if account is not None and order["account"] != account:
+                    continue
+                if status is not None and order["status"] != status:
+                    continue
+                orders.append(dict(order, order_id=order_id))
+                if len(orders) >= limit:
+                    break
+            return orders
+
+    def archive_orders(self, order_ids: Iterable[str],
+                       statuses: Optional[Iterable[str]] = None) -> Dict[str, Dict]:
+        statuses = None if statuses is None else frozenset(statuses)
+        archived = {}
+        with self._lock:
+            for order_id in order_ids:
+                order = self.orders.get(order_id)
+                if order is None or (statuses is not None and order["status"] not in statuses):
+                    continue
+                del self.orders[order_id]
+                self._unindex(order_id, order)
+                archived[order_id] = order
+        self.archive.add(archived)
+        return archived
+
+    def get_archived_order(self, order_id: str) -> Optional[Dict]:
+        return self.archive.get(order_id)
+
+    def get_user(self, account: str) -> Optional[Dict]:
+        user = self.users.get(account)
+        return dict(user) if user is not None else None
+
+    def get_balance(self, account: str) -> Optional[Tuple[int, int, float]]:
+        user = self.users.get(account)
+        return (user["balance_cents"], user["version"], user["update_time"]) if user is not None else None
+
+    def ensure_user(self, account: str) -> Dict:
+        with self._lock:
+            user = self.users.get(account)
+            if user is None:
+                user = self.users[account] = {"balance_cents": 0, "version": 0, "update_time": time.time()}
+            return dict(user)
+
+    def update_user(self, account: str, **fields) -> bool:
+        with self._lock:
+            user = self.users.get(account)
+            if user is None:
+                return False
+            user.update(fields)
+            return True
+
+    def apply_balance_delta(self, account: str, delta_cents: int,
+                            kind: str, ref: str) -> Optional[Dict]:
+        # 同一账户的调用由 Ledger 分段锁串行化，此处不持有全局锁，不同账户可并发
+        existing = self._ledger_refs.get((kind, ref))
+        if existing is not None:
+            return dict(existing, duplicate=True)
+        user = self.users.get(account)
+        if user is None:
+            if delta_cents < 0:
+                return None
+            user = self.ensure_user(account)
+            user = self.users[account]
+        balance = user["balance_cents"] + delta_cents
+        if balance < 0:
+            return None
+        now = time.time()
+        version = user["version"] + 1
+        user.update(balance_cents=balance, version=version, update_time=now)
+        with self._ledger_lock:
+            self._ledger_seq += 1
+            entry = {"id": self._ledger_seq, "account": account, "delta_cents": delta_cents,
+                     "balance_cents": balance, "version": version, "kind": kind,
+                     "ref": ref, "create_time": now}
+            self._append_ledger(entry)
+            self._ledger_appended(entry)
+        return dict(entry, duplicate=False)
+
+    def _append_ledger(self, entry: Dict) -> None:
+        """追加账本条目(调用方持有账本锁或处于恢复阶段)"""
+        self.ledger.append(entry)
+        self._ledger_ids.append(entry["id"])
+        self._ledger_refs[(entry["kind"], entry["ref"])] = entry
+
+    def _ledger_appended(self, entry: Dict) -> None:
+        """账本条目追加后调用(持有账本锁，调用顺序与条目ID顺序一致)"""
+
+    def release_ledger_entries(self, refs: Iterable[Tuple[str, str]]) -> int:
+        with self._ledger_lock:
+            released = self._release_ledger_entries(refs)
+        return len(released)
+
+    def _release_ledger_entries(self, refs: Iterable[Tuple[str, str]]) -> List[Tuple[str, str]]:
+        """释放账本条目(调用方持有账本锁)，返回实际释放的 (kind, ref)"""
+        released = []
+        for kind, ref in refs:
+            entry = self._ledger_refs.pop((kind, ref), None)
+            if entry is not None:
+                self._released_ids.add(entry["id"])
+                released.append((kind, ref))
+        if len(self._released_ids) * 2 > len(self.ledger):
+            kept = [entry for entry in self.ledger if entry["id"] not in self._released_ids]
+            self.ledger = kept
+            self._ledger_ids = [entry["id"] for entry in kept]
+            self._released_ids = set()
+        return released
+
+    def _retained_ledger(self) -> List[Dict]:
+        """未释放的账本条目(调用方持有账本锁)"""
+        released = self._released_ids
+        return [entry for entry in self.ledger if entry["id"] not in released] if released else self.ledger[:]
+
+    def balance_version(self) -> int:
+        return self._ledger_seq
+
+    def balance_changes(self, since: int, limit: int = 1000) -> List[Tuple[int, str]]:
+        # 条目ID递增(释放的条目压缩移除后不再连续)，按ID二分查找起点
+        with self._ledger_lock:
+            start = bisect.bisect_right(self._ledger_ids, since)
+            return [(entry["id"], entry["account"]) for entry in self.ledger[start:start + limit]]
+
+    def lease_tokens(self, key: str, rate: float, burst: float, tokens: int) -> Tuple[int, float]:
+        now = time.time()
+        with self._bucket_lock:
+            if now >= self._next_bucket_purge:
+                idle = now - BUCKET_IDLE_SECONDS
+                self._buckets = {name: bucket for name, bucket in self._buckets.items() if bucket[1] > idle}
+                self._next_bucket_purge = now + 60
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                bucket = self._buckets[key] = [burst, now]
+            available = min(burst, bucket[0] + (now - bucket[1]) * rate)
+            granted = min(tokens, int(available))
+            bucket[0], bucket[1] = available - granted, now
+        return granted, 0.0 if granted else (1 - available) / rate
+
+    def claim_nonce(self, nonce: str, ttl: float) -> bool:
+        now = time.time()
+        with self._bucket_lock:
+            if now >= self._next_nonce_purge:
+                self._nonces = {key: expire_at for key, expire_at in self._nonces.items() if expire_at > now}
+                self._next_nonce_purge = now + 60
+            if self._nonces.get(nonce, 0.0) > now:
+                return False
+            self._nonces[nonce] = now + ttl
+            return True
+
+    def release_nonce(self, nonce: str) -> None:
+        with self._bucket_lock:
+            self._nonces.pop(nonce, None)
+
+    def list_ledger_entries(self, account: str, limit: int = 100) -> List[Dict]:
+        entries = []
+        released = self._released_ids
+        for entry in reversed(self.ledger):
+            if entry["account"] == account and entry["id"] not in released:
+                entries.append(dict(entry))
+                if len(entries) >= limit:
+                    break
+        return entries
+
+    @contextmanager
+    def transaction(self) -> Iterator["MemoryStore"]:
+        with self._lock:
+            yield self
+
+
+class JournaledMemoryStore(MemoryStore):
+    """内存存储 + 追加式日志(仅限单进程，重启或崩溃后由快照与日志恢复)
+
+    每次写操作在内存中生效后，把变更后的完整记录(后像)追加到日志，组提交落盘后才返回；
+    transaction() 内的写操作在事务结束、释放锁之后统一等待落盘。
+    按后像回放是幂等的，因此快照可以在写入持续进行时生成：先切换日志段得到序号 S，
+    再复制内存状态，恢复时加载快照并回放 S 之后的日志即可。
+    恢复耗时取决于状态大小与快照间隔(最多回放 snapshot_every 条左右的日志)。
+    """
+
+    def __init__(self, directory: str, users: Optional[Dict[str, Dict]] = None, archive_size: int = 100000,
+                 snapshot_every: int = 100000, fsync: bool = True, check_interval: float = 1.0):
+        """
+        :param directory: 日志与快照目录
+        :param snapshot_every: 距上次快照新增多少条日志后生成快照
+        :param fsync: 组提交时是否 fsync
+        :param check_interval: 后台线程检查是否需要快照的间隔(秒)
+        """
+        super().__init__(archive_size=archive_size)
+        self.snapshot_every = snapshot_every
+        self._local = threading.local()
+        self._snapshot_lock = threading.Lock()
+        self.journal = Journal(directory, fsync=fsync)
+        started = time.monotonic()
+        self.snapshot_seq, replayed = self._recover()
+        self.recovery = {"snapshot_seq": self.snapshot_seq, "replayed": replayed,
+                         "seconds": time.monotonic() - started}
+        self.journal.open(self.snapshot_seq + replayed)
+        with self.transaction():
+            for account, info in (users or {}).items():
+                if account not in self.users:
+                    self._put_user(account, {"balance_cents": info.get("balance_cents", 0), "version": 0,
+                                             "update_time": info.get("update_time", time.time())})
+        self._stop = threading.Event()
+        self._snapshotter = threading.Thread(target=self._run_snapshots, args=(check_interval,),
+                                             name="journal-snapshot", daemon=True)
+        self._snapshotter.start()
+
+    # ---- 恢复 ----
+
+    def _recover(self) -> Tuple[int, int]:
+        """加载最新快照并回放其后的日志，返回 (快照序号, 回放条数)"""
+        snapshot_seq, records = self.journal.load_snapshot()
+        for record in records:
+            kind = record["t"]
+            if kind == "user":
+                self.users[record["account"]] = record["user"]
+            elif kind == "order":
+                MemoryStore.insert_order(self, record["id"], record["order"])
+            elif kind == "archive":
+                self.archive.add({record["id"]: record["order"]})
+            elif kind == "ledger":
+                entries = record["entries"]
+                for entry in entries:
+                    self._append_ledger(entry)
+                self._ledger_seq = entries[-1]["id"]
+        replayed = 0
+        for record in self.journal.replay(snapshot_seq):
+            self._apply(record)
+            replayed += 1
+        return snapshot_seq, replayed
+
+    def _restore_entry(self, entry: Dict) -> None:
+        if entry["id"] <= self._ledger_seq:
+            return  # 快照生成期间写入的条目，快照中已包含
+        self._append_ledger(entry)
+        self._ledger_seq = entry["id"]
+
+    def _apply(self, record: Dict) -> None:
+        """回放一条日志记录(后像，重复回放结果不变)"""
+        op = record["op"]
+        if op == "order":
+            MemoryStore.insert_order(self, record["id"], record["order"])
+        elif op == "archive":
+            MemoryStore.archive_orders(self, record["ids"])
+        elif op == "release":
+            MemoryStore._release_ledger_entries(self, [tuple(ref) for ref in record["refs"]])
+        elif op == "user":
+            self.users[record["account"]] = record["user"]
+        elif op == "ledger":
+            entry = record["entry"]
+            self._restore_entry(entry)
+            user = self.users.setdefault(entry["account"], {})
+            user.update(balance_cents=entry["balance_cents"], version=entry["version"],
+                        update_time=entry["create_time"])
+
+    # ---- 写入 ----
+
+    def _log(self, record: Dict) -> int:
+        return self.journal.append(record)
+
+    def _commit(self, seq: int) -> None:
+        """等待落盘；事务内推迟到事务结束"""
+        if getattr(self._local, "depth", 0):
+            self._local.seq = max(getattr(self._local, "seq", 0), seq)
+        else:
+            self.journal.wait(seq)
+
+    @contextmanager
+    def transaction(self) -> Iterator["JournaledMemoryStore"]:
+        local = self._local
+        local.depth = getattr(local, "depth", 0) + 1
+        try:
+            with super().transaction():
+                yield self
+        finally:
+            local.depth -= 1
+        if local.depth == 0 and getattr(local, "seq", 0):
+            seq, local.seq = local.seq, 0
+            self.journal.wait(seq)
+
+    def _put_user(self, account: str, user: Dict) -> None:
+        with self._lock:
+            self.users[account] = user
+            seq = self._log({"op": "user", "account": account, "user": dict(user)})
+        self._commit(seq)
+
+    def insert_order(self, order_id: str, order: Dict) -> None:
+        with self._lock:
+            super().insert_order(order_id, order)
+            seq = self._log({"op": "order", "id": order_id, "order": dict(self.orders[order_id])})
+        self._commit(seq)
+
+    def insert_orders(self, orders: Dict[str, Dict]) -> None:
+        with self.transaction():
+            super().insert_orders(orders)
+
+    def update_order(self, order_id: str, **fields) -> bool:
+        with self._lock:
+            if not super().update_order(order_id, **fields):
+                return False
+            seq = self._log({"op": "order", "id": order_id, "order": dict(self.orders[order_id])})
+        self._commit(seq)
+        return True
+
+    def archive_orders(self, order_ids: Iterable[str],
+                       statuses: Optional[Iterable[str]] = None) -> Dict[str, Dict]:
+        with self._lock:
+            archived = super().archive_orders(order_ids, statuses)
+            seq = self._log({"op": "archive", "ids": list(archived)}) if archived else 0
+        self._commit(seq)
+        return archived
+
+    def ensure_user(self, account: str) -> Dict:
+        with self._lock:
+            created = account not in self.users
+            user = super().ensure_user(account)
+            seq = self._log({"op": "user", "account": account, "user": user}) if created else 0
+        self._commit(seq)
+        return user
+
+    def update_user(self, account: str, **fields) -> bool:
+        with self._lock:
+            if not super().update_user(account, **fields):
+                return False
+            seq = self._log({"op": "user", "account": account, "user": dict(self.users[account])})
+        self._commit(seq)
+        return True
+
+    def _ledger_appended(self, entry: Dict) -> None:
+        self._local.ledger_seq = self._log({"op": "ledger", "entry": entry})
+
+    def release_ledger_entries(self, refs: Iterable[Tuple[str, str]]) -> int:
+        with self._ledger_lock:
+            released = self._release_ledger_entries(refs)
+            seq = self._log({"op": "release", "refs": released}) if released else 0
+        self._commit(seq)
+        return len(released)
+
+    def apply_balance_delta(self, account: str, delta_cents: int,
+                            kind: str, ref: str) -> Optional[Dict]:
+        entry = super().apply_balance_delta(account, delta_cents, kind, ref)
+        if entry is not None and not entry["duplicate"]:
+            self._commit(self._local.ledger_seq)
+        return entry
+
+    # ---- 快照 ----
+
+    def snapshot(self) -> int:
+        """生成快照(写入期间不阻塞写操作，只在复制内存状态时持有锁)，返回快照序号
+
+        不能在 transaction() 内调用：后台快照线程可能正在等待事务持有的锁。
+        """
+        with self._snapshot_lock:
+            seq = self.journal.rotate()
+            with self._lock:
+                users = {account: dict(user) for account, user in self.users.items()}
+                orders = [(order_id, dict(order)) for order_id, order in self.orders.items()]
+            with self._ledger_lock:
+                ledger = self._retained_ledger()
+            archive = self.archive.items()
+
+            def records():
+                for account, user in users.items():
+                    yield {"t": "user", "account": account, "user": user}
+                for order_id, order in archive:
+                    yield {"t": "archive", "id": order_id, "order": order}
+                for order_id, order in orders:
+                    yield {"t": "order", "id": order_id, "order": order}
+                # 账本条目占快照的大部分，按批写入，加载时整批追加
+                for start in range(0, len(ledger), 1000):
+                    yield {"t": "ledger", "entries": ledger[start:start + 1000]}
+
+            self.journal.write_snapshot(seq, records())
+            self.snapshot_seq = seq
+            return seq
+
+    def _run_snapshots(self, interval: float) -> None:
+        while not self._stop.wait(interval):
+            if self.journal.durable_seq - self.snapshot_seq >= self.snapshot_every:
+                try:
+                    self.snapshot()
+                except Exception:
+                    logger.exception("生成快照失败")
+
+    def close(self) -> None:
+        """停止后台快照；有新日志时生成最终快照，下次启动无需回放"""
+        self._stop.set()
+        self._snapshotter.join()
+        if self.journal.seq > self.snapshot_seq:
+            self.snapshot()
+        self.journal.close()
+
+
+class SQLiteStore(BaseStore):
+    """SQLite 存储
+
+    - WAL 模式，读写互不阻塞，多进程可共享同一数据库文件
+    - 固定大小连接池，连接跨线程复用
+    - SQL 语句为常量模板，由 sqlite3 的语句缓存复用预编译结果
+    """
+
+    SCHEMA = (
+        """CREATE TABLE IF NOT EXISTS orders (
+            order_id TEXT PRIMARY KEY,
+            account TEXT NOT NULL,
+            amount REAL NOT NULL,
+            status TEXT NOT NULL,
+            create_time REAL NOT NULL,
+            pay_time REAL,
+            recharge_time REAL
+        )""",
+        # 索引末尾带 order_id，游标分页的 (时间, order_id) 比较可直接走索引
+        "CREATE INDEX IF NOT EXISTS idx_orders_account_time ON orders(account, create_time, order_id)",
+        "CREATE INDEX IF NOT EXISTS idx_orders_status_time ON orders(status, create_time, order_id)",
+        "CREATE INDEX IF NOT EXISTS idx_orders_create_time ON orders(create_time, order_id)",
+        "CREATE INDEX IF NOT EXISTS idx_orders_pay_time ON orders(pay_time, order_id) WHERE pay_time IS NOT NULL",
+        """CREATE TABLE IF NOT EXISTS orders_archive (
+            order_id TEXT PRIMARY KEY,
+            account TEXT NOT NULL,
+            amount REAL NOT NULL,
+            status TEXT NOT NULL,
+            create_time REAL NOT NULL,
+            pay_time REAL,
+            recharge_time REAL,
+            archive_time REAL NOT NULL
+        )""",
+        """CREATE TABLE IF NOT EXISTS users (
+            account TEXT PRIMARY KEY,
+            balance_cents INTEGER NOT NULL DEFAULT 0,
+            version INTEGER NOT NULL DEFAULT 0,
+            update_time REAL NOT NULL
+        )""",
+        """CREATE TABLE IF NOT EXISTS ledger_entries (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            account TEXT NOT NULL,
+            delta_cents INTEGER NOT NULL,
+            balance_cents INTEGER NOT NULL,
+            version INTEGER NOT NULL,
+            kind TEXT NOT NULL,
+            ref TEXT NOT NULL,
+            create_time REAL NOT NULL
+        )""",
+        "CREATE UNIQUE INDEX IF NOT EXISTS idx_ledger_ref ON ledger_entries(kind, ref)",
+        "CREATE INDEX IF NOT EXISTS idx_ledger_account ON ledger_entries(account, id)",
+        """CREATE TABLE IF NOT EXISTS rate_limits (
+            key TEXT PRIMARY KEY,
+            tokens REAL NOT NULL,
+            updated REAL NOT NULL
+        )""",
+        "CREATE INDEX IF NOT EXISTS idx_rate_limits_updated ON rate_limits(updated)",
+        """CREATE TABLE IF NOT EXISTS callback_nonces (
+            nonce TEXT PRIMARY KEY,
+            expire_at REAL NOT NULL
+        )""",
+        "CREATE INDEX IF NOT EXISTS idx_callback_nonces_expire ON callback_nonces(expire_at)",
+    )
+
+    # 批量查询时每条 SQL 的参数个数
+    BATCH_CHUNK = 500
+
+    def __init__(self, path: str, pool_size: int = 8, users: Optional[Dict[str, Dict]] = None,
+                 timeout: float = 30.0):
+        self.path = path
+        self.timeout = timeout
+        self._pool: "queue.LifoQueue[sqlite3.Connection]" = queue.LifoQueue(maxsize=pool_size)
+        self._local = threading.local()
+        self._update_sql: Dict[tuple, str] = {}
+        self._next_bucket_purge = 0.0
+        self._next_nonce_purge = 0.0
+
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        for _ in range(pool_size):
+            self._pool.put(self._connect())
+
+        with self.transaction() as conn:
+            self._migrate(conn)
+            for statement in self.SCHEMA:
+                conn.execute(statement)
+            for account, info in (users or {}).items():
+                conn.execute(
+                    "INSERT OR IGNORE INTO users (account, balance_cents, update_time) VALUES (?, ?, ?)",
+                    (account, info.get("balance_cents", 0), info.get("update_time", time.time()))
+                )
+
+    @staticmethod
+    def _migrate(conn: sqlite3.Connection) -> None:
+        """旧版 users 表(balance REAL) 迁移为整数分，旧版单列订单索引替换为复合索引"""
+        for name in ("idx_orders_account", "idx_orders_status"):
+            conn.execute(f"DROP INDEX IF EXISTS {name}")
+        row = conn.execute("SELECT sql FROM sqlite_master WHERE name = 'idx_orders_create_time'").fetchone()
+        if row is not None and "order_id" not in row["sql"]:
+            conn.execute("DROP INDEX idx_orders_create_time")
+        columns = {row["name"] for row in conn.execute("PRAGMA table_info(users)")}
+        if columns and "balance_cents" not in columns:
+            conn.execute("ALTER TABLE users ADD COLUMN balance_cents INTEGER NOT NULL DEFAULT 0")
+            conn.execute("ALTER TABLE users ADD COLUMN version INTEGER NOT NULL DEFAULT 0")
+            conn.execute("UPDATE users SET balance_cents = CAST(ROUND(balance * 100) AS INTEGER)")
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, timeout=self.timeout, isolation_level=None,
+                               check_same_thread=False, cached_statements=256)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute(f"PRAGMA busy_timeout={int(self.timeout * 1000)}")
+        return conn
+
+    @contextmanager
+    def _connection(self) -> Iterator[sqlite3.Connection]:
+        """取得连接：事务内复用当前线程的连接，否则从连接池借用"""
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            yield conn
+            return
+        conn = self._pool.get()
+        try:
+            yield conn
+        finally:
+            self._pool.put(conn)
+
+    @contextmanager
+    def transaction(self) -> Iterator[sqlite3.Connection]:
+        if getattr(self._local, "conn", None) is not None:
+            # 嵌套事务并入外层事务
+            yield self._local.conn
+            return
+        conn = self._pool.get()
+        self._local.conn = conn
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield conn
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            conn.execute("COMMIT")
+        finally:
+            self._local.conn = None
+            self._pool.put(conn)
+
+    def _build_update(self, table: str, key: str, allowed: tuple, fields: Dict) -> str:
+        names = tuple(sorted(fields))
+        cache_key = (table, names)
+        sql = self._update_sql.get(cache_key)
+        if sql is None:
+            unknown = set(names) - set(allowed)
+            if unknown:
+                raise ValueError(f"未知字段: {', '.join(sorted(unknown))}")
+            assignments = ", ".join(f"{name} = ?" for name in names)
+            sql = self._update_sql[cache_key] = f"UPDATE {table} SET {assignments} WHERE {key} = ?"
+        return sql
+
+    def get_order(self, order_id: str) -> Optional[Dict]:
+        with self._connection() as conn:
+            row = conn.execute(
+                "SELECT account, amount, status, create_time, pay_time, recharge_time "
+                "FROM orders WHERE order_id = ?", (order_id,)
+            ).fetchone()
+        return dict(row) if row is not None else None
+
+    def has_order(self, order_id: str) -> bool:
+        with self._connection() as conn:
+            return conn.execute("SELECT 1 FROM orders WHERE order_id = ?", (order_id,)).fetchone() is not None
+
+    def get_order_status(self, order_id: str) -> Optional[Tuple[str, float]]:
+        with self._connection() as conn:
+            row = conn.execute("SELECT status, amount FROM orders WHERE order_id = ?", (order_id,)).fetchone()
+        return tuple(row) if row is not None else None
+
+    def insert_order(self, order_id: str, order: Dict) -> None:
+        with self._connection() as conn:
+            conn.execute(
+                "INSERT INTO orders (order_id, account, amount, status, create_time, pay_time, recharge_time) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (order_id,) + tuple(order.get(name) for name in ORDER_FIELDS)
+            )
+
+    def insert_order_if_absent(self, order_id: str, order: Dict) -> bool:
+        with self._connection() as conn:
+            cursor = conn.execute(
+                "INSERT OR IGNORE INTO orders (order_id, account, amount, status, create_time, pay_time, "
+                "recharge_time) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (order_id,) + tuple(order.get(name) for name in ORDER_FIELDS)
+            )
+        return cursor.rowcount == 1
+
+    def get_orders(self, order_ids: Iterable[str]) -> Dict[str, Dict]:
+        order_ids = list(dict.fromkeys(order_ids))
+        orders = {}
+        with self._connection() as conn:
+            # 分块查询，避免超出 SQLite 参数个数上限
+            for start in range(0, len(order_ids), self.BATCH_CHUNK):
+                chunk = order_ids[start:start + self.BATCH_CHUNK]
+                rows = conn.execute(
+                    "SELECT order_id, account, amount, status, create_time, pay_time, recharge_time "
+                    f"FROM orders WHERE order_id IN ({', '.join('?' * len(chunk))})", chunk
+                ).fetchall()
+                for row in rows:
+                    order = dict(row)
+                    orders[order.pop("order_id")] = order
+        return orders
+
+    def insert_orders(self, orders: Dict[str, Dict]) -> None:
+        with self.transaction() as conn:
+            conn.executemany(
+                "INSERT INTO orders (order_id, account, amount, status, create_time, pay_time, recharge_time) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                [(order_id,) + tuple(order.get(name) for name in ORDER_FIELDS)
+                 for order_id, order in orders.items()]
+            )
+
+    def ensure_users(self, accounts: Iterable[str]) -> Dict[str, Dict]:
+        accounts = list(set(accounts))
+        now = time.time()
+        users = {}
+        with self.transaction() as conn:
+            conn.executemany(
+                "INSERT OR IGNORE INTO users (account, balance_cents, update_time) VALUES (?, 0, ?)",
+                [(account, now) for account in accounts]
+            )
+            for start in range(0, len(accounts), self.BATCH_CHUNK):
+                chunk = accounts[start:start + self.BATCH_CHUNK]
+                rows = conn.execute(
+                    "SELECT account, balance_cents, version, update_time FROM users "
+                    f"WHERE account IN ({', '.join('?' * len(chunk))})", chunk
+                ).fetchall()
+                for row in rows:
+                    user = dict(row)
+                    users[user.pop("account")] = user
+        return users
+
+    def update_order(self, order_id: str, **fields) -> bool:
+        if not fields:
+            return self.has_order(order_id)
+        sql = self._build_update("orders", "order_id", ORDER_FIELDS, fields)
+        with self._connection() as conn:
+            cursor = conn.execute(sql, tuple(fields[name] for name in sorted(fields)) + (order_id,))
+        return cursor.rowcount > 0
+
+    def archive_orders(self, order_ids: Iterable[str],
+                       statuses: Optional[Iterable[str]] = None) -> Dict[str, Dict]:
+        order_ids = list(dict.fromkeys(order_ids))
+        statuses = None if statuses is None else list(dict.fromkeys(statuses))
+        if statuses == []:
+            return {}
+        status_filter = "" if statuses is None else f" AND status IN ({', '.join('?' * len(statuses))})"
+        archived = {}
+        now = time.time()
+        # 在同一个写事务内按状态筛选、复制并删除，筛选后订单状态不会再被其他连接修改
+        with self.transaction() as conn:
+            for start in range(0, len(order_ids), self.BATCH_CHUNK):
+                chunk = order_ids[start:start + self.BATCH_CHUNK]
+                placeholders = ", ".join("?" * len(chunk))
+                rows = conn.execute(
+                    "SELECT order_id, account, amount, status, create_time, pay_time, recharge_time "
+                    f"FROM orders WHERE order_id IN ({placeholders}){status_filter}", chunk + (statuses or [])
+                ).fetchall()
+                if not rows:
+                    continue
+                conn.executemany(
+                    "INSERT OR REPLACE INTO orders_archive (order_id, account, amount, status, create_time, "
+                    "pay_time, recharge_time, archive_time) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    [tuple(row) + (now,) for row in rows]
+                )
+                conn.executemany("DELETE FROM orders WHERE order_id = ?", [(row["order_id"],) for row in rows])
+                for row in rows:
+                    order = dict(row)
+                    archived[order.pop("order_id")] = order
+        return archived
+
+    def get_archived_order(self, order_id: str) -> Optional[Dict]:
+        with self._connection() as conn:
+            row = conn.execute(
+                "SELECT account, amount, status, create_time, pay_time, recharge_time "
+                "FROM orders_archive WHERE order_id = ?", (order_id,)
+            ).fetchone()
+        return dict(row) if row is not None else None
+
+    def get_user(self, account: str) -> Optional[Dict]:
+        with self._connection() as conn:
+            row = conn.execute(
+                "SELECT balance_cents, version, update_time FROM users WHERE account = ?", (account,)
+            ).fetchone()
+        return dict(row) if row is not None else None
+
+    def get_balance(self, account: str) -> Optional[Tuple[int, int, float]]:
+        with self._connection() as conn:
+            row = conn.execute(
+                "SELECT balance_cents, version, update_time FROM users WHERE account = ?", (account,)
+            ).fetchone()
+        return tuple(row) if row is not None else None
+
+    def ensure_user(self, account: str) -> Dict:
+        with self._connection() as conn:
+            conn.execute(
+                "INSERT OR IGNORE INTO users (account, balance_cents, update_time) VALUES (?, 0, ?)",
+                (account, time.time())
+            )
+        return self.get_user(account)
+
+    def update_user(self, account: str, **fields) -> bool:
+        if not fields:
+            return self.get_user(account) is not None
+        sql = self._build_update("users", "account", USER_FIELDS, fields)
+        with self._connection() as conn:
+            cursor = conn.execute(sql, tuple(fields[name] for name in sorted(fields)) + (account,))
+        return cursor.rowcount > 0
+
+    def apply_balance_delta(self, account: str, delta_cents: int,
+                            kind: str, ref: str) -> Optional[Dict]:
+        now = time.time()
+        with self.transaction() as conn:
+            row = conn.execute(
+                "SELECT id, account, delta_cents, balance_cents, version, kind, ref, create_time "
+                "FROM ledger_entries WHERE kind = ? AND ref = ?", (kind, ref)
+            ).fetchone()
+            if row is not None:
+                return dict(row, duplicate=True)
+            if delta_cents > 0:
+                conn.execute(
+                    "INSERT OR IGNORE INTO users (account, balance_cents, update_time) VALUES (?, 0, ?)",
+                    (account, now)
+                )
+            # 条件更新：余额不足时不修改任何行
+            cursor = conn.execute(
+                "UPDATE users SET balance_cents = balance_cents + ?, version = version + 1, update_time = ? "
+                "WHERE account = ? AND balance_cents + ? >= 0",
+                (delta_cents, now, account, delta_cents)
+            )
+            if cursor.rowcount == 0:
+                return None
+            user = conn.execute(
+                "SELECT balance_cents, version FROM users WHERE account = ?", (account,)
+            ).fetchone()
+            cursor = conn.execute(
+                "INSERT INTO ledger_entries (account, delta_cents, balance_cents, version, kind, ref, create_time) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (account, delta_cents, user["balance_cents"], user["version"], kind, ref, now)
+            )
+        return {"id": cursor.lastrowid, "account": account, "delta_cents": delta_cents,
+                "balance_cents": user["balance_cents"], "version": user["version"],
+                "kind": kind, "ref": ref, "create_time": now, "duplicate": False}
+
+    def balance_version(self) -> int:
+        with self._connection() as conn:
+            return conn.execute("SELECT COALESCE(MAX(id), 0) FROM ledger_entries").fetchone()[0]
+
+    def balance_changes(self, since: int, limit: int = 1000) -> List[Tuple[int, str]]:
+        # 写事务串行提交，自增ID按提交顺序分配，已读过的序号之前不会再出现新条目
+        with self._connection() as conn:
+            rows = conn.execute(
+                "SELECT id, account FROM ledger_entries WHERE id > ? ORDER BY id LIMIT ?", (since, limit)
+            ).fetchall()
+        return [tuple(row) for row in rows]
+
+    def lease_tokens(self, key: str, rate: float, burst: float, tokens: int) -> Tuple[int, float]:
+        now = time.time()
+        with self.transaction() as conn:
+            if now >= self._next_bucket_purge:
+                conn.execute("DELETE FROM rate_limits WHERE updated <= ?", (now - BUCKET_IDLE_SECONDS,))
+                self._next_bucket_purge = now + 60
+            row = conn.execute("SELECT tokens, updated FROM rate_limits WHERE key = ?", (key,)).fetchone()
+            available = burst if row is None else min(burst, row["tokens"] + (now - row["updated"]) * rate)
+            granted = min(tokens, int(available))
+            conn.execute("INSERT OR REPLACE INTO rate_limits (key, tokens, updated) VALUES (?, ?, ?)",
+                         (key, available - granted, now))
+        return granted, 0.0 if granted else (1 - available) / rate
+
+    def claim_nonce(self, nonce: str, ttl: float) -> bool:
+        now = time.time()
+        with self.transaction() as conn:
+            if now >= self._next_nonce_purge:
+                conn.execute("DELETE FROM callback_nonces WHERE expire_at <= ?", (now,))
+                self._next_nonce_purge = now + 60
+            else:
+                conn.execute("DELETE FROM callback_nonces WHERE nonce = ? AND expire_at <= ?", (nonce, now))
+            cursor = conn.execute("INSERT OR IGNORE INTO callback_nonces (nonce, expire_at) VALUES (?, ?)",
+                                  (nonce, now + ttl))
+            return cursor.rowcount == 1
+
+    def release_nonce(self, nonce: str) -> None:
+        with self._connection() as conn:
+            conn.execute("DELETE FROM callback_nonces WHERE nonce = ?", (nonce,))
+
+    def list_ledger_entries(self, account: str, limit: int = 100) -> List[Dict]:
+        with self._connection() as conn:
+            rows = conn.execute(
+                "SELECT id, account, delta_cents, balance_cents, version, kind, ref, create_time "
+                "FROM ledger_entries WHERE account = ? ORDER BY id DESC LIMIT ?", (account, limit)
+            ).fetchall()
+        return [dict(row) for row in rows]
+
+    def query_orders(self, account: Optional[str] = None, status: Optional[str] = None,
+                     time_field: str = "create_time", start: Optional[float] = None,
+                     end: Optional[float] = None, after: Optional[Tuple[float, str]] = None,
+                     limit: int = 100, descending: bool = True) -> List[Dict]:
+        if time_field not in ORDER_TIME_FIELDS:
+            raise ValueError(f"不支持的时间字段: {time_field}")
+        conditions = [f"{time_field} IS NOT NULL"]
+        params: list = []
+        if account is not None:
+            conditions.append("account = ?")
+            params.append(account)
+        if status is not None:
+            conditions.append("status = ?")
+            params.append(status)
+        if start is not None:
+            conditions.append(f"{time_field} >= ?")
+            params.append(start)
+        if end is not None:
+            conditions.append(f"{time_field} < ?")
+            params.append(end)
+        if after is not None:
+            conditions.append(f"({time_field}, order_id) {'<' if descending else '>'} (?, ?)")
+            params.extend(after)
+        direction = "DESC" if descending else "ASC"
+        params.append(limit)
+        with self._connection() as conn:
+            rows = conn.execute(
+                "SELECT order_id, account, amount, status, create_time, pay_time, recharge_time "
+                f"FROM orders WHERE {' AND '.join(conditions)} "
+                f"ORDER BY {time_field} {direction}, order_id {direction} LIMIT ?", params
+            ).fetchall()
+        return [dict(row) for row in rows]
+
+    def close(self) -> None:
+        while True:
+            try:
+                self._pool.get_nowait().close()
+            except queue.Empty:
+                break
+
+
+class TimedStore:
+    """存储耗时统计代理
+
+    包装任意 BaseStore，对读写方法按 (backend, operation) 记录耗时直方图；
+    transaction() 及其它属性原样透传。
+    """
+
+    TIMED_OPERATIONS = frozenset({
+        "get_order", "has_order", "get_order_status", "insert_order", "insert_order_if_absent", "update_order",
+        "get_orders", "insert_orders",
+        "get_user", "get_balance", "ensure_user", "ensure_users", "update_user",
+        "apply_balance_delta", "balance_version", "balance_changes", "list_ledger_entries", "query_orders",
+        "archive_orders", "get_archived_order", "release_ledger_entries", "lease_tokens", "claim_nonce",
+        "release_nonce"
+    })
+
+    def __init__(self, inner: BaseStore, histogram, backend: Optional[str] = None):
+        """
+        :param histogram: 带 (backend, operation) 标签的耗时直方图
+        :param backend: 标签中的后端名，缺省取类名
+        """
+        self.inner = inner
+        self.histogram = histogram
+        self.backend = backend or type(inner).__name__
+
+    def __getattr__(self, name: str):
+        attr = getattr(self.inner, name)
+        if name not in self.TIMED_OPERATIONS:
+            return attr
+        observe = self.histogram.observe
+        labels = (self.backend, name)
+
+        def timed(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return attr(*args, **kwargs)
+            finally:
+                observe(labels, time.perf_counter() - started)
+
+        # 缓存包装后的方法，之后的访问不再经过 __getattr__
+        self.__dict__[name] = timed
+        return timed
+
+
+def create_store(backend: str = "memory", path: Optional[str] = None,
+                 users: Optional[Dict[str, Dict]] = None, pool_size: int = 8,
+                 archive_size: int = 100000, snapshot_every: int = 100000, fsync: bool = True) -> BaseStore:
+    """按配置创建存储后端
+
+    :param backend: memory / journal / sqlite
+    :param path: SQLite 数据库文件路径，journal 后端为日志目录
+    :param users: 初始用户数据(已存在的用户不会被覆盖)
+    :param archive_size: 内存存储保留的归档订单数(SQLite 归档表不限容量)
+    :param snapshot_every: journal 后端两次快照之间的日志条数
+    :param fsync: journal 后端组提交时是否 fsync
+    """
+    if backend == "memory":
+        return MemoryStore(users=users, archive_size=archive_size)
+    if backend == "journal":
+        return JournaledMemoryStore(path or "data/journal", users=users, archive_size=archive_size,
+                                    snapshot_every=snapshot_every, fsync=fsync)
+    if backend == "sqlite":
+        return SQLiteStore(path or "data/payment.db", pool_size=pool_size, users=users)
+    raise ValueError(f"不支持的存储后端: {backend}")
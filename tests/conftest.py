@@ -0,0 +1,74 @@
+"""测试公共夹具：每个用例使用独立数据目录创建应用，不启动后台对账与归档线程"""
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import create_app, get_context  # noqa: E402
+
+ADMIN_TOKEN = "test-admin-token"
+ACCOUNT = "13812345678"  # 演示用户，初始余额 100.00
+
+
+def app_config(tmp_path, **overrides):
+    """测试用配置：数据文件写入 tmp_path，关闭对账与订单过期/归档"""
+    config = {
+        "MOCK_MODE": True,
+        "STORE_BACKEND": "memory",
+        "STORE_PATH": str(tmp_path / "payment.db"),
+        "CALLBACK_MODE": "sync",
+        "ORDER_TTL": 0,
+        "ORDER_RETENTION": -1,
+        "RECONCILE_ENABLED": False,
+        "RATE_LIMIT_ENABLED": False,
+        "ADMIN_TOKEN": ADMIN_TOKEN,
+        "CALLBACK_QUEUE_PATH": str(tmp_path / "callback_queue.db"),
+        "REFUND_JOBS_PATH": str(tmp_path / "refund_jobs.db"),
+        "IDEMPOTENCY_PATH": str(tmp_path / "idempotency.db"),
+        "LEADER_LOCK_PATH": str(tmp_path / "leader.lock"),
+    }
+    config.update(overrides)
+    return config
+
+
+@pytest.fixture
+def app(tmp_path):
+    flask_app = create_app(app_config(tmp_path))
+    yield flask_app
+    get_context(flask_app).close()
+
+
+@pytest.fixture
+def ctx(app):
+    return get_context(app)
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+@pytest.fixture
+def admin_headers():
+    return {"X-Admin-Token": ADMIN_TOKEN}
+
+
+@pytest.fixture
+def place_order(client):
+    """下单并返回订单ID"""
+    def place(amount, account=ACCOUNT):
+        response = client.post("/api/place_order", json={"account": account, "amount": amount})
+        assert response.status_code == 200, response.get_json()
+        return response.get_json()["order_id"]
+    return place
+
+
+@pytest.fixture
+def paid_order(client, place_order):
+    """已支付(已扣款)的订单ID"""
+    order_id = place_order(10)
+    response = client.post("/api/pay", json={"order_id": order_id})
+    assert response.get_json()["msg"] == "Payment succeeded"
+    return order_id
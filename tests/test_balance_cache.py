@@ -0,0 +1,129 @@
+import pytest
+
+from app import create_app, get_context
+from balance_cache import BalanceCache
+from conftest import ACCOUNT, app_config
+from ledger import Ledger
+from store import create_store
+
+
+@pytest.fixture
+def path(tmp_path):
+    return str(tmp_path / "payment.db")
+
+
+@pytest.fixture
+def store(path):
+    store = create_store("sqlite", path=path, users={"alice": {"balance_cents": 1000}})
+    yield store
+    store.close()
+
+
+def cached_ledger(store, **kwargs):
+    cache = BalanceCache(store, **kwargs)
+    return cache, Ledger(store, on_change=cache.invalidate)
+
+
+def test_repeated_reads_hit_cache(store):
+    cache, _ = cached_ledger(store)
+    assert cache.get("alice")[0] == 1000
+    assert cache.get("alice")[0] == 1000
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_local_change_invalidates_immediately(store):
+    cache, ledger = cached_ledger(store, check_interval=3600)
+    cache.get("alice")
+    ledger.debit("alice", 300, "payment", "order-1")
+    assert cache.get("alice")[0] == 700
+
+
+def test_duplicate_entry_does_not_invalidate(store):
+    cache, ledger = cached_ledger(store, check_interval=3600)
+    ledger.debit("alice", 300, "payment", "order-1")
+    cache.get("alice")
+    invalidations = cache.invalidations
+    ledger.debit("alice", 300, "payment", "order-1")
+    assert cache.invalidations == invalidations
+
+
+def test_other_process_change_is_seen_after_sync(store, path):
+    cache, _ = cached_ledger(store, check_interval=0)
+    other = create_store("sqlite", path=path)  # 另一个 worker 的存储连接
+    try:
+        assert cache.get("alice")[0] == 1000
+        Ledger(other).credit("alice", 500, "recharge", "order-1")
+        assert cache.get("alice")[0] == 1500
+    finally:
+        other.close()
+
+
+def test_other_process_change_is_stale_within_check_interval(store, path):
+    cache, _ = cached_ledger(store, check_interval=3600)
+    other = create_store("sqlite", path=path)
+    try:
+        cache.get("alice")
+        Ledger(other).credit("alice", 500, "recharge", "order-1")
+        assert cache.get("alice")[0] == 1000
+    finally:
+        other.close()
+
+
+def test_sync_overflow_clears_cache(store, path):
+    cache, _ = cached_ledger(store, check_interval=0, sync_limit=2)
+    cache.get("alice")
+    ledger = Ledger(store)
+    for number in range(3):
+        ledger.credit(f"user-{number}", 100, "recharge", f"order-{number}")
+    cache.get("user-0")
+    assert cache.metrics()["size"] == 1
+
+
+def test_missing_account_is_not_cached(store):
+    cache, ledger = cached_ledger(store)
+    assert cache.get("bob") is None
+    ledger.credit("bob", 100, "recharge", "order-1")
+    assert cache.get("bob")[0] == 100
+
+
+def test_miss_racing_with_change_is_not_cached(store):
+    """未命中读取存储期间余额发生变动时，读到的旧值不回填缓存"""
+    cache, ledger = cached_ledger(store, check_interval=3600)
+    get_balance = store.get_balance
+
+    def racing_get_balance(account):
+        balance = get_balance(account)
+        ledger.debit(account, 300, "payment", "order-1")
+        return balance
+
+    store.get_balance = racing_get_balance
+    assert cache.get("alice")[0] == 1000
+    store.get_balance = get_balance
+    assert cache.get("alice")[0] == 700
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def balance_client(request, tmp_path):
+    flask_app = create_app(app_config(tmp_path, STORE_BACKEND=request.param, BALANCE_CACHE_CHECK_INTERVAL=0))
+    yield flask_app.test_client()
+    get_context(flask_app).close()
+
+
+def test_check_balance_etag(balance_client):
+    first = balance_client.get("/api/check_balance", query_string={"account": ACCOUNT})
+    assert first.get_json()["balance"] == 100.0
+    assert first.headers["Cache-Control"] == "no-cache"
+    etag = first.headers["ETag"]
+
+    unchanged = balance_client.get("/api/check_balance", query_string={"account": ACCOUNT},
+                                   headers={"If-None-Match": etag})
+    assert unchanged.status_code == 304
+    assert unchanged.data == b""
+
+    order_id = balance_client.post("/api/place_order", json={"account": ACCOUNT, "amount": 10}).get_json()["order_id"]
+    balance_client.post("/api/pay", json={"order_id": order_id})
+    changed = balance_client.get("/api/check_balance", query_string={"account": ACCOUNT},
+                                 headers={"If-None-Match": etag})
+    assert changed.status_code == 200
+    assert changed.get_json()["balance"] == 90.0
+    assert changed.headers["ETag"] != etag
@@ -0,0 +1,137 @@
+import asyncio
+import json
+
+import httpx
+import pytest
+import requests
+
+from admin.async_gateway import AsyncGatewayClient
+from admin.http_client import CircuitBreaker, CircuitOpenError, GatewayClient, GatewayError
+
+
+class FakeResponse:
+    def __init__(self, status_code=200, body='{"status": "paid"}'):
+        self.status_code = status_code
+        self.body = body
+
+    def json(self):
+        return json.loads(self.body)
+
+
+def sync_client(responses, **kwargs):
+    """按顺序返回 responses 中的响应(异常则抛出)的同步客户端"""
+    client = GatewayClient("http://gateway", "secret", backoff_base=0, **kwargs)
+    calls = []
+
+    def request(method, url, **_):
+        calls.append(url)
+        outcome = responses[min(len(calls), len(responses)) - 1]
+        if isinstance(outcome, BaseException):
+            raise outcome
+        return outcome
+
+    client.session.request = request
+    return client, calls
+
+
+def async_client(responses, **kwargs):
+    client = AsyncGatewayClient("http://gateway", "secret", backoff_base=0, **kwargs)
+    calls = []
+
+    def handler(request):
+        calls.append(str(request.url))
+        outcome = responses[min(len(calls), len(responses)) - 1]
+        if isinstance(outcome, BaseException):
+            raise outcome
+        return httpx.Response(outcome.status_code, content=outcome.body.encode())
+
+    client.client = httpx.AsyncClient(base_url="http://gateway", transport=httpx.MockTransport(handler))
+    return client, calls
+
+
+def call_sync(responses, idempotent=True, **kwargs):
+    client, calls = sync_client(responses, **kwargs)
+    try:
+        return client.request("GET", "/api/payments/order-1", idempotent=idempotent), calls
+    finally:
+        client.close()
+
+
+def call_async(responses, idempotent=True, **kwargs):
+    async def run():
+        client, calls = async_client(responses, **kwargs)
+        try:
+            return await client.request("GET", "/api/payments/order-1", idempotent=idempotent), calls
+        finally:
+            await client.aclose()
+    return asyncio.run(run())
+
+
+SYNC_ERRORS = {"transport": requests.exceptions.ChunkedEncodingError("connection broken"),
+               "redirects": requests.exceptions.TooManyRedirects("too many redirects")}
+ASYNC_ERRORS = {"transport": httpx.ReadError("connection broken"),
+                "redirects": httpx.TooManyRedirects("too many redirects")}
+
+
+@pytest.fixture(params=["sync", "async"])
+def call(request):
+    """(调用函数, 该客户端的传输层异常)"""
+    if request.param == "sync":
+        return call_sync, SYNC_ERRORS
+    return call_async, ASYNC_ERRORS
+
+
+@pytest.mark.parametrize("error", ["transport", "redirects"])
+def test_request_errors_are_retried(call, error):
+    send, errors = call
+    body, calls = send([errors[error], FakeResponse(503), FakeResponse()])
+    assert body == {"status": "paid"}
+    assert len(calls) == 3
+
+
+def test_request_errors_are_wrapped_after_last_attempt(call):
+    send, errors = call
+    with pytest.raises(GatewayError, match="连接失败"):
+        send([errors["transport"]], max_retries=1)
+
+
+def test_non_idempotent_request_is_not_retried(call):
+    send, _ = call
+    with pytest.raises(GatewayError) as excinfo:
+        send([FakeResponse(502), FakeResponse()], idempotent=False)
+    assert excinfo.value.status_code == 502
+
+
+def test_client_error_is_not_retried(call):
+    send, _ = call
+    with pytest.raises(GatewayError) as excinfo:
+        send([FakeResponse(404), FakeResponse()])
+    assert excinfo.value.status_code == 404
+
+
+def test_invalid_json_is_gateway_error(call):
+    send, _ = call
+    with pytest.raises(GatewayError, match="无法解析") as excinfo:
+        send([FakeResponse(200, "<html>bad gateway</html>")])
+    assert excinfo.value.status_code == 200
+
+
+def test_half_open_probe_is_released_on_unexpected_error(call):
+    send, _ = call
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0)
+    breaker.record_failure()
+    with pytest.raises(RuntimeError):
+        send([RuntimeError("boom")], breaker=breaker)
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    # 探测名额已归还，下一个请求可以作为探测请求放行
+    body, _ = send([FakeResponse()], breaker=breaker)
+    assert body == {"status": "paid"}
+    assert breaker.state == CircuitBreaker.CLOSED
+
+
+def test_open_circuit_rejects_without_request(call):
+    send, _ = call
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=60)
+    breaker.record_failure()
+    with pytest.raises(CircuitOpenError):
+        send([FakeResponse()], breaker=breaker)
@@ -0,0 +1,65 @@
+import pytest
+
+from conftest import ACCOUNT
+
+
+def test_place_order_idempotency_key_replays_response(client, ctx):
+    headers = {"Idempotency-Key": "order-key-1"}
+    body = {"account": ACCOUNT, "amount": 10}
+    first = client.post("/api/place_order", json=body, headers=headers)
+    second = client.post("/api/place_order", json=body, headers=headers)
+    assert first.status_code == second.status_code == 200
+    assert second.get_json() == first.get_json()
+    assert second.headers["Idempotent-Replayed"] == "true"
+    assert "Idempotent-Replayed" not in first.headers
+    assert len(ctx.store.query_orders(account=ACCOUNT)) == 1
+
+
+def test_requests_without_key_are_not_deduplicated(client, ctx):
+    body = {"account": ACCOUNT, "amount": 10}
+    client.post("/api/place_order", json=body)
+    client.post("/api/place_order", json=body)
+    assert len(ctx.store.query_orders(account=ACCOUNT)) == 2
+
+
+def test_idempotency_key_reused_with_different_body_conflicts(client):
+    headers = {"Idempotency-Key": "order-key-2"}
+    client.post("/api/place_order", json={"account": ACCOUNT, "amount": 10}, headers=headers)
+    response = client.post("/api/place_order", json={"account": ACCOUNT, "amount": 20}, headers=headers)
+    assert response.status_code == 422
+
+
+def test_error_responses_are_replayed(client, ctx):
+    headers = {"Idempotency-Key": "order-key-3"}
+    body = {"account": ACCOUNT, "amount": 1000}
+    first = client.post("/api/place_order", json=body, headers=headers)
+    ctx.ledger.credit(ACCOUNT, 100000, "recharge", "top-up")
+    second = client.post("/api/place_order", json=body, headers=headers)
+    assert first.status_code == second.status_code == 400
+    assert second.headers["Idempotent-Replayed"] == "true"
+
+
+def test_overlong_key_is_rejected(client):
+    response = client.post("/api/place_order", json={"account": ACCOUNT, "amount": 10},
+                           headers={"Idempotency-Key": "k" * 256})
+    assert response.status_code == 400
+
+
+def test_pay_idempotency_key_debits_once(client, ctx, place_order):
+    order_id = place_order(10)
+    headers = {"Idempotency-Key": "pay-key-1"}
+    first = client.post("/api/pay", json={"order_id": order_id}, headers=headers)
+    second = client.post("/api/pay", json={"order_id": order_id}, headers=headers)
+    assert second.get_json() == first.get_json()
+    assert second.headers["Idempotent-Replayed"] == "true"
+    assert ctx.ledger.balance_cents(ACCOUNT) == 9000
+
+
+@pytest.mark.parametrize("path", ["/api/place_order", "/api/pay", "/api/generate_qr_payment", "/api/prerender_qr",
+                                  "/api/refund"])
+@pytest.mark.parametrize("body", [{"json": [{"order_id": "order-1"}]}, {"json": "order-1"},
+                                  {"data": "{", "content_type": "application/json"}, {}])
+def test_non_object_body_is_rejected(client, admin_headers, path, body):
+    response = client.post(path, headers=dict(admin_headers, **{"Idempotency-Key": "key-1"}), **body)
+    assert response.status_code == 400
+    assert response.get_json()["msg"] == "请求体无效"
@@ -0,0 +1,150 @@
+import glob
+import os
+
+import pytest
+
+from app import create_app, get_context
+from conftest import ACCOUNT, app_config
+from ledger import Ledger
+from store import JournaledMemoryStore
+
+
+def crash(store):
+    """模拟崩溃：停止后台线程并释放日志，不生成最终快照(同 benchmarks/journal.py)"""
+    store._stop.set()
+    store._snapshotter.join()
+    store.journal.close()
+
+
+def order(account, amount, create_time):
+    return {"account": account, "amount": amount, "status": "pending", "create_time": create_time,
+            "pay_time": None, "recharge_time": None}
+
+
+@pytest.fixture
+def directory(tmp_path):
+    return str(tmp_path / "journal")
+
+
+def open_store(directory, **kwargs):
+    return JournaledMemoryStore(directory, users={"alice": {"balance_cents": 1000}}, fsync=False, **kwargs)
+
+
+def test_state_is_recovered_after_crash(directory):
+    store = open_store(directory)
+    ledger = Ledger(store)
+    store.insert_order("order-1", order("alice", 3.0, 100.0))
+    store.insert_order("order-2", order("alice", 5.0, 101.0))
+    store.update_order("order-1", status="paid", pay_time=102.0)
+    ledger.debit("alice", 300, "payment", "order-1")
+    store.archive_orders(["order-2"])
+    crash(store)
+
+    recovered = open_store(directory)
+    try:
+        assert recovered.recovery["replayed"] > 0
+        assert recovered.get_user("alice")["balance_cents"] == 700
+        assert recovered.get_order("order-1")["status"] == "paid"
+        assert recovered.get_order("order-2") is None
+        assert [o["order_id"] for o in recovered.query_orders(status="paid", time_field="pay_time")] == ["order-1"]
+        # 恢复后账本去重仍然生效
+        assert Ledger(recovered).debit("alice", 300, "payment", "order-1")["duplicate"]
+        assert recovered.get_user("alice")["balance_cents"] == 700
+    finally:
+        recovered.close()
+
+
+def test_recovery_from_snapshot_and_tail(directory):
+    store = open_store(directory)
+    ledger = Ledger(store)
+    for number in range(10):
+        ledger.credit("alice", 10, "recharge", f"order-{number}")
+    store.snapshot()
+    for number in range(10, 15):
+        ledger.credit("alice", 10, "recharge", f"order-{number}")
+    crash(store)
+
+    recovered = open_store(directory)
+    try:
+        assert recovered.recovery["snapshot_seq"] > 0
+        assert recovered.recovery["replayed"] == 5
+        assert recovered.get_user("alice")["balance_cents"] == 1150
+        assert len(recovered.list_ledger_entries("alice", limit=100)) == 15
+    finally:
+        recovered.close()
+
+
+def test_clean_close_recovers_without_replay(directory):
+    store = open_store(directory)
+    Ledger(store).credit("alice", 10, "recharge", "order-1")
+    store.close()
+
+    recovered = open_store(directory)
+    try:
+        assert recovered.recovery["replayed"] == 0
+        assert recovered.get_user("alice")["balance_cents"] == 1010
+    finally:
+        recovered.close()
+
+
+def test_torn_tail_record_is_ignored(directory):
+    store = open_store(directory)
+    ledger = Ledger(store)
+    ledger.credit("alice", 10, "recharge", "order-1")
+    ledger.credit("alice", 20, "recharge", "order-2")
+    crash(store)
+    # 崩溃时最后一条记录只写了一半
+    segment = max(glob.glob(os.path.join(directory, "journal-*.ndjson")))
+    with open(segment, "rb+") as f:
+        data = f.read()
+        f.seek(0)
+        f.truncate()
+        f.write(data[:-10])
+
+    recovered = open_store(directory)
+    try:
+        assert recovered.get_user("alice")["balance_cents"] == 1010
+        # 恢复后继续写入，下次恢复时序号连续
+        Ledger(recovered).credit("alice", 5, "recharge", "order-3")
+        crash(recovered)
+        recovered = open_store(directory)
+        assert recovered.get_user("alice")["balance_cents"] == 1015
+    finally:
+        recovered.close()
+
+
+def test_app_state_survives_restart(tmp_path):
+    config = app_config(tmp_path, STORE_BACKEND="journal", JOURNAL_DIR=str(tmp_path / "journal"),
+                        JOURNAL_FSYNC=False)
+    flask_app = create_app(config)
+    client = flask_app.test_client()
+    order_id = client.post("/api/place_order", json={"account": ACCOUNT, "amount": 10}).get_json()["order_id"]
+    client.post("/api/pay", json={"order_id": order_id})
+    get_context(flask_app).close()
+
+    flask_app = create_app(config)
+    try:
+        client = flask_app.test_client()
+        response = client.get("/api/check_order_status", query_string={"order_id": order_id})
+        assert response.get_json()["status"] == "paid"
+        assert client.get("/api/check_balance", query_string={"account": ACCOUNT}).get_json()["balance"] == 90.0
+    finally:
+        get_context(flask_app).close()
+
+
+@pytest.mark.parametrize("clean_close", [False, True])
+def test_released_ledger_entries_stay_released(directory, clean_close):
+    store = open_store(directory)
+    ledger = Ledger(store)
+    for number in range(3):
+        ledger.debit("alice", 100, "payment", f"order-{number}")
+    assert store.release_ledger_entries([("payment", "order-0")]) == 1
+    store.close() if clean_close else crash(store)
+
+    recovered = open_store(directory)
+    try:
+        assert [entry["ref"] for entry in recovered.list_ledger_entries("alice")] == ["order-2", "order-1"]
+        assert recovered.get_user("alice")["balance_cents"] == 700
+        assert recovered.balance_version() == 3
+    finally:
+        recovered.close()
@@ -0,0 +1,77 @@
+import pytest
+
+from ledger import InsufficientBalance, Ledger, from_cents, is_whole_cents, to_cents
+from store import create_store
+
+
+@pytest.mark.parametrize("amount, cents", [
+    (10, 1000),
+    ("10.5", 1050),
+    (0.1 + 0.2, 30),     # 浮点误差不影响换算结果
+    (1.005, 101),        # 按十进制四舍五入，而不是二进制近似值 1.00499...
+    ("0.005", 1),
+    (19.99, 1999),
+])
+def test_to_cents_rounds_half_up(amount, cents):
+    assert to_cents(amount) == cents
+
+
+def test_from_cents():
+    assert from_cents(1999) == 19.99
+
+
+@pytest.mark.parametrize("amount, expected", [
+    (10, True), (10.1, True), (19.99, True), ("0.01", True),
+    (10.123, False), ("10.005", False), (0.001, False),
+])
+def test_is_whole_cents(amount, expected):
+    assert is_whole_cents(amount) is expected
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def ledger(request, tmp_path):
+    store = create_store(request.param, path=str(tmp_path / "ledger.db"), users={"alice": {"balance_cents": 1000}})
+    yield Ledger(store)
+    store.close()
+
+
+def test_credit_and_debit_update_balance(ledger):
+    ledger.credit("alice", 250, "recharge", "order-1")
+    ledger.debit("alice", 1000, "payment", "order-2")
+    assert ledger.balance_cents("alice") == 250
+    assert [entry["ref"] for entry in ledger.entries("alice")] == ["order-2", "order-1"]
+
+
+def test_same_reference_is_recorded_once(ledger):
+    first = ledger.debit("alice", 300, "payment", "order-1")
+    second = ledger.debit("alice", 300, "payment", "order-1")
+    assert not first["duplicate"]
+    assert second["duplicate"]
+    assert ledger.balance_cents("alice") == 700
+    assert len(ledger.entries("alice")) == 1
+
+
+def test_same_reference_different_kind_is_recorded(ledger):
+    ledger.debit("alice", 300, "payment", "order-1")
+    ledger.credit("alice", 300, "refund", "order-1")
+    assert ledger.balance_cents("alice") == 1000
+
+
+def test_debit_over_balance_is_rejected(ledger):
+    with pytest.raises(InsufficientBalance):
+        ledger.debit("alice", 1001, "payment", "order-1")
+    assert ledger.balance_cents("alice") == 1000
+    assert ledger.entries("alice") == []
+
+
+def test_credit_creates_account(ledger):
+    ledger.credit("bob", 100, "recharge", "order-1")
+    assert ledger.balance_cents("bob") == 100
+
+
+@pytest.mark.parametrize("cents", [0, -1])
+def test_non_positive_amounts_are_rejected(ledger, cents):
+    with pytest.raises(ValueError):
+        ledger.credit("alice", cents, "recharge", "order-1")
+    with pytest.raises(ValueError):
+        ledger.debit("alice", cents, "payment", "order-1")
@@ -0,0 +1,80 @@
+import time
+
+import pytest
+
+from admin.signing import sign_callback
+from app import FINAL_ORDER_STATUSES
+from conftest import ACCOUNT
+from order_reaper import OrderReaper
+
+
+@pytest.fixture
+def reaper(ctx):
+    """立即归档终态订单的归档器(不启动后台线程，由用例调用 sweep)"""
+    return OrderReaper(ctx.store, expire=ctx.orders.expire_order, archived=ctx.orders.orders_archived,
+                       order_ttl=1, retention=0, final_statuses=FINAL_ORDER_STATUSES)
+
+
+def sweep(reaper):
+    return reaper.sweep(now=time.time() + 10)
+
+
+def test_paid_order_is_archived(client, ctx, reaper, paid_order):
+    assert sweep(reaper) == 1
+    assert ctx.store.get_order(paid_order) is None
+    assert ctx.store.get_archived_order(paid_order)["status"] == "paid"
+    assert ctx.store.query_orders(account=ACCOUNT) == []
+
+    # 已归档订单仍可查询状态，迟到的重复回调直接应答
+    response = client.get("/api/check_order_status", query_string={"order_id": paid_order})
+    assert response.get_json()["status"] == "paid"
+    response = client.get("/api/wait_order_status", query_string={"order_id": paid_order, "timeout": 5})
+    assert response.get_json()["status"] == "paid"
+    params = sign_callback({"order_id": paid_order, "status": "paid"}, ctx.config["API_SECRET"])
+    response = client.post("/api/payment_callback", json=params)
+    assert response.get_json()["msg"] == "Already processed"
+    assert ctx.ledger.balance_cents(ACCOUNT) == 9000
+
+
+def test_pending_order_is_expired_then_archived(ctx, reaper, place_order):
+    order_id = place_order(10)
+    # 同一次补扫先过期待支付订单，再归档已过期订单
+    assert sweep(reaper) == 2
+    assert ctx.store.get_order(order_id) is None
+    assert ctx.store.get_archived_order(order_id)["status"] == "expired"
+
+
+def test_refunding_order_is_not_archived(ctx, reaper, paid_order):
+    assert ctx.orders.transition(paid_order, ("paid",), "refunding")
+    assert sweep(reaper) == 0
+    assert reaper._archive([paid_order]) == 0
+    assert ctx.store.get_order(paid_order)["status"] == "refunding"
+
+
+def test_refund_restores_archived_order(client, ctx, reaper, paid_order, admin_headers):
+    sweep(reaper)
+    response = client.post("/api/refund", json={"order_id": paid_order}, headers=admin_headers)
+    assert response.status_code == 200
+    assert ctx.store.get_order(paid_order)["status"] == "refunded"
+    assert ctx.ledger.balance_cents(ACCOUNT) == 10000
+
+
+def test_archive_releases_ledger_entries(ctx, reaper, paid_order):
+    assert [entry["ref"] for entry in ctx.store.list_ledger_entries(ACCOUNT)] == [paid_order]
+    sweep(reaper)
+    assert ctx.store.list_ledger_entries(ACCOUNT) == []
+    assert ctx.ledger.balance_cents(ACCOUNT) == 9000
+
+
+def test_concurrent_restore_of_archived_order_is_a_conflict(client, ctx, reaper, paid_order, admin_headers,
+                                                             monkeypatch):
+    sweep(reaper)
+    # 并发的退款请求已恢复该订单：本请求读取活跃订单时订单尚不存在，恢复时发现已存在
+    assert ctx.orders.restore(paid_order, ctx.store.get_archived_order(paid_order), "refunding")
+    monkeypatch.setattr(ctx.store, "get_order", lambda order_id: None)
+    response = client.post("/api/refund", json={"order_id": paid_order}, headers=admin_headers)
+    assert response.status_code == 409
+    assert response.get_json()["msg"] == "退款处理中，请稍后重试"
+    monkeypatch.undo()
+    assert ctx.store.get_order(paid_order)["status"] == "refunding"
+    assert ctx.ledger.balance_cents(ACCOUNT) == 9000
@@ -0,0 +1,47 @@
+import pytest
+
+from app import create_app, get_context
+from conftest import ACCOUNT, app_config
+
+
+@pytest.mark.parametrize("amount, msg", [
+    (0.001, "金额无效"),
+    (0, "缺少账号或金额参数"),
+    (-5, "金额无效"),
+    (1e300, "金额超过单笔上限 1000000.00"),
+    (10.123, "金额最多保留两位小数"),
+    ("10.005", "金额最多保留两位小数"),
+    ("abc", "金额格式无效"),
+    (True, "金额格式无效"),
+])
+def test_place_order_rejects_invalid_amounts(client, amount, msg):
+    response = client.post("/api/place_order", json={"account": ACCOUNT, "amount": amount})
+    assert response.status_code == 400
+    assert response.get_json()["msg"] == msg
+
+
+def test_place_order_rejects_amount_over_balance(client):
+    response = client.post("/api/place_order", json={"account": ACCOUNT, "amount": 100.01})
+    assert response.status_code == 400
+    assert response.get_json()["msg"] == "余额不足"
+
+
+def test_batch_place_orders_validates_each_item(client):
+    response = client.post("/api/place_orders", json={"orders": [
+        {"account": ACCOUNT, "amount": "10.50"},
+        {"account": ACCOUNT, "amount": 10.123},
+    ]})
+    results = response.get_json()["results"]
+    assert results[0]["code"] == 200
+    assert results[1] == {"index": 1, "code": 400, "msg": "金额最多保留两位小数"}
+
+
+def test_max_order_amount_is_configurable(tmp_path):
+    flask_app = create_app(app_config(tmp_path, MAX_ORDER_AMOUNT=50))
+    try:
+        client = flask_app.test_client()
+        assert client.post("/api/place_order", json={"account": ACCOUNT, "amount": 50}).status_code == 200
+        response = client.post("/api/place_order", json={"account": ACCOUNT, "amount": "50.01"})
+        assert response.get_json()["msg"] == "金额超过单笔上限 50.00"
+    finally:
+        get_context(flask_app).close()
@@ -0,0 +1,44 @@
+from conftest import ACCOUNT
+
+
+def test_pay_debits_balance_in_cents(client, ctx, place_order):
+    order_id = place_order("19.99")
+    response = client.post("/api/pay", json={"order_id": order_id})
+    assert response.status_code == 200
+    assert ctx.ledger.balance_cents(ACCOUNT) == 10000 - 1999
+    order = ctx.store.get_order(order_id)
+    assert order["status"] == "paid"
+    assert order["pay_time"] is not None
+
+
+def test_pay_twice_is_rejected_before_gateway(client, ctx, paid_order, monkeypatch):
+    def fail(*args, **kwargs):
+        raise AssertionError("不应调用支付网关")
+    monkeypatch.setattr(ctx.payment_gateway, "process_payment", fail)
+    response = client.post("/api/pay", json={"order_id": paid_order})
+    assert response.status_code == 400
+    assert response.get_json()["msg"] == "订单状态不允许支付"
+    assert ctx.ledger.balance_cents(ACCOUNT) == 9000
+
+
+def test_pay_expired_order_is_rejected(client, ctx, place_order):
+    order_id = place_order(10)
+    assert ctx.orders.expire_order(order_id)
+    response = client.post("/api/pay", json={"order_id": order_id})
+    assert response.status_code == 400
+    assert response.get_json()["msg"] == "订单已过期"
+
+
+def test_pay_unknown_order(client):
+    response = client.post("/api/pay", json={"order_id": "missing"})
+    assert response.status_code == 404
+
+
+def test_pay_without_balance_fails_order(client, ctx, place_order):
+    order_id = place_order(60)
+    ctx.ledger.debit(ACCOUNT, 5000, "payment", "spent")
+    response = client.post("/api/pay", json={"order_id": order_id})
+    assert response.status_code == 400
+    assert ctx.store.get_order(order_id)["status"] == "failed"
+    assert client.post("/api/pay", json={"order_id": order_id}).get_json()["msg"] == "订单状态不允许支付"
+    assert ctx.ledger.balance_cents(ACCOUNT) == 5000
@@ -0,0 +1,39 @@
+from urllib.parse import parse_qs, urlsplit
+
+import pytest
+
+
+def qr_page(client, order_id):
+    return client.get("/qr_payment", query_string={"order_id": order_id})
+
+
+def test_pending_order_renders_qr_code(client, ctx, place_order):
+    order_id = place_order(10)
+    response = qr_page(client, order_id)
+    assert response.status_code == 200
+    assert order_id in response.get_data(as_text=True)
+    assert len(ctx.payment_gateway.qr_cache) == 1
+
+
+def test_paid_order_redirects_to_result_page(client, ctx, paid_order):
+    response = qr_page(client, paid_order)
+    assert response.status_code == 302
+    location = urlsplit(response.headers["Location"])
+    assert location.path == "/payment_callback_page"
+    assert parse_qs(location.query) == {"order_id": [paid_order], "amount": ["10.0"], "status": ["success"]}
+    assert len(ctx.payment_gateway.qr_cache) == 0
+
+
+@pytest.mark.parametrize("status, msg", [("expired", "订单已过期，请重新下单"), ("failed", "支付失败，请重新下单")])
+def test_closed_order_does_not_render_qr_code(client, ctx, place_order, status, msg):
+    order_id = place_order(10)
+    assert ctx.orders.transition(order_id, ("pending",), status)
+    response = qr_page(client, order_id)
+    assert response.status_code == 302
+    query = parse_qs(urlsplit(response.headers["Location"]).query)
+    assert (query["status"], query["msg"]) == (["fail"], [msg])
+    assert len(ctx.payment_gateway.qr_cache) == 0
+
+
+def test_unknown_order_is_not_found(client):
+    assert qr_page(client, "order-missing").status_code == 404
@@ -0,0 +1,130 @@
+import time
+
+import pytest
+
+from app import create_app, get_context
+from conftest import ACCOUNT, app_config
+from ratelimit import ConcurrencyLimiter, RateLimiter
+from store import create_store
+
+
+class CountingStore:
+    """统计 lease_tokens 调用次数的存储代理"""
+
+    def __init__(self, store):
+        self.store = store
+        self.leases = 0
+
+    def lease_tokens(self, *args):
+        self.leases += 1
+        return self.store.lease_tokens(*args)
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def store(request, tmp_path):
+    store = create_store(request.param, path=str(tmp_path / "payment.db"))
+    yield store
+    store.close()
+
+
+def test_burst_is_enforced(store):
+    limiter = RateLimiter(store, rate=0.001, burst=3, lease=1)
+    assert [limiter.acquire("ip:1") for _ in range(3)] == [0, 0, 0]
+    assert limiter.acquire("ip:1") > 0
+    assert (limiter.allowed, limiter.rejected) == (3, 1)
+
+
+def test_keys_are_limited_separately(store):
+    limiter = RateLimiter(store, rate=0.001, burst=1, lease=1)
+    assert limiter.acquire("ip:1") == 0
+    assert limiter.acquire("ip:1") > 0
+    assert limiter.acquire("ip:2") == 0
+
+
+def test_tokens_refill(store):
+    limiter = RateLimiter(store, rate=100, burst=1, lease=1)
+    assert limiter.acquire("ip:1") == 0
+    retry_after = limiter.acquire("ip:1")
+    assert 0 < retry_after <= 0.011
+    time.sleep(retry_after + 0.01)
+    assert limiter.acquire("ip:1") == 0
+
+
+def test_lease_and_rejection_are_served_locally(store):
+    counting = CountingStore(store)
+    limiter = RateLimiter(counting, rate=0.001, burst=5, lease=5)
+    for _ in range(5):
+        assert limiter.acquire("ip:1") == 0
+    assert counting.leases == 1
+    for _ in range(10):
+        assert limiter.acquire("ip:1") > 0
+    assert counting.leases == 2  # 首次拒绝访问存储，之后在本地拒绝
+
+
+def test_bucket_is_shared_between_workers(store):
+    first = RateLimiter(store, rate=0.001, burst=4, lease=2)
+    second = RateLimiter(store, rate=0.001, burst=4, lease=2)
+    # 每个 worker 各租走 2 个令牌后桶已空，两边都被拒绝
+    assert [limiter.acquire("account:1") for limiter in (first, first, second, second)] == [0, 0, 0, 0]
+    assert first.acquire("account:1") > 0
+    assert second.acquire("account:1") > 0
+
+
+def test_concurrency_limiter():
+    limiter = ConcurrencyLimiter(2)
+    assert limiter.try_acquire() and limiter.try_acquire()
+    assert not limiter.try_acquire()
+    assert (limiter.inflight, limiter.rejected) == (2, 1)
+    limiter.release()
+    assert limiter.try_acquire()
+
+
+def test_concurrency_limiter_without_limit():
+    limiter = ConcurrencyLimiter(0)
+    assert all(limiter.try_acquire() for _ in range(100))
+
+
+@pytest.fixture
+def limited_client(tmp_path):
+    flask_app = create_app(app_config(
+        tmp_path, RATE_LIMIT_ENABLED=True, RATE_LIMIT_LEASE=1,
+        RATE_LIMIT_ACCOUNT_RATE=0.001, RATE_LIMIT_ACCOUNT_BURST=2,
+        RATE_LIMIT_IP_RATE=0.001, RATE_LIMIT_IP_BURST=4,
+        ADMISSION_MAX_INFLIGHT=1))
+    yield flask_app.test_client()
+    get_context(flask_app).close()
+
+
+def place(client, account=ACCOUNT):
+    return client.post("/api/place_order", json={"account": account, "amount": 1})
+
+
+def test_account_rate_limit(limited_client):
+    assert [place(limited_client).status_code for _ in range(2)] == [200, 200]
+    response = place(limited_client)
+    assert response.status_code == 429
+    assert int(response.headers["Retry-After"]) >= 1
+    assert place(limited_client, "13512345678").status_code == 200
+
+
+def test_ip_rate_limit(limited_client):
+    accounts = ["13812345678", "13812345678", "13512345678", "13512345678"]
+    assert [place(limited_client, account).status_code for account in accounts] == [200, 200, 200, 200]
+    assert place(limited_client, "13612345678").status_code == 429
+    # 其他客户端IP不受影响
+    response = limited_client.post("/api/place_order", json={"account": "13612345678", "amount": 1},
+                                   environ_base={"REMOTE_ADDR": "10.0.0.2"})
+    assert response.status_code == 200
+
+
+def test_admission_control_rejects_over_inflight_limit(limited_client):
+    admission = get_context(limited_client.application).admission
+    assert admission.try_acquire()  # 占满在途请求数
+    try:
+        response = place(limited_client)
+        assert response.status_code == 429
+        assert response.get_json()["msg"] == "服务繁忙，请稍后重试"
+    finally:
+        admission.release()
+    assert place(limited_client).status_code == 200
+    assert admission.inflight == 0
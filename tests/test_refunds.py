@@ -0,0 +1,183 @@
+import time
+
+import pytest
+
+from admin.payment_gateway import PaymentStatus
+from admin.signing import sign_callback
+from app import create_app, get_context
+from conftest import ACCOUNT, app_config
+
+
+def refund(client, order_id, headers):
+    return client.post("/api/refund", json={"order_id": order_id}, headers=headers)
+
+
+def callback(client, ctx, order_id):
+    params = sign_callback({"order_id": order_id, "status": "paid"}, ctx.config["API_SECRET"])
+    return client.post("/api/payment_callback", json=params)
+
+
+@pytest.mark.parametrize("headers", [{}, {"X-Admin-Token": "wrong"}])
+def test_refund_requires_admin_token(client, ctx, paid_order, headers):
+    response = refund(client, paid_order, headers)
+    assert response.status_code == 403
+    batch = client.post("/api/refunds:batch", json={"order_ids": [paid_order]}, headers=headers)
+    assert batch.status_code == 403
+    assert client.get("/api/refund_jobs/job-1", headers=headers).status_code == 403
+    assert ctx.store.get_order(paid_order)["status"] == "paid"
+
+
+def test_refund_is_disabled_without_admin_token(tmp_path):
+    flask_app = create_app(app_config(tmp_path, ADMIN_TOKEN=""))
+    try:
+        response = flask_app.test_client().post("/api/refund", json={"order_id": "order-1"},
+                                                headers={"X-Admin-Token": ""})
+        assert response.status_code == 403
+    finally:
+        get_context(flask_app).close()
+
+
+def test_refund_paid_order_returns_money(client, ctx, paid_order, admin_headers):
+    response = refund(client, paid_order, admin_headers)
+    assert response.status_code == 200
+    assert response.get_json()["refund_id"] == f"refund-{paid_order}"
+    assert ctx.store.get_order(paid_order)["status"] == "refunded"
+    assert ctx.ledger.balance_cents(ACCOUNT) == 10000
+
+
+def test_refund_is_repeatable(client, ctx, paid_order, admin_headers):
+    refund(client, paid_order, admin_headers)
+    response = refund(client, paid_order, admin_headers)
+    assert response.get_json()["msg"] == "Already refunded"
+    assert ctx.ledger.balance_cents(ACCOUNT) == 10000
+
+
+def test_refunded_order_cannot_be_paid_again(client, ctx, paid_order, admin_headers):
+    refund(client, paid_order, admin_headers)
+    response = client.post("/api/pay", json={"order_id": paid_order})
+    assert response.status_code == 400
+    assert response.get_json()["msg"] == "订单状态不允许支付"
+    assert ctx.store.get_order(paid_order)["status"] == "refunded"
+    assert ctx.ledger.balance_cents(ACCOUNT) == 10000
+
+
+def test_late_duplicate_settle_keeps_refunded_status(client, ctx, paid_order, admin_headers):
+    # 与首次支付并发的重复支付在退款完成后才结算：账本去重，订单状态不被改回 paid
+    refund(client, paid_order, admin_headers)
+    order = ctx.store.get_order(paid_order)
+    body, status_code = ctx.payments.settle(paid_order, order, {
+        "status": PaymentStatus.PAID.value, "transaction_id": "txn_late"})
+    assert (status_code, body["msg"]) == (200, "Already processed")
+    assert ctx.store.get_order(paid_order)["status"] == "refunded"
+    assert ctx.ledger.balance_cents(ACCOUNT) == 10000
+
+
+def test_refund_pending_order_is_rejected(client, place_order, admin_headers):
+    response = refund(client, place_order(10), admin_headers)
+    assert response.status_code == 400
+    assert response.get_json()["msg"] == "订单状态不允许退款"
+
+
+def test_refund_recharged_order_reverses_credit(client, ctx, place_order, admin_headers):
+    order_id = place_order(10)
+    assert callback(client, ctx, order_id).get_json()["msg"] == "Recharge succeeded"
+    assert ctx.ledger.balance_cents(ACCOUNT) == 11000
+
+    response = refund(client, order_id, admin_headers)
+    assert response.status_code == 200
+    assert ctx.store.get_order(order_id)["status"] == "refunded"
+    assert ctx.ledger.balance_cents(ACCOUNT) == 10000
+
+
+def test_refund_recharged_order_without_balance_is_rolled_back(client, ctx, place_order, admin_headers):
+    order_id = place_order(10)
+    callback(client, ctx, order_id)
+    ctx.ledger.debit(ACCOUNT, 10500, "payment", "spent")
+
+    response = refund(client, order_id, admin_headers)
+    assert response.status_code == 400
+    assert ctx.store.get_order(order_id)["status"] == "recharged"
+    assert ctx.ledger.balance_cents(ACCOUNT) == 500
+
+
+def test_refund_resumes_after_gateway_failure(client, ctx, paid_order, admin_headers, monkeypatch):
+    gateway_refund = ctx.payment_gateway.refund
+    monkeypatch.setattr(ctx.payment_gateway, "refund", lambda order_id, amount: {"status": "pending"})
+    assert refund(client, paid_order, admin_headers).status_code == 502
+    assert ctx.store.get_order(paid_order)["status"] == "refunding"
+
+    monkeypatch.setattr(ctx.payment_gateway, "refund", gateway_refund)
+    assert refund(client, paid_order, admin_headers).status_code == 200
+    assert ctx.store.get_order(paid_order)["status"] == "refunded"
+    assert ctx.ledger.balance_cents(ACCOUNT) == 10000
+
+
+def test_batch_refund_job(client, ctx, place_order, paid_order, admin_headers):
+    pending = place_order(5)
+    response = client.post("/api/refunds:batch", json={"order_ids": [paid_order, pending, paid_order]},
+                           headers=admin_headers)
+    assert response.status_code == 202
+    job_id = response.get_json()["job_id"]
+    assert response.get_json()["total"] == 2
+
+    deadline = time.monotonic() + 10
+    while True:
+        job = client.get(f"/api/refund_jobs/{job_id}", headers=admin_headers).get_json()
+        if job["status"] != "running" or time.monotonic() > deadline:
+            break
+        time.sleep(0.02)
+    assert job["counts"] == {"done": 1, "failed": 1}
+    assert job["failures"][0]["order_id"] == pending
+    assert ctx.store.get_order(paid_order)["status"] == "refunded"
+
+
+def test_callback_after_refund_is_already_processed(client, ctx, paid_order, admin_headers):
+    refund(client, paid_order, admin_headers)
+    response = callback(client, ctx, paid_order)
+    assert (response.status_code, response.get_json()["msg"]) == (200, "Already processed")
+    assert ctx.store.get_order(paid_order)["status"] == "refunded"
+    assert ctx.ledger.balance_cents(ACCOUNT) == 10000
+
+
+def test_callback_after_recharge_refund_does_not_credit_again(client, ctx, place_order, admin_headers):
+    order_id = place_order(10)
+    callback(client, ctx, order_id)
+    refund(client, order_id, admin_headers)
+    assert callback(client, ctx, order_id).get_json()["msg"] == "Already processed"
+    ctx.callbacks.handle_queued({"order_id": order_id, "received_time": time.time()})
+    assert ctx.store.get_order(order_id)["status"] == "refunded"
+    assert ctx.ledger.balance_cents(ACCOUNT) == 10000
+
+
+@pytest.mark.parametrize("status", ["failed", "expired", "refunding"])
+def test_callback_for_non_pending_order_is_already_processed(client, ctx, place_order, status):
+    order_id = place_order(10)
+    assert ctx.orders.transition(order_id, ("pending",), status)
+    assert callback(client, ctx, order_id).get_json()["msg"] == "Already processed"
+    ctx.callbacks.handle_queued({"order_id": order_id, "received_time": time.time()})
+    assert ctx.store.get_order(order_id)["status"] == status
+    assert ctx.ledger.balance_cents(ACCOUNT) == 10000
+
+
+def test_reconcile_recovers_expired_order(ctx, place_order):
+    order_id = place_order(10)
+    ctx.orders.expire_order(order_id)
+    ctx.callbacks.handle_queued({"order_id": order_id, "received_time": time.time(), "source": "reconcile"})
+    assert ctx.store.get_order(order_id)["status"] == "recharged"
+    assert ctx.ledger.balance_cents(ACCOUNT) == 11000
+
+
+def test_failed_credit_restores_pending_status(client, ctx, place_order, monkeypatch):
+    order_id = place_order(10)
+
+    def broken_credit(*args, **kwargs):
+        raise RuntimeError("ledger unavailable")
+
+    monkeypatch.setattr(ctx.ledger, "credit", broken_credit)
+    with pytest.raises(RuntimeError):
+        ctx.recharges.recharge(ACCOUNT, 10, order_id)
+    assert ctx.store.get_order(order_id)["status"] == "pending"
+
+    monkeypatch.undo()
+    assert callback(client, ctx, order_id).get_json()["msg"] == "Recharge succeeded"
+    assert ctx.ledger.balance_cents(ACCOUNT) == 11000
@@ -0,0 +1,140 @@
+import time
+
+import pytest
+
+from admin.signing import (EXPIRED, INVALID, REPLAYED, VALID, CallbackVerifier, ReplayCache, StoreReplayCache,
+                           canonicalize, sign, sign_callback)
+from conftest import ACCOUNT
+from store import create_store
+
+SECRET = "test-secret"
+
+
+@pytest.fixture
+def verifier():
+    return CallbackVerifier(SECRET, max_skew=300)
+
+
+def test_canonicalize_sorts_keys_and_skips_empty_values():
+    params = {"b": 2, "a": "x", "signature": "s", "empty": "", "none": None,
+              "flag": True, "extra": {"z": 1, "y": [1, 2]}}
+    assert canonicalize(params) == b'a=x&b=2&extra={"y":[1,2],"z":1}&flag=true'
+
+
+def test_signed_callback_is_valid(verifier):
+    params = sign_callback({"order_id": "order-1", "status": "paid"}, SECRET)
+    assert params["signature"] == sign(params, SECRET)
+    assert verifier.verify(params) == VALID
+
+
+def test_tampered_callback_is_invalid(verifier):
+    params = sign_callback({"order_id": "order-1", "amount": "10.00"}, SECRET)
+    assert verifier.verify(dict(params, amount="1000.00")) == INVALID
+
+
+@pytest.mark.parametrize("signature", [None, "", "0" * 64, 123])
+def test_missing_or_wrong_signature_is_invalid(verifier, signature):
+    params = sign_callback({"order_id": "order-1"}, SECRET)
+    params["signature"] = signature
+    assert verifier.verify(params) == INVALID
+
+
+def test_other_secret_is_invalid(verifier):
+    assert verifier.verify(sign_callback({"order_id": "order-1"}, "other-secret")) == INVALID
+
+
+@pytest.mark.parametrize("offset", [-301, 301])
+def test_timestamp_outside_window_is_expired(verifier, offset):
+    params = sign_callback({"order_id": "order-1"}, SECRET, timestamp=time.time() + offset)
+    assert verifier.verify(params) == EXPIRED
+
+
+def test_missing_timestamp_is_expired(verifier):
+    params = {"order_id": "order-1", "nonce": "n1"}
+    params["signature"] = sign(params, SECRET)
+    assert verifier.verify(params) == EXPIRED
+
+
+def test_replayed_nonce_is_detected(verifier):
+    params = sign_callback({"order_id": "order-1"}, SECRET)
+    assert verifier.verify(params) == VALID
+    assert verifier.verify(dict(params)) == REPLAYED
+    # 同一订单的新投递(新 nonce)不受影响
+    assert verifier.verify(sign_callback({"order_id": "order-1"}, SECRET)) == VALID
+
+
+def test_replay_cache_expires_entries():
+    cache = ReplayCache(ttl=10)
+    assert cache.add("n1", now=0)
+    assert not cache.add("n1", now=5)
+    assert cache.add("n1", now=11)
+
+
+def test_replay_cache_is_bounded():
+    cache = ReplayCache(ttl=100, max_size=2)
+    for nonce in ("n1", "n2", "n3"):
+        assert cache.add(nonce, now=0)
+    assert len(cache) == 2
+    assert cache.add("n1", now=0)  # 最早的条目已被淘汰
+
+
+def test_released_nonce_can_be_verified_again(verifier):
+    params = sign_callback({"order_id": "order-1"}, SECRET)
+    assert verifier.verify(params) == VALID
+    verifier.release(params)
+    assert verifier.verify(dict(params)) == VALID
+    assert verifier.verify(dict(params)) == REPLAYED
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def store(request, tmp_path):
+    store = create_store(request.param, path=str(tmp_path / "payment.db"))
+    yield store
+    store.close()
+
+
+def test_store_replay_cache(store):
+    cache = StoreReplayCache(store, ttl=600)
+    assert cache.add("n1")
+    assert not cache.add("n1")
+    cache.discard("n1")
+    assert cache.add("n1")
+    assert StoreReplayCache(store, ttl=0).add("n2")
+    assert cache.add("n2")  # 已过期的 nonce 可以重新登记
+
+
+def test_store_replay_cache_is_shared_between_workers(tmp_path):
+    path = str(tmp_path / "payment.db")
+    first, second = create_store("sqlite", path=path), create_store("sqlite", path=path)
+    try:
+        params = sign_callback({"order_id": "order-1"}, SECRET)
+        assert CallbackVerifier(SECRET, replay_cache=StoreReplayCache(first)).verify(params) == VALID
+        assert CallbackVerifier(SECRET, replay_cache=StoreReplayCache(second)).verify(dict(params)) == REPLAYED
+    finally:
+        first.close()
+        second.close()
+
+
+def test_failed_callback_can_be_retried(client, ctx, place_order, monkeypatch):
+    order_id = place_order(10)
+    params = sign_callback({"order_id": order_id, "status": "paid"}, ctx.config["API_SECRET"])
+    recharge = ctx.recharges.recharge
+
+    def broken_recharge(*args, **kwargs):
+        raise RuntimeError("ledger unavailable")
+
+    monkeypatch.setattr(ctx.recharges, "recharge", broken_recharge)
+    assert client.post("/api/payment_callback", json=params).status_code == 500
+
+    # 网关以同一 nonce 重试，不会被当作重复投递
+    monkeypatch.setattr(ctx.recharges, "recharge", recharge)
+    response = client.post("/api/payment_callback", json=params)
+    assert response.get_json()["msg"] == "Recharge succeeded"
+    assert ctx.ledger.balance_cents(ACCOUNT) == 11000
+    assert client.post("/api/payment_callback", json=params).get_json()["msg"] == "Already processed"
+
+
+def test_unknown_order_callback_can_be_retried(client, ctx):
+    params = sign_callback({"order_id": "order-late", "status": "paid"}, ctx.config["API_SECRET"])
+    assert client.post("/api/payment_callback", json=params).status_code == 404
+    assert client.post("/api/payment_callback", json=params).status_code == 404
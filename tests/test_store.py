@@ -0,0 +1,141 @@
+import random
+
+import pytest
+
+from conftest import ACCOUNT
+from store import JournaledMemoryStore, MemoryStore, create_store
+
+ACCOUNTS = [f"acct-{number}" for number in range(5)]
+STATUSES = ["paid", "recharged", "refunded"]
+
+
+@pytest.fixture(scope="module")
+def stores(tmp_path_factory):
+    """写入相同订单的各存储后端，查询结果应完全一致"""
+    tmp_path = tmp_path_factory.mktemp("stores")
+    stores = [create_store("memory"), create_store("sqlite", path=str(tmp_path / "payment.db")),
+              JournaledMemoryStore(str(tmp_path / "journal"), fsync=False)]
+    rng = random.Random(1)
+    order_ids = [f"order-{number:03d}" for number in range(300)]
+    updates = {order_id: (rng.choice(STATUSES), rng.uniform(1000, 3000))
+               for order_id in rng.sample(order_ids, 200)}
+    for store in stores:
+        for number, order_id in enumerate(order_ids):
+            store.insert_order(order_id, {"account": ACCOUNTS[number % len(ACCOUNTS)], "amount": 1.0,
+                                          "status": "pending", "create_time": 1000.0 + number,
+                                          "pay_time": None, "recharge_time": None})
+        for order_id, (status, pay_time) in updates.items():
+            store.update_order(order_id, status=status, pay_time=pay_time)
+        store.archive_orders(order_ids[:20])
+    yield stores
+    for store in stores:
+        store.close()
+
+
+def expected(store, account, status, time_field, start, end, descending):
+    """不走索引的逐条过滤结果"""
+    orders = [dict(order, order_id=order_id) for order_id, order in store.orders.items()
+              if (account is None or order["account"] == account)
+              and (status is None or order["status"] == status)
+              and order[time_field] is not None
+              and (start is None or order[time_field] >= start)
+              and (end is None or order[time_field] < end)]
+    orders.sort(key=lambda order: (order[time_field], order["order_id"]), reverse=descending)
+    return [order["order_id"] for order in orders]
+
+
+@pytest.mark.parametrize("time_field", ["create_time", "pay_time"])
+@pytest.mark.parametrize("account, status", [(None, None), ("acct-1", None), (None, "paid"),
+                                             ("acct-3", "refunded"), (None, "pending")])
+@pytest.mark.parametrize("start, end", [(None, None), (1100.0, 2500.0)])
+@pytest.mark.parametrize("descending", [True, False])
+def test_query_orders_matches_full_scan(stores, time_field, account, status, start, end, descending):
+    want = expected(stores[0], account, status, time_field, start, end, descending)
+    for store in stores:
+        orders = store.query_orders(account=account, status=status, time_field=time_field,
+                                    start=start, end=end, limit=1000, descending=descending)
+        assert [order["order_id"] for order in orders] == want
+
+
+@pytest.mark.parametrize("time_field", ["create_time", "pay_time"])
+def test_query_orders_cursor_pagination(stores, time_field):
+    for store in stores:
+        pages, after = [], None
+        while True:
+            page = store.query_orders(status="paid", time_field=time_field, after=after, limit=7)
+            pages.extend(order["order_id"] for order in page)
+            if len(page) < 7:
+                break
+            after = (page[-1][time_field], page[-1]["order_id"])
+        assert pages == expected(stores[0], None, "paid", time_field, None, None, True)
+
+
+def test_unknown_time_field_is_rejected(stores):
+    for store in stores:
+        with pytest.raises(ValueError):
+            store.query_orders(time_field="recharge_time")
+
+
+@pytest.fixture(params=["memory", "sqlite", "journal"])
+def store(request, tmp_path):
+    if request.param == "journal":
+        store = JournaledMemoryStore(str(tmp_path / "journal"), fsync=False)
+    else:
+        store = create_store(request.param, path=str(tmp_path / "payment.db"))
+    yield store
+    store.close()
+
+
+def test_archive_orders_filters_by_status(store):
+    for order_id, status in (("order-1", "paid"), ("order-2", "refunding"), ("order-3", "refunded")):
+        store.insert_order(order_id, {"account": "acct-1", "amount": 1.0, "status": status, "create_time": 1.0,
+                                      "pay_time": None, "recharge_time": None})
+    archived = store.archive_orders(["order-1", "order-2", "order-3", "order-4"], ("paid", "refunded"))
+    assert sorted(archived) == ["order-1", "order-3"]
+    assert store.get_order("order-2")["status"] == "refunding"
+    assert store.get_archived_order("order-2") is None
+    assert store.archive_orders(["order-2"], ()) == {}
+
+
+def test_release_ledger_entries(store):
+    for number in range(4):
+        store.apply_balance_delta("acct-1", 100, "recharge", f"order-{number}")
+    released = store.release_ledger_entries([("recharge", "order-0"), ("recharge", "order-1"),
+                                             ("recharge", "missing")])
+    changes = store.balance_changes(0)
+    assert [change[0] for change in changes] == [1, 2, 3, 4]
+    assert store.balance_changes(2) == changes[2:]
+    assert store.get_user("acct-1")["balance_cents"] == 400
+    if isinstance(store, MemoryStore):
+        assert released == 2
+        assert [entry["ref"] for entry in store.list_ledger_entries("acct-1")] == ["order-3", "order-2"]
+        # 释放过半后压缩账本，按序号查询仍从正确位置开始
+        assert store.release_ledger_entries([("recharge", "order-2")]) == 1
+        assert len(store.ledger) == 1
+        assert store.balance_changes(2) == [(4, "acct-1")]
+        assert not store.apply_balance_delta("acct-1", 100, "recharge", "order-5")["duplicate"]
+        assert store.balance_changes(4) == [(5, "acct-1")]
+    else:
+        assert released == 0
+        assert len(store.list_ledger_entries("acct-1")) == 4
+
+
+def test_insert_order_if_absent(store):
+    order = {"account": "acct-1", "amount": 1.0, "status": "refunding", "create_time": 1.0,
+             "pay_time": 2.0, "recharge_time": None}
+    assert store.insert_order_if_absent("order-1", order)
+    assert not store.insert_order_if_absent("order-1", dict(order, status="paid"))
+    assert store.get_order("order-1")["status"] == "refunding"
+
+
+def test_list_orders_requires_account_or_admin_token(client, place_order, admin_headers):
+    order_id = place_order(10)
+    response = client.get("/api/orders", query_string={"account": ACCOUNT})
+    assert [order["order_id"] for order in response.get_json()["orders"]] == [order_id]
+
+    for headers in ({}, {"X-Admin-Token": "wrong"}):
+        response = client.get("/api/orders", query_string={"status": "pending"}, headers=headers)
+        assert response.status_code == 403
+
+    response = client.get("/api/orders", query_string={"status": "pending"}, headers=admin_headers)
+    assert [order["order_id"] for order in response.get_json()["orders"]] == [order_id]
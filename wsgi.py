@@ -0,0 +1,11 @@
+"""WSGI 入口(生产部署)
+
+应用由工厂在 worker 进程内创建：gunicorn 以 preload_app=False 启动时，
+每个 worker fork 之后导入本模块，各自持有独立的存储连接池、网关连接池与后台线程，
+不会在进程间共享 fork 前创建的连接或锁。
+
+启动示例: gunicorn -c gunicorn.conf.py wsgi:application
+"""
+from app import create_app
+
+application = create_app()